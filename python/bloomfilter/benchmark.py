@@ -0,0 +1,179 @@
+"""Benchmarks for the bloom filter.
+
+Run from the repository root:
+
+$> python -m python.bloomfilter.benchmark [name ...]
+"""
+
+import math
+import sys
+import timeit
+
+import numpy as np
+
+import python.bloomfilter.mm3 as mmh3
+from python.bloomfilter.bloom import SCHEMES, BloomFilter
+from python.bloomfilter.counting import CountingBloomFilter
+
+
+def make_keys(count, prefix="key"):
+    return ["{}-{}".format(prefix, i) for i in range(count)]
+
+
+def run(name, func, count):
+    """Time a single call of func and report it as count operations."""
+    seconds = timeit.timeit(func, number=1)
+    print("  {:<24} {:>10.0f} ops/s".format(name, count / seconds))
+
+
+def bench_backend(items_count=100000, fp_prob=0.01):
+    """Compare the packed bit array with a list of ints."""
+    print("backend: {} items, fp_prob={}".format(items_count, fp_prob))
+    keys = make_keys(items_count)
+
+    for backend in ("list", "packed"):
+        bloomf = BloomFilter(items_count, fp_prob)
+        if backend == "list":
+            bloomf.bit_array = [0] * bloomf.size
+
+        print(
+            " {}: {} bits in {:.2f} MiB".format(
+                backend, bloomf.size, bloomf.memory_usage() / 2 ** 20
+            )
+        )
+        run("add", lambda: [bloomf.add(k) for k in keys], items_count)
+        run("check", lambda: [bloomf.check(k) for k in keys], items_count)
+
+
+def bench_batch(items_count=100000, fp_prob=0.01):
+    """Compare add_many/check_many with the per-item loop."""
+    print("batch: {} items, fp_prob={}".format(items_count, fp_prob))
+    keys = make_keys(items_count)
+
+    for scheme in SCHEMES:
+        print(" {}".format(scheme))
+        bloomf = BloomFilter(items_count, fp_prob, scheme=scheme)
+        run("add", lambda: [bloomf.add(k) for k in keys], items_count)
+        run("check", lambda: [bloomf.check(k) for k in keys], items_count)
+
+        bloomf = BloomFilter(items_count, fp_prob, scheme=scheme)
+        run("add_many", lambda: bloomf.add_many(keys), items_count)
+        run("check_many", lambda: bloomf.check_many(keys), items_count)
+
+
+def bench_scheme(items_count=100000, fp_prob=0.01):
+    """Compare the hash schemes used to derive bit positions."""
+    print("scheme: {} items, fp_prob={}".format(items_count, fp_prob))
+    keys = make_keys(items_count)
+
+    for scheme in SCHEMES:
+        bloomf = BloomFilter(items_count, fp_prob, scheme=scheme)
+        print(" {}: {} hash functions".format(scheme, bloomf.hash_count))
+        run("add", lambda: [bloomf.add(k) for k in keys], items_count)
+        run("check", lambda: [bloomf.check(k) for k in keys], items_count)
+
+
+def bench_hash(lengths=(8, 64, 512, 4096, 65536), total_bytes=2 ** 22):
+    """Compare the murmur3 implementations across key lengths."""
+    native = "native" if mmh3._native is not None else "no native module"
+    print("hash: MiB/s by key length ({})".format(native))
+    functions = [
+        ("py_hash", mmh3.py_hash),
+        ("py_hash128", mmh3.py_hash128),
+        ("hash", mmh3.hash),
+        ("hash128", mmh3.hash128),
+    ]
+
+    for length in lengths:
+        key = bytes(i & 0xFF for i in range(length))
+        number = max(1, total_bytes // length)
+        print(" {} bytes".format(length))
+        for name, func in functions:
+            seconds = timeit.timeit(lambda: func(key), number=number)
+            mib = length * number / seconds / 2 ** 20
+            print("  {:<24} {:>10.1f} MiB/s".format(name, mib))
+
+
+def bench_hash_array(keys_count=1000000, widths=(8, 16)):
+    """Compare hash_array/hash128_array with a loop over the scalar functions."""
+    print("hash_array: {} keys".format(keys_count))
+    rng = np.random.RandomState(0)
+    loop_count = min(keys_count, 100000)
+
+    for width in widths:
+        keys = rng.randint(0, 256, size=(keys_count, width)).astype(np.uint8)
+        rows = [bytes(key) for key in keys[:loop_count]]
+        print(" {} byte keys".format(width))
+        run("hash", lambda: [mmh3.hash(key) for key in rows], loop_count)
+        run("hash_array", lambda: mmh3.hash_array(keys), keys_count)
+        run("hash128", lambda: [mmh3.hash128(key) for key in rows], loop_count)
+        run("hash128_array", lambda: mmh3.hash128_array(keys), keys_count)
+
+
+def bench_counting(items_count=100000, fp_prob=0.01):
+    """Compare the counting filter with the plain filter."""
+    print("counting: {} items, fp_prob={}".format(items_count, fp_prob))
+    keys = make_keys(items_count)
+
+    for cls in (BloomFilter, CountingBloomFilter):
+        bloomf = cls(items_count, fp_prob)
+        print(" {}: {:.2f} MiB".format(cls.__name__, bloomf.memory_usage() / 2 ** 20))
+        run("add", lambda: [bloomf.add(k) for k in keys], items_count)
+        run("check", lambda: [bloomf.check(k) for k in keys], items_count)
+        if cls is CountingBloomFilter:
+            run("remove", lambda: [bloomf.remove(k) for k in keys], items_count)
+
+        bloomf = cls(items_count, fp_prob)
+        run("add_many", lambda: bloomf.add_many(keys), items_count)
+        run("check_many", lambda: bloomf.check_many(keys), items_count)
+
+
+def bench_latency(sizes=(10 ** 6, 10 ** 7, 10 ** 8), fp_prob=0.01, checks=100000):
+    """Compare check latency of the hash schemes as the filter grows.
+
+    probe only times the memory accesses of check_many, on precomputed bit
+    positions, which is where the blocked layout saves cache misses.
+    The filters are filled with at most a million items: the latency of
+    a lookup depends on the memory it touches, not on the fill level.
+    """
+    print("latency: ns per check, fp_prob={}".format(fp_prob))
+    keys = make_keys(checks, prefix="check")
+
+    def probe(bits, digests):
+        return ((bits[digests >> 3] >> (digests & 7).astype(np.uint8)) & 1).all(axis=0)
+
+    for size in sizes:
+        items_count = int(-size * math.log(2) ** 2 / math.log(fp_prob))
+        print(" {} bits{:>21}{:>14}{:>14}".format(size, "check", "check_many", "probe"))
+        for scheme in SCHEMES:
+            bloomf = BloomFilter(items_count, fp_prob, scheme=scheme)
+            bloomf.add_many(make_keys(min(items_count, 10 ** 6)))
+            bits = bloomf.get_bit_view()
+            digests = bloomf.get_digests(keys)
+
+            timings = [
+                timeit.timeit(lambda: [bloomf.check(k) for k in keys], number=1),
+                timeit.timeit(lambda: bloomf.check_many(keys), number=1),
+                timeit.timeit(lambda: probe(bits, digests), number=1),
+            ]
+            print(
+                "  {:<16}{:>14.0f}{:>14.0f}{:>14.1f}".format(
+                    scheme, *(seconds / checks * 1e9 for seconds in timings)
+                )
+            )
+
+
+BENCHMARKS = {
+    "backend": bench_backend,
+    "batch": bench_batch,
+    "scheme": bench_scheme,
+    "hash": bench_hash,
+    "hash_array": bench_hash_array,
+    "counting": bench_counting,
+    "latency": bench_latency,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,88 @@
+import sys
+
+import numpy as np
+
+# Number of bits set in every byte value
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Number of bytes counted at a time by BitArray.count
+COUNT_CHUNK = 1 << 20
+
+
+class BitArray(object):
+
+    """
+    Fixed size array of bits, packed eight to a byte
+    """
+
+    def __init__(self, size, buffer=None):
+        """
+        size : int
+            Number of bits in the array
+        buffer : bytearray, memoryview or mmap, optional
+            Writable buffer of at least get_nbytes(size) bytes to store
+            the bits in. A zeroed bytearray is allocated if not given.
+        """
+        self.size = size
+
+        if buffer is None:
+            buffer = bytearray(self.get_nbytes(size))
+        elif len(buffer) < self.get_nbytes(size):
+            raise ValueError("buffer too small for {} bits".format(size))
+
+        self.bytes = buffer
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        """
+        Return the bit at index (0 or 1). The index is not bounds checked.
+        """
+        return (self.bytes[index >> 3] >> (index & 7)) & 1
+
+    def __setitem__(self, index, value):
+        """
+        Set (or clear, if value is falsy) the bit at index
+        """
+        if value:
+            self.bytes[index >> 3] |= 1 << (index & 7)
+        else:
+            self.bytes[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self.bytes)
+
+    def count(self):
+        """
+        Return the number of bits set
+        """
+        # the buffer may be longer than the array, and the bits of its
+        # last byte past size are not part of it
+        data = np.frombuffer(self.bytes, dtype=np.uint8, count=(self.size + 7) // 8)
+        total = 0
+        for start in range(0, len(data), COUNT_CHUNK):
+            chunk = data[start : start + COUNT_CHUNK]
+            if hasattr(np, "bitwise_count"):
+                total += int(np.bitwise_count(chunk).sum(dtype=np.int64))
+            else:
+                total += int(POPCOUNT_TABLE[chunk].sum(dtype=np.int64))
+        if self.size & 7:
+            total -= int(POPCOUNT_TABLE[data[-1] >> (self.size & 7)])
+        return total
+
+    @property
+    def nbytes(self):
+        """
+        Number of bytes used to store the bits
+        """
+        return len(self.bytes)
+
+    @classmethod
+    def get_nbytes(self, size):
+        """
+        Return the number of bytes needed to store size bits, rounded up
+        to a whole number of 64 bit words so the buffer can be viewed as
+        an array of uint64.
+        """
+        return ((size + 63) // 64) * 8
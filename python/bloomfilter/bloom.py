@@ -1,58 +1,156 @@
 import math
+import mmap
+import multiprocessing
+import os
+import queue
+import struct
+import sys
+import weakref
+from collections import Counter, defaultdict
+from itertools import islice
+
+import numpy as np
 
 import python.bloomfilter.mm3 as mmh3
+from python.bloomfilter.bitarray import BitArray
+
+# Hash schemes, see BaseBloomFilter.__init__
+SEEDED = "seeded"
+DOUBLE_HASHING = "double"
+BLOCKED = "blocked"
+SCHEMES = (SEEDED, DOUBLE_HASHING, BLOCKED)
+
+# Bits per block of the BLOCKED scheme: one 64 byte cache line
+BLOCK_BITS = 512
+# Offsets in a block are the top 9 bits of successive states of a 64 bit
+# linear congruential generator (Knuth's MMIX constants) seeded with h2
+LCG_MULTIPLIER = 0x5851F42D4C957F2D
+LCG_INCREMENT = 0x14057B7EF767814F
+
+MASK_64 = 0xFFFFFFFFFFFFFFFF
+
+# File format, see BloomFilter.save: a fixed size header followed by the
+# packed bit array. The header is a multiple of 8 bytes so that the bits
+# can be viewed as uint64 words in a memory map.
+FILE_MAGIC = b"BLMF"
+FILE_VERSION = 1
+# magic, version, scheme code, padding, size, hash_count, fp_prob
+HEADER = struct.Struct("<4sHBxQQd")
+SCHEME_CODES = {SEEDED: 0, DOUBLE_HASHING: 1, BLOCKED: 2}
 
+# mmap access for each BloomFilter.open mode
+OPEN_MODES = {"r": mmap.ACCESS_READ, "r+": mmap.ACCESS_WRITE, "c": mmap.ACCESS_COPY}
+# Error of close while numpy views of the bit array are alive
+VIEWS_IN_USE = "arrays from get_bit_view or get_word_view still use the filter"
 
-class BloomFilter(object):
+# Seconds build_parallel waits on its queues before checking its workers
+WORKER_POLL_INTERVAL = 0.1
+
+
+class BaseBloomFilter(object):
 
     """
-    Class for Bloom filter, using murmur3 hash function
+    Sizing and hashing shared by the Bloom filter variants: derives the
+    positions of an item in an array of size slots, using murmur3
     """
 
-    def __init__(self, items_count, fp_prob):
+    def __init__(self, items_count, fp_prob, scheme=SEEDED):
         """
         items_count : int
             Number of items expected to be stored in bloom filter
         fp_prob : float
             False Positive probability in decimal
+        scheme : str
+            How the bit positions of an item are derived:
+            SEEDED hashes the item once per hash function, with the index
+            of the function as seed. DOUBLE_HASHING hashes it once with
+            hash128 and derives the k positions as h1 + i * h2.
+            BLOCKED also hashes it once with hash128, picks a block of
+            BLOCK_BITS bits (a cache line) with h1 and derives the k bits
+            in that block from h2, so a lookup touches a single cache
+            line instead of k. The block loads are uneven, which raises
+            the false positive rate: about 1.1x fp_prob at 1%, 1.5x at
+            0.1% and 3.5x at 0.01%.
         """
+        if scheme not in SCHEMES:
+            raise ValueError("unknown hash scheme {!r}".format(scheme))
+
         # False posible probability in decimal
         self.fp_prob = fp_prob
 
+        # How bit positions are derived from an item
+        self.scheme = scheme
+
         # Size of bit array to use
         self.size = self.get_size(items_count, fp_prob)
 
         # number of hash functions to use
         self.hash_count = self.get_hash_count(self.size, items_count)
 
-        # self.bit_array = BitVector(size=self.size, intVal=0)
-        self.bit_array = [0] * self.size
+        if scheme == BLOCKED:
+            # round up to whole blocks
+            self.size = -(-self.size // BLOCK_BITS) * BLOCK_BITS
 
-    def add(self, item):
+    def iter_digests(self, item):
         """
-        Add an item in the filter
+        Yield the hash_count bit positions of an item
         """
-        digests = []
-        for i in range(self.hash_count):
+        if self.scheme == DOUBLE_HASHING:
+            # one 128bit hash, split in two 64bit halves
+            hash_128 = mmh3.hash128(item)
+            h1 = hash_128 & MASK_64
+            h2 = hash_128 >> 64
+            for i in range(self.hash_count):
+                yield ((h1 + i * h2) & MASK_64) % self.size
+        elif self.scheme == BLOCKED:
+            hash_128 = mmh3.hash128(item)
+            start = (hash_128 & MASK_64) % (self.size // BLOCK_BITS) * BLOCK_BITS
+            state = hash_128 >> 64
+            for i in range(self.hash_count):
+                state = (state * LCG_MULTIPLIER + LCG_INCREMENT) & MASK_64
+                yield start + (state >> 55)
+        else:
+            for i in range(self.hash_count):
+                # create digest for given item.
+                # i work as seed to mmh3.hash() function
+                # With different seed, digest created is different
+                yield mmh3.hash(item, i) % self.size
 
-            # create digest for given item.
-            # i work as seed to mmh3.hash() function
-            # With different seed, digest created is different
-            digest = mmh3.hash(item, i) % self.size
-            digests.append(digest)
-            self.bit_array[digest] = 1  # set the bit True in bit_array
-
-    def check(self, item):
+    def get_digests(self, items):
         """
-        Check for existence of an item in filter
-        if any of bit is False then, it's not present in filter
-        else there is probability that it exist
+        Return the bit positions of a batch of items, as an int64 array
+        of shape (hash_count, number of items)
+
+        Items are grouped by encoded length so that every group can be
+        hashed at once by mmh3.hash_array or mmh3.hash128_array.
         """
-        for i in range(self.hash_count):
-            digest = mmh3.hash(item, i) % self.size
-            if self.bit_array[digest] == 0:
-                return False
-        return True
+        keys = [mmh3.xencode(item) for item in items]
+        digests = np.empty((self.hash_count, len(keys)), dtype=np.int64)
+
+        for rows, block in group_by_length(keys):
+            if self.scheme == DOUBLE_HASHING:
+                hashes = mmh3.hash128_array(block)
+                h1 = hashes[:, 0]
+                h2 = hashes[:, 1]
+                steps = np.arange(self.hash_count, dtype=np.uint64)[:, np.newaxis]
+                with np.errstate(over="ignore"):
+                    digest = (h1 + steps * h2) % np.uint64(self.size)
+                digests[:, rows] = digest
+            elif self.scheme == BLOCKED:
+                hashes = mmh3.hash128_array(block)
+                nblocks = np.uint64(self.size // BLOCK_BITS)
+                start = hashes[:, 0] % nblocks * np.uint64(BLOCK_BITS)
+                state = hashes[:, 1]
+                for i in range(self.hash_count):
+                    with np.errstate(over="ignore"):
+                        state = state * np.uint64(LCG_MULTIPLIER)
+                        state += np.uint64(LCG_INCREMENT)
+                    digests[i, rows] = start + (state >> np.uint64(55))
+            else:
+                for i in range(self.hash_count):
+                    digest = mmh3.hash_array(block, i).astype(np.int64) % self.size
+                    digests[i, rows] = digest
+        return digests
 
     @classmethod
     def get_size(self, n, p):
@@ -82,3 +180,442 @@ class BloomFilter(object):
         """
         k = (m / n) * math.log(2)
         return int(k)
+
+
+class BloomFilter(BaseBloomFilter):
+
+    """
+    Class for Bloom filter, using murmur3 hash function
+    """
+
+    # Counter of add and check calls and of check hits, see enable_stats()
+    stats = None
+
+    def __init__(self, items_count, fp_prob, scheme=SEEDED):
+        """
+        See BaseBloomFilter
+        """
+        super(BloomFilter, self).__init__(items_count, fp_prob, scheme)
+
+        # bits are packed eight to a byte
+        self.bit_array = BitArray(self.size)
+
+        # memory map backing the bit array, see open(), and the numpy views
+        # of the bit array handed out while it is mapped, see close()
+        self.mmap = None
+        self.views = None
+
+    def add(self, item):
+        """
+        Add an item in the filter
+        """
+        for digest in self.iter_digests(item):
+            self.bit_array[digest] = 1  # set the bit True in bit_array
+
+        if self.stats is not None:
+            self.stats["add"] += 1
+
+    def check(self, item):
+        """
+        Check for existence of an item in filter
+        if any of bit is False then, it's not present in filter
+        else there is probability that it exist
+        """
+        for digest in self.iter_digests(item):
+            if self.bit_array[digest] == 0:
+                if self.stats is not None:
+                    self.stats["check"] += 1
+                return False
+
+        if self.stats is not None:
+            self.stats["check"] += 1
+            self.stats["hit"] += 1
+        return True
+
+    def add_many(self, items):
+        """
+        Add all the items of an iterable in the filter
+        """
+        digests = self.get_digests(items)
+        bits = self.get_bit_view()
+        masks = np.left_shift(1, digests & 7).astype(np.uint8)
+        np.bitwise_or.at(bits, digests >> 3, masks)
+
+        if self.stats is not None:
+            self.stats["add"] += digests.shape[1]
+
+    def check_many(self, items):
+        """
+        Check for existence of all the items of an iterable in filter
+        Return a boolean array, in the order of the items
+        """
+        digests = self.get_digests(items)
+        bits = self.get_bit_view()
+        found = (bits[digests >> 3] >> (digests & 7).astype(np.uint8)) & 1
+        found = found.all(axis=0)
+
+        if self.stats is not None:
+            self.stats["check"] += len(found)
+            self.stats["hit"] += int(found.sum())
+        return found
+
+    def count_bits(self):
+        """
+        Return the number of bits set
+        """
+        return self.bit_array.count()
+
+    def fill_ratio(self):
+        """
+        Return the fraction of bits set
+        """
+        return self.count_bits() / self.size
+
+    def approx_len(self):
+        """
+        Estimate the number of distinct items added from the number of
+        bits set (X) using Swamidass & Baldi formula
+        n = -(m / k) * ln(1 - X / m)
+        Return inf once every bit is set
+        """
+        fill_ratio = self.fill_ratio()
+        if fill_ratio >= 1:
+            return math.inf
+        return -(self.size / self.hash_count) * math.log(1 - fill_ratio)
+
+    def current_fp_rate(self):
+        """
+        Estimate the current false positive probability: the probability
+        that the k bits of an absent item are all set, fill_ratio ** k
+        (a bit more with the BLOCKED scheme)
+        Unlike fp_prob, it keeps growing once more than items_count items
+        were added.
+        """
+        return self.fill_ratio() ** self.hash_count
+
+    def enable_stats(self):
+        """
+        Start counting add and check calls and check hits in self.stats
+        """
+        self.stats = Counter()
+
+    def get_health(self):
+        """
+        Return a dict of metrics to export, to detect a saturated filter
+        """
+        health = {
+            "size": self.size,
+            "hash_count": self.hash_count,
+            "fp_prob": self.fp_prob,
+            "fill_ratio": self.fill_ratio(),
+            "approx_len": self.approx_len(),
+            "current_fp_rate": self.current_fp_rate(),
+        }
+        if self.stats is not None:
+            health.update(self.stats)
+            health["hit_rate"] = self.stats["hit"] / max(self.stats["check"], 1)
+        return health
+
+    def get_bit_view(self):
+        """
+        Return the bit array as a numpy array of bytes, sharing its memory
+        """
+        return self.track_view(np.frombuffer(self.bit_array.bytes, dtype=np.uint8))
+
+    def get_word_view(self):
+        """
+        Return the bit array as a numpy array of uint64, sharing its memory
+        """
+        return self.track_view(np.frombuffer(self.bit_array.bytes, dtype=np.uint64))
+
+    def track_view(self, array):
+        if self.views is not None:
+            self.views[id(array)] = array
+        return array
+
+    def copy(self):
+        """
+        Return an in-memory copy of the filter
+        """
+        bloomf = BloomFilter.__new__(BloomFilter)
+        bloomf.fp_prob = self.fp_prob
+        bloomf.scheme = self.scheme
+        bloomf.size = self.size
+        bloomf.hash_count = self.hash_count
+        bloomf.bit_array = BitArray(self.size, bytearray(self.bit_array.bytes))
+        bloomf.mmap = None
+        bloomf.views = None
+        return bloomf
+
+    def union(self, other):
+        """
+        Return a new filter holding the items of both filters
+        """
+        bloomf = self.copy()
+        bloomf |= other
+        return bloomf
+
+    def intersection(self, other):
+        """
+        Return a new filter holding the items common to both filters
+
+        Its false positive probability can be higher than the one of a
+        filter built from the common items only.
+        """
+        bloomf = self.copy()
+        bloomf &= other
+        return bloomf
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __ior__(self, other):
+        self.check_compatible(other)
+        words = self.get_word_view()
+        np.bitwise_or(words, other.get_word_view(), out=words)
+        return self
+
+    def __iand__(self, other):
+        self.check_compatible(other)
+        words = self.get_word_view()
+        np.bitwise_and(words, other.get_word_view(), out=words)
+        return self
+
+    def check_compatible(self, other):
+        """
+        Raise ValueError unless other derives the same bit positions
+        """
+        if (self.size, self.hash_count, self.scheme) != (
+            other.size,
+            other.hash_count,
+            other.scheme,
+        ):
+            raise ValueError(
+                "incompatible filters: size, hash_count and scheme must match"
+            )
+
+    def save(self, path):
+        """
+        Write the filter to a file: a small versioned header (size,
+        hash_count, fp_prob and hash scheme) followed by the bit array
+        """
+        with open(path, "wb") as f:
+            f.write(self.pack_header())
+            f.write(self.bit_array.bytes)
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """
+        Open a filter written by save() as a memory map, without reading
+        the bit array into memory. Processes opening the same file in
+        read-only mode share a single copy of it in the page cache.
+
+        mode : str
+            "r" to open read-only, "r+" to write added items through to
+            the file, "c" to keep added items in memory (copy on write)
+        """
+        if mode not in OPEN_MODES:
+            raise ValueError("unknown mode {!r}".format(mode))
+
+        with open(path, "rb" if mode == "r" else "r+b") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=OPEN_MODES[mode])
+
+        view = memoryview(mapped)
+        try:
+            bloomf = cls.from_buffer(view)
+        except ValueError:
+            view.release()
+            mapped.close()
+            raise
+        bloomf.mmap = mapped
+        bloomf.views = weakref.WeakValueDictionary()
+        return bloomf
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """
+        Return a filter whose header and bits live in buffer, in the
+        format written by save()
+        """
+        if len(buffer) < HEADER.size:
+            raise ValueError("not a bloom filter: file too short")
+        magic, version, code, size, hash_count, fp_prob = HEADER.unpack_from(buffer)
+        if magic != FILE_MAGIC:
+            raise ValueError("not a bloom filter: bad magic {!r}".format(magic))
+        if version != FILE_VERSION:
+            raise ValueError("unsupported bloom filter version {}".format(version))
+        schemes = {code: scheme for scheme, code in SCHEME_CODES.items()}
+        if code not in schemes:
+            raise ValueError("unknown hash scheme code {}".format(code))
+        if len(buffer) < HEADER.size + BitArray.get_nbytes(size):
+            raise ValueError("truncated bloom filter")
+
+        bloomf = cls.__new__(cls)
+        bloomf.fp_prob = fp_prob
+        bloomf.scheme = schemes[code]
+        bloomf.size = size
+        bloomf.hash_count = hash_count
+        bloomf.bit_array = BitArray(size, buffer[HEADER.size :])
+        bloomf.mmap = None
+        bloomf.views = None
+        return bloomf
+
+    def pack_header(self):
+        """
+        Return the file header of the filter, see save()
+        """
+        return HEADER.pack(
+            FILE_MAGIC,
+            FILE_VERSION,
+            SCHEME_CODES[self.scheme],
+            self.size,
+            self.hash_count,
+            self.fp_prob,
+        )
+
+    def flush(self):
+        """
+        Write changes to the file of a filter opened in "r+" mode
+        """
+        if self.mmap is not None:
+            self.mmap.flush()
+
+    def close(self):
+        """
+        Release the memory map of a filter returned by open()
+
+        The arrays returned by get_bit_view and get_word_view share the
+        memory map: BufferError is raised while any of them is alive, and
+        the filter stays open.
+        """
+        if self.mmap is not None:
+            if self.views:
+                raise BufferError(VIEWS_IN_USE)
+            self.bit_array.bytes.release()
+            self.mmap.close()
+            self.mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def memory_usage(self):
+        """
+        Return the number of bytes taken by the bit array
+        """
+        return sys.getsizeof(self.bit_array)
+
+
+def build_parallel(
+    items, items_count, fp_prob, scheme=SEEDED, workers=None, chunk_size=10000
+):
+    """
+    Build a BloomFilter over items on a pool of processes
+
+    Items are sent in chunks of chunk_size to workers processes (one per
+    CPU by default), each of them building a partial filter with
+    add_many. The partial filters are then ORed together.
+
+    The first exception raised by a worker is raised again here, and
+    RuntimeError is raised if the workers exit without their result.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    chunks = multiprocessing.Queue(maxsize=2 * workers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=build_partial,
+            args=(chunks, results, items_count, fp_prob, scheme),
+            daemon=True,
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    bloomf = BloomFilter(items_count, fp_prob, scheme)
+    received = 0
+
+    def receive():
+        """
+        Wait for a result of the workers and merge it into bloomf. Raise
+        the exception of a worker that failed, or RuntimeError once they
+        all exited without sending their result.
+        """
+        nonlocal bloomf, received
+        # checked before waiting: a result put by a worker is readable
+        # once it exited
+        alive = any(process.is_alive() for process in processes)
+        try:
+            partial = results.get(timeout=WORKER_POLL_INTERVAL)
+        except queue.Empty:
+            if not alive:
+                raise RuntimeError("build_parallel workers exited without result")
+            return
+        if isinstance(partial, Exception):
+            raise partial
+        bloomf |= partial
+        received += 1
+
+    def put(chunk):
+        while True:
+            try:
+                chunks.put(chunk, timeout=WORKER_POLL_INTERVAL)
+                return
+            except queue.Full:
+                receive()
+
+    try:
+        items = iter(items)
+        chunk = list(islice(items, chunk_size))
+        while chunk:
+            put(chunk)
+            chunk = list(islice(items, chunk_size))
+        for _ in processes:
+            put(None)
+        while received < len(processes):
+            receive()
+    except BaseException:
+        # the workers left would wait on chunks, and chunks on them
+        for process in processes:
+            process.terminate()
+        chunks.cancel_join_thread()
+        raise
+    finally:
+        for process in processes:
+            process.join()
+    return bloomf
+
+
+def build_partial(chunks, results, items_count, fp_prob, scheme):
+    """
+    Worker of build_parallel: add chunks to a filter until None is read
+    """
+    try:
+        bloomf = BloomFilter(items_count, fp_prob, scheme)
+        for chunk in iter(chunks.get, None):
+            bloomf.add_many(chunk)
+        results.put(bloomf)
+    except Exception as e:
+        results.put(e)
+
+
+def group_by_length(keys):
+    """
+    Group a list of byte strings by length
+    Yield (indexes of the keys, uint8 array of shape (len(indexes), length))
+    """
+    groups = defaultdict(list)
+    for index, key in enumerate(keys):
+        groups[len(key)].append(index)
+
+    for length, rows in groups.items():
+        block = b"".join(bytes(keys[row]) for row in rows)
+        yield rows, np.frombuffer(block, dtype=np.uint8).reshape(len(rows), length)
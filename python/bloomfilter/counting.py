@@ -0,0 +1,122 @@
+import sys
+from collections import Counter
+
+import numpy as np
+
+from python.bloomfilter.bloom import SEEDED, BaseBloomFilter
+
+# Largest value of a 4 bit counter. A counter that reaches it is saturated:
+# the true count is unknown, so it is never decremented again.
+COUNTER_MAX = 15
+
+
+class CountingBloomFilter(BaseBloomFilter):
+
+    """
+    Bloom filter supporting deletions, using murmur3 hash function
+
+    Every slot holds a 4 bit counter instead of a bit, two counters per
+    byte, so the filter takes four times the memory of a BloomFilter.
+    """
+
+    def __init__(self, items_count, fp_prob, scheme=SEEDED):
+        """
+        See BaseBloomFilter
+        """
+        super(CountingBloomFilter, self).__init__(items_count, fp_prob, scheme)
+
+        # counters are packed two to a byte, the even slots in the low
+        # nibbles
+        self.counters = bytearray((self.size + 1) // 2)
+
+    def get_counter(self, index):
+        return (self.counters[index >> 1] >> ((index & 1) << 2)) & 0xF
+
+    def set_counter(self, index, value):
+        shift = (index & 1) << 2
+        byte = self.counters[index >> 1] & ~(0xF << shift) & 0xFF
+        self.counters[index >> 1] = byte | (value << shift)
+
+    def add(self, item):
+        """
+        Add an item in the filter
+        """
+        for digest in self.iter_digests(item):
+            counter = self.get_counter(digest)
+            if counter < COUNTER_MAX:
+                self.set_counter(digest, counter + 1)
+
+    def remove(self, item):
+        """
+        Remove an item added to the filter
+        Raise ValueError if the item is not in the filter
+        """
+        # add incremented the slots hit twice by the item twice
+        occurrences = Counter(self.iter_digests(item))
+        if any(self.get_counter(digest) < n for digest, n in occurrences.items()):
+            raise ValueError("item not in filter")
+
+        for digest, n in occurrences.items():
+            counter = self.get_counter(digest)
+            if counter < COUNTER_MAX:
+                self.set_counter(digest, counter - n)
+
+    def check(self, item):
+        """
+        Check for existence of an item in filter
+        if any of counter is 0 then, it's not present in filter
+        else there is probability that it exist
+        """
+        for digest in self.iter_digests(item):
+            if self.get_counter(digest) == 0:
+                return False
+        return True
+
+    def count(self, item):
+        """
+        Return an upper bound of the number of times an item was added
+        (COUNTER_MAX if a counter of the item is saturated)
+        """
+        return min(self.get_counter(digest) for digest in self.iter_digests(item))
+
+    def add_many(self, items):
+        """
+        Add all the items of an iterable in the filter
+        """
+        digests, counts = np.unique(self.get_digests(items), return_counts=True)
+        counters = self.get_counters_view()
+
+        # the even and odd slots of a byte are written separately, so that
+        # every byte appears once per assignment
+        for parity in (0, 1):
+            selected = (digests & 1) == parity
+            indexes = digests[selected] >> 1
+            shift = np.uint8(parity << 2)
+            mask = ~(np.uint8(0xF) << shift)
+
+            values = (counters[indexes] >> shift) & 0xF
+            values = np.minimum(values + counts[selected], COUNTER_MAX)
+            values = values.astype(np.uint8) << shift
+            counters[indexes] = (counters[indexes] & mask) | values
+
+    def check_many(self, items):
+        """
+        Check for existence of all the items of an iterable in filter
+        Return a boolean array, in the order of the items
+        """
+        digests = self.get_digests(items)
+        counters = self.get_counters_view()
+        shifts = ((digests & 1) << 2).astype(np.uint8)
+        return ((counters[digests >> 1] >> shifts) & 0xF).all(axis=0)
+
+    def get_counters_view(self):
+        """
+        Return the counters as a numpy array of bytes, sharing their memory
+        """
+        return np.frombuffer(self.counters, dtype=np.uint8)
+
+    def memory_usage(self):
+        """
+        Return the number of bytes taken by the counters
+        """
+        return sys.getsizeof(self.counters)
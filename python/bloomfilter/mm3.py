@@ -9,26 +9,43 @@ https://code.google.com/p/smhasher/wiki/MurmurHash3
 This was written for the times when you do not want to compile c-code and install modules,
 and you only want a drop-in murmur3 implementation.
 
-As this is purely python it is FAR from performant and if performance is anything that is needed
-a proper c-module is suggested!
+The pure python functions read the key as little endian words with struct instead of assembling
+them byte by byte, but python is still no match for C: when the mmh3 c-module is installed, hash
+and hash128 (and so hash64 and hash_bytes) delegate to it. Both give the same results, and the
+pure python versions stay available as py_hash and py_hash128.
+
+Murmur3_32 and Murmur3_128 compute the same hashes incrementally, hashlib style, for inputs too
+large to hold in memory at once.
 
 This module is written to have the same format as mmh3 python package found here for simple conversions:
 
 https://pypi.python.org/pypi/mmh3/2.3.1
+
+hash_array and hash128_array are additions on top of that format: they hash a whole
+column of fixed-width keys at once with numpy.
 """
 
+import copy
+import struct
 import sys as _sys
 
+import numpy as np
+
+try:
+    import mmh3 as _native
+except ImportError:
+    _native = None
+
 if _sys.version_info > (3, 0):
 
     def xrange(a, b, c):
         return range(a, b, c)
 
     def xencode(x):
-        if isinstance(x, bytes) or isinstance(x, bytearray):
-            return x
-        else:
+        if isinstance(x, str):
             return x.encode()
+        else:
+            return x
 
 
 else:
@@ -40,119 +57,100 @@ else:
 del _sys
 
 
-def hash(key, seed=0x0):
-    """ Implements 32bit murmur3 hash. """
+def fmix32(h):
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+    h ^= h >> 16
+    return h
 
-    key = bytearray(xencode(key))
 
-    def fmix(h):
-        h ^= h >> 16
-        h = (h * 0x85EBCA6B) & 0xFFFFFFFF
-        h ^= h >> 13
-        h = (h * 0xC2B2AE35) & 0xFFFFFFFF
-        h ^= h >> 16
-        return h
+def fmix64(k):
+    k ^= k >> 33
+    k = (k * 0xFF51AFD7ED558CCD) & 0xFFFFFFFFFFFFFFFF
+    k ^= k >> 33
+    k = (k * 0xC4CEB9FE1A85EC53) & 0xFFFFFFFFFFFFFFFF
+    k ^= k >> 33
+    return k
 
-    length = len(key)
-    nblocks = int(length / 4)
 
-    h1 = seed
+# Number of bytes unpacked at a time, so that huge keys are not turned into
+# a tuple of words all at once
+WINDOW = 1 << 16
+
+
+def body32(h1, key, start, nblocks):
+    """ Mixes nblocks 32bit blocks of key, from byte start, into h1. """
 
     c1 = 0xCC9E2D51
     c2 = 0x1B873593
 
-    # body
-    for block_start in xrange(0, nblocks * 4, 4):
-        # ??? big endian?
-        k1 = (
-            key[block_start + 3] << 24
-            | key[block_start + 2] << 16
-            | key[block_start + 1] << 8
-            | key[block_start + 0]
-        )
-
-        k1 = (c1 * k1) & 0xFFFFFFFF
-        k1 = (k1 << 15 | k1 >> 17) & 0xFFFFFFFF  # inlined ROTL32
-        k1 = (c2 * k1) & 0xFFFFFFFF
+    end = start + nblocks * 4
+    while start < end:
+        count = min(end - start, WINDOW) // 4
 
-        h1 ^= k1
-        h1 = (h1 << 13 | h1 >> 19) & 0xFFFFFFFF  # inlined ROTL32
-        h1 = (h1 * 5 + 0xE6546B64) & 0xFFFFFFFF
+        # read as little endian 32bit words
+        for k1 in struct.unpack_from("<%dI" % count, key, start):
+            k1 = (c1 * k1) & 0xFFFFFFFF
+            k1 = (k1 << 15 | k1 >> 17) & 0xFFFFFFFF  # inlined ROTL32
+            k1 = (c2 * k1) & 0xFFFFFFFF
 
-    # tail
-    tail_index = nblocks * 4
-    k1 = 0
-    tail_size = length & 3
+            h1 ^= k1
+            h1 = (h1 << 13 | h1 >> 19) & 0xFFFFFFFF  # inlined ROTL32
+            h1 = (h1 * 5 + 0xE6546B64) & 0xFFFFFFFF
 
-    if tail_size >= 3:
-        k1 ^= key[tail_index + 2] << 16
-    if tail_size >= 2:
-        k1 ^= key[tail_index + 1] << 8
-    if tail_size >= 1:
-        k1 ^= key[tail_index + 0]
+        start += count * 4
 
-    if tail_size > 0:
+    return h1
+
+
+def final32(h1, tail, length):
+    """ Mixes the tail (up to 3 bytes) into h1 and finalizes the hash. """
+
+    c1 = 0xCC9E2D51
+    c2 = 0x1B873593
+
+    if len(tail) > 0:
+        k1 = int.from_bytes(tail, "little")
         k1 = (k1 * c1) & 0xFFFFFFFF
         k1 = (k1 << 15 | k1 >> 17) & 0xFFFFFFFF  # inlined ROTL32
         k1 = (k1 * c2) & 0xFFFFFFFF
         h1 ^= k1
 
     # finalization
-    unsigned_val = fmix(h1 ^ length)
+    unsigned_val = fmix32(h1 ^ length)
     if unsigned_val & 0x80000000 == 0:
         return unsigned_val
     else:
         return -((unsigned_val ^ 0xFFFFFFFF) + 1)
 
 
-def hash128(key, seed=0x0, x64arch=True):
-    """ Implements 128bit murmur3 hash. """
+def py_hash(key, seed=0x0):
+    """ Implements 32bit murmur3 hash in pure python. """
 
-    def hash128_x64(key, seed):
-        """ Implements 128bit murmur3 hash for x64. """
+    key = xencode(key)
 
-        def fmix(k):
-            k ^= k >> 33
-            k = (k * 0xFF51AFD7ED558CCD) & 0xFFFFFFFFFFFFFFFF
-            k ^= k >> 33
-            k = (k * 0xC4CEB9FE1A85EC53) & 0xFFFFFFFFFFFFFFFF
-            k ^= k >> 33
-            return k
+    length = len(key)
+    nblocks = length // 4
 
-        length = len(key)
-        nblocks = int(length / 16)
+    h1 = body32(seed, key, 0, nblocks)
+    return final32(h1, key[nblocks * 4 :], length)
 
-        h1 = seed
-        h2 = seed
 
-        c1 = 0x87C37B91114253D5
-        c2 = 0x4CF5AD432745937F
+def body128_x64(h1, h2, key, start, nblocks):
+    """ Mixes nblocks 128bit blocks of key, from byte start, into h1, h2. """
 
-        # body
-        for block_start in xrange(0, nblocks * 8, 8):
-            # ??? big endian?
-            k1 = (
-                key[2 * block_start + 7] << 56
-                | key[2 * block_start + 6] << 48
-                | key[2 * block_start + 5] << 40
-                | key[2 * block_start + 4] << 32
-                | key[2 * block_start + 3] << 24
-                | key[2 * block_start + 2] << 16
-                | key[2 * block_start + 1] << 8
-                | key[2 * block_start + 0]
-            )
-
-            k2 = (
-                key[2 * block_start + 15] << 56
-                | key[2 * block_start + 14] << 48
-                | key[2 * block_start + 13] << 40
-                | key[2 * block_start + 12] << 32
-                | key[2 * block_start + 11] << 24
-                | key[2 * block_start + 10] << 16
-                | key[2 * block_start + 9] << 8
-                | key[2 * block_start + 8]
-            )
+    c1 = 0x87C37B91114253D5
+    c2 = 0x4CF5AD432745937F
+
+    end = start + nblocks * 16
+    while start < end:
+        count = min(end - start, WINDOW) // 8
 
+        # read as pairs of little endian 64bit words
+        words = iter(struct.unpack_from("<%dQ" % count, key, start))
+        for k1, k2 in zip(words, words):
             k1 = (c1 * k1) & 0xFFFFFFFFFFFFFFFF
             k1 = (k1 << 31 | k1 >> 33) & 0xFFFFFFFFFFFFFFFF  # inlined ROTL64
             k1 = (c2 * k1) & 0xFFFFFFFFFFFFFFFF
@@ -171,125 +169,74 @@ def hash128(key, seed=0x0, x64arch=True):
             h2 = (h1 + h2) & 0xFFFFFFFFFFFFFFFF
             h2 = (h2 * 5 + 0x38495AB5) & 0xFFFFFFFFFFFFFFFF
 
-        # tail
-        tail_index = nblocks * 16
-        k1 = 0
-        k2 = 0
-        tail_size = length & 15
-
-        if tail_size >= 15:
-            k2 ^= key[tail_index + 14] << 48
-        if tail_size >= 14:
-            k2 ^= key[tail_index + 13] << 40
-        if tail_size >= 13:
-            k2 ^= key[tail_index + 12] << 32
-        if tail_size >= 12:
-            k2 ^= key[tail_index + 11] << 24
-        if tail_size >= 11:
-            k2 ^= key[tail_index + 10] << 16
-        if tail_size >= 10:
-            k2 ^= key[tail_index + 9] << 8
-        if tail_size >= 9:
-            k2 ^= key[tail_index + 8]
-
-        if tail_size > 8:
-            k2 = (k2 * c2) & 0xFFFFFFFFFFFFFFFF
-            k2 = (k2 << 33 | k2 >> 31) & 0xFFFFFFFFFFFFFFFF  # inlined ROTL64
-            k2 = (k2 * c1) & 0xFFFFFFFFFFFFFFFF
-            h2 ^= k2
+        start += count * 8
 
-        if tail_size >= 8:
-            k1 ^= key[tail_index + 7] << 56
-        if tail_size >= 7:
-            k1 ^= key[tail_index + 6] << 48
-        if tail_size >= 6:
-            k1 ^= key[tail_index + 5] << 40
-        if tail_size >= 5:
-            k1 ^= key[tail_index + 4] << 32
-        if tail_size >= 4:
-            k1 ^= key[tail_index + 3] << 24
-        if tail_size >= 3:
-            k1 ^= key[tail_index + 2] << 16
-        if tail_size >= 2:
-            k1 ^= key[tail_index + 1] << 8
-        if tail_size >= 1:
-            k1 ^= key[tail_index + 0]
-
-        if tail_size > 0:
-            k1 = (k1 * c1) & 0xFFFFFFFFFFFFFFFF
-            k1 = (k1 << 31 | k1 >> 33) & 0xFFFFFFFFFFFFFFFF  # inlined ROTL64
-            k1 = (k1 * c2) & 0xFFFFFFFFFFFFFFFF
-            h1 ^= k1
+    return h1, h2
 
-        # finalization
-        h1 ^= length
-        h2 ^= length
 
-        h1 = (h1 + h2) & 0xFFFFFFFFFFFFFFFF
-        h2 = (h1 + h2) & 0xFFFFFFFFFFFFFFFF
+def final128_x64(h1, h2, tail, length):
+    """ Mixes the tail (up to 15 bytes) into h1, h2 and finalizes the hash. """
+
+    c1 = 0x87C37B91114253D5
+    c2 = 0x4CF5AD432745937F
 
-        h1 = fmix(h1)
-        h2 = fmix(h2)
+    tail_size = len(tail)
 
-        h1 = (h1 + h2) & 0xFFFFFFFFFFFFFFFF
-        h2 = (h1 + h2) & 0xFFFFFFFFFFFFFFFF
+    if tail_size > 8:
+        k2 = int.from_bytes(tail[8:], "little")
+        k2 = (k2 * c2) & 0xFFFFFFFFFFFFFFFF
+        k2 = (k2 << 33 | k2 >> 31) & 0xFFFFFFFFFFFFFFFF  # inlined ROTL64
+        k2 = (k2 * c1) & 0xFFFFFFFFFFFFFFFF
+        h2 ^= k2
 
-        return h2 << 64 | h1
+    if tail_size > 0:
+        k1 = int.from_bytes(tail[:8], "little")
+        k1 = (k1 * c1) & 0xFFFFFFFFFFFFFFFF
+        k1 = (k1 << 31 | k1 >> 33) & 0xFFFFFFFFFFFFFFFF  # inlined ROTL64
+        k1 = (k1 * c2) & 0xFFFFFFFFFFFFFFFF
+        h1 ^= k1
 
-    def hash128_x86(key, seed):
-        """ Implements 128bit murmur3 hash for x86. """
+    # finalization
+    h1 ^= length
+    h2 ^= length
 
-        def fmix(h):
-            h ^= h >> 16
-            h = (h * 0x85EBCA6B) & 0xFFFFFFFF
-            h ^= h >> 13
-            h = (h * 0xC2B2AE35) & 0xFFFFFFFF
-            h ^= h >> 16
-            return h
+    h1 = (h1 + h2) & 0xFFFFFFFFFFFFFFFF
+    h2 = (h1 + h2) & 0xFFFFFFFFFFFFFFFF
 
-        length = len(key)
-        nblocks = int(length / 16)
+    h1 = fmix64(h1)
+    h2 = fmix64(h2)
 
-        h1 = seed
-        h2 = seed
-        h3 = seed
-        h4 = seed
+    h1 = (h1 + h2) & 0xFFFFFFFFFFFFFFFF
+    h2 = (h1 + h2) & 0xFFFFFFFFFFFFFFFF
 
-        c1 = 0x239B961B
-        c2 = 0xAB0E9789
-        c3 = 0x38B34AE5
-        c4 = 0xA1E38B93
+    return h2 << 64 | h1
 
-        # body
-        for block_start in xrange(0, nblocks * 16, 16):
-            k1 = (
-                key[block_start + 3] << 24
-                | key[block_start + 2] << 16
-                | key[block_start + 1] << 8
-                | key[block_start + 0]
-            )
-
-            k2 = (
-                key[block_start + 7] << 24
-                | key[block_start + 6] << 16
-                | key[block_start + 5] << 8
-                | key[block_start + 4]
-            )
-
-            k3 = (
-                key[block_start + 11] << 24
-                | key[block_start + 10] << 16
-                | key[block_start + 9] << 8
-                | key[block_start + 8]
-            )
-
-            k4 = (
-                key[block_start + 15] << 24
-                | key[block_start + 14] << 16
-                | key[block_start + 13] << 8
-                | key[block_start + 12]
-            )
 
+def hash128_x64(key, seed):
+    """ Implements 128bit murmur3 hash for x64. """
+
+    length = len(key)
+    nblocks = length // 16
+
+    h1, h2 = body128_x64(seed, seed, key, 0, nblocks)
+    return final128_x64(h1, h2, key[nblocks * 16 :], length)
+
+
+def body128_x86(h1, h2, h3, h4, key, start, nblocks):
+    """ Mixes nblocks 128bit blocks of key, from byte start, into h1..h4. """
+
+    c1 = 0x239B961B
+    c2 = 0xAB0E9789
+    c3 = 0x38B34AE5
+    c4 = 0xA1E38B93
+
+    end = start + nblocks * 16
+    while start < end:
+        count = min(end - start, WINDOW) // 4
+
+        # read as groups of four little endian 32bit words
+        words = iter(struct.unpack_from("<%dI" % count, key, start))
+        for k1, k2, k3, k4 in zip(words, words, words, words):
             k1 = (c1 * k1) & 0xFFFFFFFF
             k1 = (k1 << 15 | k1 >> 17) & 0xFFFFFFFF  # inlined ROTL32
             k1 = (c2 * k1) & 0xFFFFFFFF
@@ -326,100 +273,91 @@ def hash128(key, seed=0x0, x64arch=True):
             h4 = (h1 + h4) & 0xFFFFFFFF
             h4 = (h4 * 5 + 0x32AC3B17) & 0xFFFFFFFF
 
-        # tail
-        tail_index = nblocks * 16
-        k1 = 0
-        k2 = 0
-        k3 = 0
-        k4 = 0
-        tail_size = length & 15
-
-        if tail_size >= 15:
-            k4 ^= key[tail_index + 14] << 16
-        if tail_size >= 14:
-            k4 ^= key[tail_index + 13] << 8
-        if tail_size >= 13:
-            k4 ^= key[tail_index + 12]
-
-        if tail_size > 12:
-            k4 = (k4 * c4) & 0xFFFFFFFF
-            k4 = (k4 << 18 | k4 >> 14) & 0xFFFFFFFF  # inlined ROTL32
-            k4 = (k4 * c1) & 0xFFFFFFFF
-            h4 ^= k4
+        start += count * 4
 
-        if tail_size >= 12:
-            k3 ^= key[tail_index + 11] << 24
-        if tail_size >= 11:
-            k3 ^= key[tail_index + 10] << 16
-        if tail_size >= 10:
-            k3 ^= key[tail_index + 9] << 8
-        if tail_size >= 9:
-            k3 ^= key[tail_index + 8]
-
-        if tail_size > 8:
-            k3 = (k3 * c3) & 0xFFFFFFFF
-            k3 = (k3 << 17 | k3 >> 15) & 0xFFFFFFFF  # inlined ROTL32
-            k3 = (k3 * c4) & 0xFFFFFFFF
-            h3 ^= k3
+    return h1, h2, h3, h4
 
-        if tail_size >= 8:
-            k2 ^= key[tail_index + 7] << 24
-        if tail_size >= 7:
-            k2 ^= key[tail_index + 6] << 16
-        if tail_size >= 6:
-            k2 ^= key[tail_index + 5] << 8
-        if tail_size >= 5:
-            k2 ^= key[tail_index + 4]
-
-        if tail_size > 4:
-            k2 = (k2 * c2) & 0xFFFFFFFF
-            k2 = (k2 << 16 | k2 >> 16) & 0xFFFFFFFF  # inlined ROTL32
-            k2 = (k2 * c3) & 0xFFFFFFFF
-            h2 ^= k2
 
-        if tail_size >= 4:
-            k1 ^= key[tail_index + 3] << 24
-        if tail_size >= 3:
-            k1 ^= key[tail_index + 2] << 16
-        if tail_size >= 2:
-            k1 ^= key[tail_index + 1] << 8
-        if tail_size >= 1:
-            k1 ^= key[tail_index + 0]
-
-        if tail_size > 0:
-            k1 = (k1 * c1) & 0xFFFFFFFF
-            k1 = (k1 << 15 | k1 >> 17) & 0xFFFFFFFF  # inlined ROTL32
-            k1 = (k1 * c2) & 0xFFFFFFFF
-            h1 ^= k1
+def final128_x86(h1, h2, h3, h4, tail, length):
+    """ Mixes the tail (up to 15 bytes) into h1..h4 and finalizes the hash. """
+
+    c1 = 0x239B961B
+    c2 = 0xAB0E9789
+    c3 = 0x38B34AE5
+    c4 = 0xA1E38B93
+
+    tail_size = len(tail)
+
+    if tail_size > 12:
+        k4 = int.from_bytes(tail[12:], "little")
+        k4 = (k4 * c4) & 0xFFFFFFFF
+        k4 = (k4 << 18 | k4 >> 14) & 0xFFFFFFFF  # inlined ROTL32
+        k4 = (k4 * c1) & 0xFFFFFFFF
+        h4 ^= k4
+
+    if tail_size > 8:
+        k3 = int.from_bytes(tail[8:12], "little")
+        k3 = (k3 * c3) & 0xFFFFFFFF
+        k3 = (k3 << 17 | k3 >> 15) & 0xFFFFFFFF  # inlined ROTL32
+        k3 = (k3 * c4) & 0xFFFFFFFF
+        h3 ^= k3
+
+    if tail_size > 4:
+        k2 = int.from_bytes(tail[4:8], "little")
+        k2 = (k2 * c2) & 0xFFFFFFFF
+        k2 = (k2 << 16 | k2 >> 16) & 0xFFFFFFFF  # inlined ROTL32
+        k2 = (k2 * c3) & 0xFFFFFFFF
+        h2 ^= k2
+
+    if tail_size > 0:
+        k1 = int.from_bytes(tail[:4], "little")
+        k1 = (k1 * c1) & 0xFFFFFFFF
+        k1 = (k1 << 15 | k1 >> 17) & 0xFFFFFFFF  # inlined ROTL32
+        k1 = (k1 * c2) & 0xFFFFFFFF
+        h1 ^= k1
+
+    # finalization
+    h1 ^= length
+    h2 ^= length
+    h3 ^= length
+    h4 ^= length
+
+    h1 = (h1 + h2) & 0xFFFFFFFF
+    h1 = (h1 + h3) & 0xFFFFFFFF
+    h1 = (h1 + h4) & 0xFFFFFFFF
+    h2 = (h1 + h2) & 0xFFFFFFFF
+    h3 = (h1 + h3) & 0xFFFFFFFF
+    h4 = (h1 + h4) & 0xFFFFFFFF
+
+    h1 = fmix32(h1)
+    h2 = fmix32(h2)
+    h3 = fmix32(h3)
+    h4 = fmix32(h4)
+
+    h1 = (h1 + h2) & 0xFFFFFFFF
+    h1 = (h1 + h3) & 0xFFFFFFFF
+    h1 = (h1 + h4) & 0xFFFFFFFF
+    h2 = (h1 + h2) & 0xFFFFFFFF
+    h3 = (h1 + h3) & 0xFFFFFFFF
+    h4 = (h1 + h4) & 0xFFFFFFFF
+
+    return h4 << 96 | h3 << 64 | h2 << 32 | h1
 
-        # finalization
-        h1 ^= length
-        h2 ^= length
-        h3 ^= length
-        h4 ^= length
-
-        h1 = (h1 + h2) & 0xFFFFFFFF
-        h1 = (h1 + h3) & 0xFFFFFFFF
-        h1 = (h1 + h4) & 0xFFFFFFFF
-        h2 = (h1 + h2) & 0xFFFFFFFF
-        h3 = (h1 + h3) & 0xFFFFFFFF
-        h4 = (h1 + h4) & 0xFFFFFFFF
-
-        h1 = fmix(h1)
-        h2 = fmix(h2)
-        h3 = fmix(h3)
-        h4 = fmix(h4)
-
-        h1 = (h1 + h2) & 0xFFFFFFFF
-        h1 = (h1 + h3) & 0xFFFFFFFF
-        h1 = (h1 + h4) & 0xFFFFFFFF
-        h2 = (h1 + h2) & 0xFFFFFFFF
-        h3 = (h1 + h3) & 0xFFFFFFFF
-        h4 = (h1 + h4) & 0xFFFFFFFF
-
-        return h4 << 96 | h3 << 64 | h2 << 32 | h1
-
-    key = bytearray(xencode(key))
+
+def hash128_x86(key, seed):
+    """ Implements 128bit murmur3 hash for x86. """
+
+    length = len(key)
+    nblocks = length // 16
+
+    state = body128_x86(seed, seed, seed, seed, key, 0, nblocks)
+    return final128_x86(*state, key[nblocks * 16 :], length)
+
+
+def py_hash128(key, seed=0x0, x64arch=True):
+    """ Implements 128bit murmur3 hash in pure python. """
+
+    key = xencode(key)
 
     if x64arch:
         return hash128_x64(key, seed)
@@ -427,6 +365,22 @@ def hash128(key, seed=0x0, x64arch=True):
         return hash128_x86(key, seed)
 
 
+def hash(key, seed=0x0):
+    """ Implements 32bit murmur3 hash. """
+
+    if _native is not None and 0 <= seed <= 0xFFFFFFFF:
+        return _native.hash(bytes(xencode(key)), seed)
+    return py_hash(key, seed)
+
+
+def hash128(key, seed=0x0, x64arch=True):
+    """ Implements 128bit murmur3 hash. """
+
+    if _native is not None and 0 <= seed <= 0xFFFFFFFF:
+        return _native.hash128(bytes(xencode(key)), seed, x64arch)
+    return py_hash128(key, seed, x64arch)
+
+
 def hash64(key, seed=0x0, x64arch=True):
     """ Implements 64bit murmur3 hash. Returns a tuple. """
 
@@ -460,3 +414,421 @@ def hash_bytes(key, seed=0x0, x64arch=True):
         hash_128 = hash_128 >> 8
 
     return bytestring
+
+
+class Murmur3Hasher(object):
+    """ Base class of the incremental murmur3 hashers.
+
+    Follows the hashlib interface: feed the data with update(), in as many
+    chunks as needed, then read the hash with intdigest(), digest() or
+    hexdigest(). Only the current state and the incomplete last block are
+    kept between updates, so files and mmaps hash in constant memory.
+    """
+
+    block_size = 16
+    digest_size = 16
+
+    def __init__(self, data=b"", seed=0x0):
+        self.seed = seed
+        self.length = 0
+        self.pending = b""
+        self.state = self.initial_state(seed)
+        if data:
+            self.update(data)
+
+    def update(self, data):
+        """ Feeds more data (str, bytes or any byte buffer) to the hash. """
+
+        data = memoryview(xencode(data)).cast("B")
+        self.length += len(data)
+
+        start = 0
+        if self.pending:
+            # complete the block left over from the previous update first
+            start = self.block_size - len(self.pending)
+            self.pending += bytes(data[:start])
+            if len(self.pending) < self.block_size:
+                return
+            self.state = self.mix(self.state, self.pending, 0, 1)
+
+        nblocks = (len(data) - start) // self.block_size
+        self.state = self.mix(self.state, data, start, nblocks)
+        self.pending = bytes(data[start + nblocks * self.block_size :])
+
+    def digest(self):
+        """ Returns the hash as little endian bytes. """
+
+        unsigned_val = self.intdigest() & ((1 << 8 * self.digest_size) - 1)
+        return unsigned_val.to_bytes(self.digest_size, "little")
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+    def copy(self):
+        return copy.copy(self)
+
+
+class Murmur3_32(Murmur3Hasher):
+    """ Incremental 32bit murmur3 hash, intdigest() matches hash(). """
+
+    block_size = 4
+    digest_size = 4
+
+    def initial_state(self, seed):
+        return seed
+
+    def mix(self, h1, data, start, nblocks):
+        return body32(h1, data, start, nblocks)
+
+    def intdigest(self):
+        return final32(self.state, self.pending, self.length)
+
+
+class Murmur3_128(Murmur3Hasher):
+    """ Incremental 128bit murmur3 hash, intdigest() matches hash128(). """
+
+    def __init__(self, data=b"", seed=0x0, x64arch=True):
+        self.x64arch = x64arch
+        super(Murmur3_128, self).__init__(data, seed)
+
+    def initial_state(self, seed):
+        if self.x64arch:
+            return (seed, seed)
+        else:
+            return (seed, seed, seed, seed)
+
+    def mix(self, state, data, start, nblocks):
+        if self.x64arch:
+            return body128_x64(*state, data, start, nblocks)
+        else:
+            return body128_x86(*state, data, start, nblocks)
+
+    def intdigest(self):
+        if self.x64arch:
+            return final128_x64(*self.state, self.pending, self.length)
+        else:
+            return final128_x86(*self.state, self.pending, self.length)
+
+
+def hash_file(fileobj, hasher, chunk_size=1 << 20):
+    """ Feeds a binary file object to hasher, chunk_size bytes at a time.
+
+    The chunks are read into a single reusable buffer. Returns hasher.
+    """
+
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+
+    while True:
+        size = fileobj.readinto(buffer)
+        if not size:
+            return hasher
+        hasher.update(view[:size])
+
+
+def key_rows(keys):
+    """ Return keys as a contiguous 2D uint8 array, one key per row.
+
+    keys is either a (N, width) array, or a 1D array of a fixed-width
+    dtype (uint64, "S16", "V8"...). Every row, or item, is hashed as its
+    raw bytes, exactly like hash(row.tobytes()).
+    """
+
+    keys = np.asarray(keys)
+    if keys.dtype.hasobject:
+        raise TypeError("keys must have a fixed-width dtype, not object")
+    if keys.ndim == 1:
+        keys = keys.reshape(len(keys), 1)
+    if keys.ndim != 2:
+        raise ValueError("keys must be a 2D array of shape (N, width)")
+    keys = np.ascontiguousarray(keys)
+    return keys.view(np.uint8).reshape(len(keys), keys.shape[1] * keys.dtype.itemsize)
+
+
+def body_words(keys, nwords, word_dtype):
+    """ Return the first nwords little endian words of every row. """
+
+    nbytes = nwords * np.dtype(word_dtype).itemsize
+    body = np.ascontiguousarray(keys[:, :nbytes])
+    return body.view("<" + np.dtype(word_dtype).str[1:]).astype(word_dtype)
+
+
+def tail_word(keys, start, stop, word_dtype):
+    """ Return bytes [start, stop) of every row as a little endian word. """
+
+    word = np.zeros(len(keys), dtype=word_dtype)
+    for i in range(start, stop):
+        word |= keys[:, i].astype(word_dtype) << word_dtype(8 * (i - start))
+    return word
+
+
+def rotl32_array(x, r):
+    return (x << np.uint32(r)) | (x >> np.uint32(32 - r))
+
+
+def rotl64_array(x, r):
+    return (x << np.uint64(r)) | (x >> np.uint64(64 - r))
+
+
+def fmix32_array(h):
+    h ^= h >> np.uint32(16)
+    h *= np.uint32(0x85EBCA6B)
+    h ^= h >> np.uint32(13)
+    h *= np.uint32(0xC2B2AE35)
+    h ^= h >> np.uint32(16)
+    return h
+
+
+def fmix64_array(k):
+    k ^= k >> np.uint64(33)
+    k *= np.uint64(0xFF51AFD7ED558CCD)
+    k ^= k >> np.uint64(33)
+    k *= np.uint64(0xC4CEB9FE1A85EC53)
+    k ^= k >> np.uint64(33)
+    return k
+
+
+def hash_array(keys, seed=0x0):
+    """ Implements 32bit murmur3 hash over an array of fixed-width keys.
+
+    Every key (see key_rows) is hashed at once with numpy and the result
+    matches hash(key, seed) element for element, as an int32 array.
+    """
+
+    keys = key_rows(keys)
+    count, length = keys.shape
+    nblocks = length // 4
+
+    h1 = np.full(count, seed & 0xFFFFFFFF, dtype=np.uint32)
+
+    c1 = np.uint32(0xCC9E2D51)
+    c2 = np.uint32(0x1B873593)
+
+    with np.errstate(over="ignore"):
+        # body
+        blocks = body_words(keys, nblocks, np.uint32)
+        for block in range(nblocks):
+            k1 = blocks[:, block] * c1
+            k1 = rotl32_array(k1, 15)
+            k1 *= c2
+
+            h1 ^= k1
+            h1 = rotl32_array(h1, 13)
+            h1 = h1 * np.uint32(5) + np.uint32(0xE6546B64)
+
+        # tail
+        tail_index = nblocks * 4
+
+        if length & 3:
+            k1 = tail_word(keys, tail_index, length, np.uint32)
+            k1 *= c1
+            k1 = rotl32_array(k1, 15)
+            k1 *= c2
+            h1 ^= k1
+
+        # finalization
+        h1 ^= np.uint32(length & 0xFFFFFFFF)
+        h1 = fmix32_array(h1)
+
+    return h1.view(np.int32)
+
+
+def hash128_x64_array(keys, seed):
+    """ Implements 128bit murmur3 hash for x64 over rows of uint8. """
+
+    count, length = keys.shape
+    nblocks = length // 16
+
+    h1 = np.full(count, seed & 0xFFFFFFFFFFFFFFFF, dtype=np.uint64)
+    h2 = h1.copy()
+
+    c1 = np.uint64(0x87C37B91114253D5)
+    c2 = np.uint64(0x4CF5AD432745937F)
+
+    # body
+    blocks = body_words(keys, nblocks * 2, np.uint64)
+    for block in range(nblocks):
+        k1 = blocks[:, 2 * block] * c1
+        k1 = rotl64_array(k1, 31)
+        k1 *= c2
+        h1 ^= k1
+
+        h1 = rotl64_array(h1, 27)
+        h1 += h2
+        h1 = h1 * np.uint64(5) + np.uint64(0x52DCE729)
+
+        k2 = blocks[:, 2 * block + 1] * c2
+        k2 = rotl64_array(k2, 33)
+        k2 *= c1
+        h2 ^= k2
+
+        h2 = rotl64_array(h2, 31)
+        h2 += h1
+        h2 = h2 * np.uint64(5) + np.uint64(0x38495AB5)
+
+    # tail
+    tail_index = nblocks * 16
+    tail_size = length & 15
+
+    if tail_size > 8:
+        k2 = tail_word(keys, tail_index + 8, length, np.uint64)
+        k2 *= c2
+        k2 = rotl64_array(k2, 33)
+        k2 *= c1
+        h2 ^= k2
+
+    if tail_size > 0:
+        k1 = tail_word(keys, tail_index, min(length, tail_index + 8), np.uint64)
+        k1 *= c1
+        k1 = rotl64_array(k1, 31)
+        k1 *= c2
+        h1 ^= k1
+
+    # finalization
+    h1 ^= np.uint64(length)
+    h2 ^= np.uint64(length)
+
+    h1 += h2
+    h2 += h1
+
+    h1 = fmix64_array(h1)
+    h2 = fmix64_array(h2)
+
+    h1 += h2
+    h2 += h1
+
+    return np.stack([h1, h2], axis=1)
+
+
+def hash128_x86_array(keys, seed):
+    """ Implements 128bit murmur3 hash for x86 over rows of uint8. """
+
+    count, length = keys.shape
+    nblocks = length // 16
+
+    h1 = np.full(count, seed & 0xFFFFFFFF, dtype=np.uint32)
+    h2 = h1.copy()
+    h3 = h1.copy()
+    h4 = h1.copy()
+
+    c1 = np.uint32(0x239B961B)
+    c2 = np.uint32(0xAB0E9789)
+    c3 = np.uint32(0x38B34AE5)
+    c4 = np.uint32(0xA1E38B93)
+
+    # body
+    blocks = body_words(keys, nblocks * 4, np.uint32)
+    for block in range(nblocks):
+        k1 = blocks[:, 4 * block] * c1
+        k1 = rotl32_array(k1, 15)
+        k1 *= c2
+        h1 ^= k1
+
+        h1 = rotl32_array(h1, 19)
+        h1 += h2
+        h1 = h1 * np.uint32(5) + np.uint32(0x561CCD1B)
+
+        k2 = blocks[:, 4 * block + 1] * c2
+        k2 = rotl32_array(k2, 16)
+        k2 *= c3
+        h2 ^= k2
+
+        h2 = rotl32_array(h2, 17)
+        h2 += h3
+        h2 = h2 * np.uint32(5) + np.uint32(0x0BCAA747)
+
+        k3 = blocks[:, 4 * block + 2] * c3
+        k3 = rotl32_array(k3, 17)
+        k3 *= c4
+        h3 ^= k3
+
+        h3 = rotl32_array(h3, 15)
+        h3 += h4
+        h3 = h3 * np.uint32(5) + np.uint32(0x96CD1C35)
+
+        k4 = blocks[:, 4 * block + 3] * c4
+        k4 = rotl32_array(k4, 18)
+        k4 *= c1
+        h4 ^= k4
+
+        h4 = rotl32_array(h4, 13)
+        h4 += h1
+        h4 = h4 * np.uint32(5) + np.uint32(0x32AC3B17)
+
+    # tail
+    tail_index = nblocks * 16
+    tail_size = length & 15
+
+    if tail_size > 12:
+        k4 = tail_word(keys, tail_index + 12, length, np.uint32)
+        k4 *= c4
+        k4 = rotl32_array(k4, 18)
+        k4 *= c1
+        h4 ^= k4
+
+    if tail_size > 8:
+        k3 = tail_word(keys, tail_index + 8, min(length, tail_index + 12), np.uint32)
+        k3 *= c3
+        k3 = rotl32_array(k3, 17)
+        k3 *= c4
+        h3 ^= k3
+
+    if tail_size > 4:
+        k2 = tail_word(keys, tail_index + 4, min(length, tail_index + 8), np.uint32)
+        k2 *= c2
+        k2 = rotl32_array(k2, 16)
+        k2 *= c3
+        h2 ^= k2
+
+    if tail_size > 0:
+        k1 = tail_word(keys, tail_index, min(length, tail_index + 4), np.uint32)
+        k1 *= c1
+        k1 = rotl32_array(k1, 15)
+        k1 *= c2
+        h1 ^= k1
+
+    # finalization
+    length_32 = np.uint32(length & 0xFFFFFFFF)
+    h1 ^= length_32
+    h2 ^= length_32
+    h3 ^= length_32
+    h4 ^= length_32
+
+    h1 += h2
+    h1 += h3
+    h1 += h4
+    h2 += h1
+    h3 += h1
+    h4 += h1
+
+    h1 = fmix32_array(h1)
+    h2 = fmix32_array(h2)
+    h3 = fmix32_array(h3)
+    h4 = fmix32_array(h4)
+
+    h1 += h2
+    h1 += h3
+    h1 += h4
+    h2 += h1
+    h3 += h1
+    h4 += h1
+
+    low = h1.astype(np.uint64) | h2.astype(np.uint64) << np.uint64(32)
+    high = h3.astype(np.uint64) | h4.astype(np.uint64) << np.uint64(32)
+    return np.stack([low, high], axis=1)
+
+
+def hash128_array(keys, seed=0x0, x64arch=True):
+    """ Implements 128bit murmur3 hash over an array of fixed-width keys.
+
+    Returns a (N, 2) uint64 array holding the low and high 64 bits of every
+    hash: int(low) | int(high) << 64 == hash128(key, seed, x64arch).
+    """
+
+    keys = key_rows(keys)
+
+    with np.errstate(over="ignore"):
+        if x64arch:
+            return hash128_x64_array(keys, seed)
+        else:
+            return hash128_x86_array(keys, seed)
@@ -0,0 +1,177 @@
+import numpy as np
+
+import python.bloomfilter.mm3 as mmh3
+from python.bloomfilter.bloom import SEEDED, BloomFilter
+
+
+def add_new(bloomf, items):
+    """
+    Add the items of a list to bloomf as repeated check and add calls
+    would: an item found in bloomf once the items before it are added is
+    skipped. Return a boolean array of the items added.
+    """
+    digests = bloomf.get_digests(items)
+    bits = bloomf.get_bit_view()
+    present = (bits[digests >> 3] >> (digests & 7).astype(np.uint8)) & 1
+
+    # a skipped item sets no new bit, so the bits set when an item is
+    # checked are those of bloomf and those of every item before it
+    _, first, inverse = np.unique(
+        digests.T.ravel(), return_index=True, return_inverse=True
+    )
+    # index of the first item setting each bit, in the shape of digests
+    first = (first // bloomf.hash_count)[inverse]
+    first = first.reshape(len(items), bloomf.hash_count).T
+    set_before = first < np.arange(len(items))
+    added = ~(present.astype(bool) | set_before).all(axis=0)
+
+    digests = digests[:, added]
+    masks = np.left_shift(1, digests & 7).astype(np.uint8)
+    np.bitwise_or.at(bits, digests >> 3, masks)
+    return added
+
+
+class ScalableBloomFilter(object):
+
+    """
+    Bloom filter that grows with the number of items added
+
+    Items go into a chain of BloomFilter, each larger than the previous
+    one and with a smaller false positive probability, so that the false
+    positive probability of the whole chain stays under fp_prob however
+    many items are added.
+
+    Almeida et al., "Scalable Bloom Filters" (2007)
+    """
+
+    def __init__(self, initial_count, fp_prob, growth=2, tightening=0.9, scheme=SEEDED):
+        """
+        initial_count : int
+            Number of items stored by the first filter of the chain
+        fp_prob : float
+            False Positive probability in decimal, for the whole chain
+        growth : int
+            Each filter holds growth times more items than the previous one
+        tightening : float
+            Each filter has a false positive probability tightening times
+            the one of the previous filter
+        scheme : str
+            Hash scheme of the filters, see BloomFilter
+        """
+        if not 0 < tightening < 1:
+            raise ValueError("tightening must be between 0 and 1")
+        if growth < 1:
+            raise ValueError("growth must be at least 1")
+
+        self.initial_count = initial_count
+        self.fp_prob = fp_prob
+        self.growth = growth
+        self.tightening = tightening
+        self.scheme = scheme
+
+        # chain of filters, oldest first, and the number of items each
+        # one is sized for
+        self.filters = []
+        self.capacities = []
+
+        # number of items added to the newest filter
+        self.count = 0
+        # number of items added to the older filters
+        self.full_count = 0
+
+        self.grow()
+
+    def __len__(self):
+        """
+        Number of distinct items added (false positives when adding are
+        not counted)
+        """
+        return self.full_count + self.count
+
+    def add(self, item):
+        """
+        Add an item in the filter, growing it if the newest filter is full
+        """
+        if self.check(item):
+            return
+        if self.count >= self.capacities[-1]:
+            self.grow()
+        self.filters[-1].add(item)
+        self.count += 1
+
+    def check(self, item):
+        """
+        Check for existence of an item in filter, probing the newest
+        (largest) filters first
+        """
+        for bloomf in reversed(self.filters):
+            if bloomf.check(item):
+                return True
+        return False
+
+    def add_many(self, items):
+        """
+        Add all the items of an iterable in the filter
+        """
+        # an item repeated in the batch is added, and counted, once
+        items = list(dict.fromkeys(bytes(mmh3.xencode(item)) for item in items))
+        found = self.check_many(items)
+        items = [item for item, present in zip(items, found) if not present]
+
+        # the items go in batches that fit in the newest filter, so that
+        # the filters are filled as by repeated add calls
+        first_filled = len(self.filters) - 1
+        while items:
+            if self.count >= self.capacities[-1]:
+                self.grow()
+            room = self.capacities[-1] - self.count
+            batch, items = items[:room], items[room:]
+            # the filters filled by the previous batches were not checked
+            # against these items
+            for bloomf in self.filters[first_filled:-1]:
+                found = bloomf.check_many(batch)
+                batch = [item for item, present in zip(batch, found) if not present]
+            self.count += int(add_new(self.filters[-1], batch).sum())
+
+    def check_many(self, items):
+        """
+        Check for existence of all the items of an iterable in filter
+        Return a boolean array, in the order of the items
+        """
+        items = list(items)
+        found = np.zeros(len(items), dtype=bool)
+        for bloomf in reversed(self.filters):
+            found |= bloomf.check_many(items)
+        return found
+
+    def grow(self):
+        """
+        Append a new filter to the chain
+        """
+        index = len(self.filters)
+        capacity = self.initial_count * self.growth ** index
+
+        # the probabilities of the chain form a geometric series whose sum
+        # is fp_prob
+        fp_prob = self.fp_prob * (1 - self.tightening) * self.tightening ** index
+
+        self.full_count += self.count
+        self.count = 0
+        self.filters.append(BloomFilter(capacity, fp_prob, scheme=self.scheme))
+        self.capacities.append(capacity)
+
+    def get_fp_bound(self):
+        """
+        Return the false positive probability of the chain once its
+        filters are full: 1 - prod(1 - p_i), always below fp_prob
+        """
+        p_none = 1.0
+        for bloomf in self.filters:
+            p_none *= 1 - bloomf.fp_prob
+        return 1 - p_none
+
+    def memory_usage(self):
+        """
+        Return the number of bytes taken by the bit arrays
+        """
+        return sum(bloomf.memory_usage() for bloomf in self.filters)
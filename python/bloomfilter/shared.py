@@ -0,0 +1,141 @@
+import multiprocessing
+import weakref
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+import numpy as np
+
+from python.bloomfilter.bitarray import BitArray
+from python.bloomfilter.bloom import (
+    HEADER,
+    SEEDED,
+    VIEWS_IN_USE,
+    BaseBloomFilter,
+    BloomFilter,
+)
+
+
+def check_shared_memory():
+    if shared_memory is None:
+        raise RuntimeError("SharedBloomFilter needs Python 3.8 or later")
+
+
+class SharedBloomFilter(BloomFilter):
+
+    """
+    Bloom filter whose bit array lives in shared memory, so that the
+    worker processes of a service share one filter
+
+    The shared memory block holds the same header and bit array as the
+    files written by BloomFilter.save, so other processes attach to it
+    with its name alone.
+
+    Concurrency: adding an item only ever sets bits, so concurrent adds
+    are idempotent OR writes, but setting a bit rewrites its whole byte.
+    Writers therefore take the filter lock around the writes (the hashing
+    is done outside of it). Reads take no lock: a check running during
+    an add of the same item may miss it, never the other way around.
+    """
+
+    def __init__(self, items_count, fp_prob, scheme=SEEDED, name=None, lock=None):
+        """
+        Create the filter in a new shared memory block.
+        See BaseBloomFilter for the arguments.
+
+        name : str
+            Name of the shared memory block, a unique name by default
+        lock : multiprocessing.Lock
+            Lock taken by the writers, a new one by default
+        """
+        check_shared_memory()
+        BaseBloomFilter.__init__(self, items_count, fp_prob, scheme)
+
+        nbytes = HEADER.size + BitArray.get_nbytes(self.size)
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=nbytes)
+        self.shm.buf[: HEADER.size] = self.pack_header()
+        self.bit_array = BitArray(self.size, self.shm.buf[HEADER.size : nbytes])
+        self.lock = multiprocessing.Lock() if lock is None else lock
+        self.mmap = None
+        self.views = weakref.WeakValueDictionary()
+
+    @classmethod
+    def attach(cls, name, lock=None):
+        """
+        Attach to a filter created in another process
+
+        lock : multiprocessing.Lock
+            Lock of the filter, inherited from the process that created
+            it. Without it, the filter is read-only.
+        """
+        check_shared_memory()
+        shm = shared_memory.SharedMemory(name=name)
+        bloomf = cls.from_buffer(shm.buf)
+        bloomf.shm = shm
+        bloomf.lock = lock
+        bloomf.views = weakref.WeakValueDictionary()
+        return bloomf
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __reduce__(self):
+        # passing the filter to a new process attaches it there
+        return (self.attach, (self.name, self.lock))
+
+    def add(self, item):
+        """
+        Add an item in the filter
+        """
+        digests = list(self.iter_digests(item))
+        with self.get_lock():
+            for digest in digests:
+                self.bit_array[digest] = 1
+
+        if self.stats is not None:
+            self.stats["add"] += 1
+
+    def add_many(self, items):
+        """
+        Add all the items of an iterable in the filter
+        """
+        digests = self.get_digests(items)
+        bits = self.get_bit_view()
+        masks = np.left_shift(1, digests & 7).astype(np.uint8)
+        with self.get_lock():
+            np.bitwise_or.at(bits, digests >> 3, masks)
+
+        if self.stats is not None:
+            self.stats["add"] += digests.shape[1]
+
+    def __ior__(self, other):
+        with self.get_lock():
+            return super(SharedBloomFilter, self).__ior__(other)
+
+    def __iand__(self, other):
+        with self.get_lock():
+            return super(SharedBloomFilter, self).__iand__(other)
+
+    def get_lock(self):
+        if self.lock is None:
+            raise ValueError("filter attached without its lock is read-only")
+        return self.lock
+
+    def close(self):
+        """
+        Detach from the shared memory block, see BloomFilter.close
+        """
+        if self.views:
+            raise BufferError(VIEWS_IN_USE)
+        self.bit_array.bytes.release()
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Destroy the shared memory block, once every process closed it
+        """
+        self.shm.unlink()
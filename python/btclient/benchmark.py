@@ -0,0 +1,226 @@
+"""Benchmarks for the bencode decoders.
+
+Run from the repository root:
+
+$> python -m python.btclient.benchmark [name ...]
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+from python.btclient.btorrent import decode, decode_bytes, decode_stream, encode
+from python.btclient.catalog import Catalog
+from python.btclient.peer import MemoryStorage, Seeder, download_torrent
+from python.btclient.verify import PieceVerifier
+
+
+def bencode_string(data):
+    return str(len(data)).encode() + b":" + data
+
+
+def make_torrent(files_count, pieces_count, piece_length=2 ** 18):
+    """Build the bytes of a multi-file torrent.
+
+    The pieces table (20 bytes per piece) is the large string of a real
+    torrent, the file list is its deep structure.
+    """
+    files = b"".join(
+        b"d6:lengthi"
+        + str(piece_length * 3 + i).encode()
+        + b"e4:pathl"
+        + bencode_string(b"dir%d" % (i % 10))
+        + bencode_string(b"file%d.bin" % i)
+        + b"ee"
+        for i in range(files_count)
+    )
+    pieces = b"".join(hashlib.sha1(b"%d" % i).digest() for i in range(pieces_count))
+    return (
+        b"d8:announce"
+        + bencode_string(b"http://tracker.example.com:6969/announce")
+        + b"4:infod5:filesl"
+        + files
+        + b"e4:name"
+        + bencode_string(b"benchmark")
+        + b"12:piece lengthi"
+        + str(piece_length).encode()
+        + b"e6:pieces"
+        + bencode_string(pieces)
+        + b"ee"
+    )
+
+
+def run(name, func, nbytes, number=5):
+    """Time func and report its throughput over nbytes of input."""
+    seconds = min(timeit.repeat(func, number=1, repeat=number))
+    print("  {:<24} {:>10.1f} MiB/s".format(name, nbytes / seconds / 2 ** 20))
+
+
+def bench_decode(sizes=((1000, 10 ** 4), (10000, 10 ** 5), (50000, 2 * 10 ** 5))):
+    """Compare decode (regex tokenizer, on text) with decode_bytes."""
+    print("decode: MiB/s by torrent size")
+    for files_count, pieces_count in sizes:
+        data = make_torrent(files_count, pieces_count)
+        # one character per byte, so that the lengths stay valid
+        text = data.decode("latin-1")
+        print(
+            " {} files, {} pieces: {:.1f} MiB".format(
+                files_count, pieces_count, len(data) / 2 ** 20
+            )
+        )
+        run("decode", lambda: decode(text), len(data))
+        run("decode_bytes", lambda: decode_bytes(data), len(data))
+
+
+def bench_views(pieces_counts=(10 ** 5, 10 ** 6), view_threshold=1024):
+    """Compare the copies of decode_bytes with the view_threshold slices."""
+    print("views: time and peak allocation, view_threshold={}".format(view_threshold))
+    for pieces_count in pieces_counts:
+        data = make_torrent(100, pieces_count)
+        print(" {} pieces: {:.1f} MiB".format(pieces_count, len(data) / 2 ** 20))
+        for name, threshold in (("copy", None), ("view", view_threshold)):
+            run(name, lambda: decode_bytes(data, threshold), len(data))
+
+            tracemalloc.start()
+            decode_bytes(data, threshold)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("  {:<24} {:>10.2f} MiB".format(name + " peak", peak / 2 ** 20))
+
+
+def bench_stream(chunk_sizes=(2 ** 12, 2 ** 16, 2 ** 20)):
+    """Compare decode_stream, by chunk size, with decode_bytes."""
+    data = make_torrent(10000, 10 ** 5)
+    print("stream: {:.1f} MiB torrent".format(len(data) / 2 ** 20))
+    run("decode_bytes", lambda: decode_bytes(data), len(data))
+    for chunk_size in chunk_sizes:
+        run(
+            "decode_stream {}".format(chunk_size),
+            lambda: list(decode_stream(io.BytesIO(data), chunk_size)),
+            len(data),
+        )
+
+
+def bench_verify(files_count=16, file_size=2 ** 22, piece_length=2 ** 18):
+    """Compare the piece verification throughput by number of threads."""
+    print(
+        "verify: {} files of {} MiB, {} KiB pieces".format(
+            files_count, file_size // 2 ** 20, piece_length // 2 ** 10
+        )
+    )
+    with tempfile.TemporaryDirectory() as root:
+        os.mkdir(os.path.join(root, "payload"))
+        files = []
+        for i in range(files_count):
+            name = "file{}.bin".format(i)
+            with open(os.path.join(root, "payload", name), "wb") as fileobj:
+                fileobj.write(os.urandom(file_size))
+            files.append({b"length": file_size, b"path": [name.encode()]})
+
+        verifier = PieceVerifier(
+            {
+                b"name": b"payload",
+                b"piece length": piece_length,
+                b"pieces": bytes(20 * files_count * file_size // piece_length),
+                b"files": files,
+            },
+            root,
+        )
+        for workers in (1, 2, 4, 8):
+            verifier.workers = workers
+            report = verifier.verify()
+            print(
+                "  {:<24} {:>10.1f} MB/s".format(
+                    "{} threads".format(workers), report.throughput
+                )
+            )
+
+
+def bench_peers(size=2 ** 24, piece_length=2 ** 18, peers=(1, 2, 4), pipelines=(1, 16)):
+    """Compare download throughput by number of local peers and pipeline depth."""
+    print("peers: {} MiB from local seeders".format(size // 2 ** 20))
+    data = os.urandom(size)
+    pieces = b"".join(
+        hashlib.sha1(data[i : i + piece_length]).digest()
+        for i in range(0, size, piece_length)
+    )
+    info = {b"name": b"payload", b"length": size, b"piece length": piece_length}
+    info[b"pieces"] = pieces
+    info_hash = hashlib.sha1(encode(info)).digest()
+
+    async def download(peers_count, pipeline):
+        seeders = [
+            Seeder(info, info_hash, MemoryStorage(0, data)) for _ in range(peers_count)
+        ]
+        try:
+            peers = [await seeder.start() for seeder in seeders]
+            return await download_torrent(info, info_hash, peers, pipeline=pipeline)
+        finally:
+            for seeder in seeders:
+                seeder.close()
+
+    for pipeline in pipelines:
+        for peers_count in peers:
+            loop = asyncio.new_event_loop()
+            result, downloaders = loop.run_until_complete(
+                download(peers_count, pipeline)
+            )
+            loop.close()
+            print(
+                "  {:<24} {:>10.1f} MB/s total, {} MB/s per peer".format(
+                    "{} peers, pipeline {}".format(peers_count, pipeline),
+                    result.throughput,
+                    " ".join(
+                        "{:.1f}".format(downloader.throughput)
+                        for downloader in downloaders
+                    ),
+                )
+            )
+
+
+def bench_catalog(torrents_count=2000, files_count=20, pieces_count=1000):
+    """Compare a full index, an incremental one and file lookups."""
+    print("catalog: {} torrents of {} files".format(torrents_count, files_count))
+    with tempfile.TemporaryDirectory() as root:
+        torrents = os.path.join(root, "torrents")
+        os.mkdir(torrents)
+        data = make_torrent(files_count, pieces_count)
+        for i in range(torrents_count):
+            path = os.path.join(torrents, "{}.torrent".format(i))
+            with open(path, "wb") as fileobj:
+                # a distinct name, hence info hash, per torrent
+                fileobj.write(data.replace(b"9:benchmark", b"9:bench%04d" % i))
+
+        catalog = Catalog(os.path.join(root, "catalog.db"))
+        for name in ("full index", "incremental index"):
+            start = timeit.default_timer()
+            catalog.update(torrents)
+            seconds = timeit.default_timer() - start
+            print(
+                "  {:<24} {:>10.1f} torrents/s".format(name, torrents_count / seconds)
+            )
+
+        number = 1000
+        seconds = timeit.timeit(lambda: catalog.find_file("file7.bin"), number=number)
+        print("  {:<24} {:>10.3f} ms".format("find file", seconds / number * 1000))
+        catalog.close()
+
+
+BENCHMARKS = {
+    "decode": bench_decode,
+    "views": bench_views,
+    "stream": bench_stream,
+    "verify": bench_verify,
+    "peers": bench_peers,
+    "catalog": bench_catalog,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -1,13 +1,42 @@
-"""Read a btorrent file.
+"""Read and write a btorrent file.
 
 A Simple BitTorrent "bencode" Decoder:
 https://effbot.org/zone/bencode.htm
+
+decode works on text through a regex tokenizer, decode_bytes works on the
+raw bytes of a .torrent file with index arithmetic. BencodeParser decodes
+a stream fed in chunks. encode and encode_to write bencode back.
+
+info_hash hashes the info dict of a torrent from its original bytes.
 """
 
+import hashlib
+import io
+import mmap
 import re
 
 START_END_REGEX = re.compile("(?P<mark>[idel])|(?P<str>\d+):|(?P<int>-?\d+)")
 
+# Byte values of the bencode marks
+INT_MARK = ord("i")
+LIST_MARK = ord("l")
+DICT_MARK = ord("d")
+END_MARK = ord("e")
+DIGITS = range(ord("0"), ord("9") + 1)
+ZERO = ord("0")
+
+# Longest integer or string length prefix kept while waiting for its end
+MAX_TOKEN = 256
+
+# Bytes first copied from a memoryview when looking for a delimiter
+FIND_CHUNK = 32
+
+# Deepest nesting of lists and dicts accepted by default by the decoders
+MAX_DEPTH = 256
+
+# Strings at least this long are not copied when computing an info hash
+INFO_VIEW_THRESHOLD = 1024
+
 
 def tokenize(file_bytes):
     """Tokenize a btorrent stream.
@@ -42,33 +71,53 @@ def tokenize(file_bytes):
             yield match.group("int")
 
 
-def decode_item(get_next, token):
-    if token == "i":
-        # integer: "i" value "e"
-        data = int(get_next())
-        if get_next() != "e":
+def decode_item(get_next, token, max_depth=None):
+    """Decode the item starting with token, reading the next tokens from get_next.
+
+    The nested containers are kept on an explicit stack, so the depth of
+    the input is only limited by max_depth (MAX_DEPTH by default).
+    """
+    if max_depth is None:
+        max_depth = MAX_DEPTH
+    stack = []  # containers being decoded, innermost last: (token, items)
+    while True:
+        if token == "i":
+            # integer: "i" value "e"
+            data = int(get_next())
+            if get_next() != "e":
+                raise ValueError
+        elif token == "s":
+            # string: "s" value (virtual tokens)
+            data = get_next()
+        elif token == "l" or token == "d":
+            # container: "l" (or "d") values "e"
+            check_depth(len(stack) + 1, max_depth)
+            stack.append((token, []))
+            token = get_next()
+            continue
+        elif token == "e" and stack:
+            token, data = stack.pop()
+            if token == "d":
+                data = dict(zip(data[0::2], data[1::2]))
+        else:
             raise ValueError
-    elif token == "s":
-        # string: "s" value (virtual tokens)
-        data = get_next()
-    elif token == "l" or token == "d":
-        # container: "l" (or "d") values "e"
-        data = []
-        tok = get_next()
-        while tok != "e":
-            data.append(decode_item(get_next, tok))
-            tok = get_next()
-        if token == "d":
-            data = dict(zip(data[0::2], data[1::2]))
-    else:
-        raise ValueError
-    return data
 
+        if not stack:
+            return data
+        stack[-1][1].append(data)
+        token = get_next()
 
-def decode(file_bytes):
+
+def decode(file_bytes, max_depth=None, max_size=None):
+    """Decode a bencoded str.
+
+    Raise SyntaxError if the input is malformed, nested deeper than
+    max_depth (MAX_DEPTH by default) or longer than max_size.
+    """
+    check_size(len(file_bytes), max_size)
     try:
         src = tokenize(file_bytes)
-        data = decode_item(src.__next__, next(src))
+        data = decode_item(src.__next__, next(src), max_depth)
         for token in src:  # look for more tokens
             raise SyntaxError("trailing junk")
     except (AttributeError, ValueError, StopIteration):
@@ -76,6 +125,422 @@ def decode(file_bytes):
     return data
 
 
+def decode_bytes(file_bytes, view_threshold=None, max_depth=None, max_size=None):
+    """Decode a bencoded bytes-like object, without tokenizing it.
+
+    Returns the same structures as decode, with bytes instead of str.
+    Buffers (bytes, bytearray, mmap, memoryview...) are read in place,
+    see get_buffer. See decode for max_depth and max_size.
+
+    With view_threshold, strings of at least view_threshold bytes are
+    returned as memoryview slices of file_bytes instead of copies (dict
+    keys are always bytes). The slices keep file_bytes alive (an mmap
+    cannot be closed before they are released), bytes(view) copies one
+    out when needed.
+
+    >>> decode_bytes(b"d3:cow3:moo4:spaml1:a1:bee")
+    {b'cow': b'moo', b'spam': [b'a', b'b']}
+    >>> decode_bytes(b"li-3ei0ee")
+    [-3, 0]
+    >>> data = decode_bytes(b"d3:cow3:moo4:spam4:eggse", view_threshold=4)
+    >>> data[b"cow"], bytes(data[b"spam"])
+    (b'moo', b'eggs')
+    """
+    file_bytes = get_buffer(file_bytes)
+    check_size(len(file_bytes), max_size)
+    view = None if view_threshold is None else memoryview(file_bytes)
+
+    try:
+        data, end = decode_bytes_item(file_bytes, 0, view, view_threshold, max_depth)
+    except (IndexError, TypeError, ValueError):
+        raise SyntaxError("syntax error")
+    if end != len(file_bytes):
+        raise SyntaxError("trailing junk")
+    return data
+
+
+def decode_bytes_item(file_bytes, i, view=None, view_threshold=None, max_depth=None):
+    """Decode the item starting at file_bytes[i].
+
+    Return the item and the index right after it. Long strings are sliced
+    from view, see decode_bytes. As in decode_item, the nested containers
+    are kept on an explicit stack.
+    """
+    if max_depth is None:
+        max_depth = MAX_DEPTH
+    stack = []  # containers being decoded, innermost last: (mark, items)
+    while True:
+        mark = file_bytes[i]
+        if mark == INT_MARK:
+            # integer: "i" value "e"
+            end = find(file_bytes, b"e", i)
+            data = parse_int(file_bytes[i + 1 : end])
+            i = end + 1
+        elif mark in DIGITS:
+            # string: length ":" value
+            colon = find(file_bytes, b":", i)
+            start = colon + 1
+            i = start + parse_int(file_bytes[i:colon], signed=False)
+            if i > len(file_bytes):
+                raise ValueError
+            if view is not None and i - start >= view_threshold:
+                data = view[start:i]
+            else:
+                data = file_bytes[start:i]
+                if not isinstance(data, bytes):
+                    # slice of a bytearray or memoryview
+                    data = bytes(data)
+        elif mark == LIST_MARK or mark == DICT_MARK:
+            # container: "l" (or "d") values "e"
+            check_depth(len(stack) + 1, max_depth)
+            stack.append((mark, []))
+            i += 1
+            continue
+        elif mark == END_MARK and stack:
+            mark, data = stack.pop()
+            if mark == DICT_MARK:
+                if len(data) % 2:
+                    raise ValueError
+                keys = [
+                    bytes(key) if isinstance(key, memoryview) else key
+                    for key in data[0::2]
+                ]
+                data = dict(zip(keys, data[1::2]))
+            i += 1
+        else:
+            raise ValueError
+
+        if not stack:
+            return data, i
+        stack[-1][1].append(data)
+
+
+def decode_with_spans(file_bytes, view_threshold=None, max_depth=None, max_size=None):
+    """Decode a bencoded dict, recording where each of its values starts and ends.
+
+    Return the dict and a dict of the (start, end) offsets of its values
+    in file_bytes, by key. See decode_bytes for the other arguments.
+
+    >>> decode_with_spans(b"d3:cow3:moo4:spaml1:a1:bee")
+    ({b'cow': b'moo', b'spam': [b'a', b'b']}, {b'cow': (6, 11), b'spam': (17, 25)})
+    """
+    file_bytes = get_buffer(file_bytes)
+    check_size(len(file_bytes), max_size)
+    max_depth = (MAX_DEPTH if max_depth is None else max_depth) - 1
+    view = None if view_threshold is None else memoryview(file_bytes)
+
+    data = {}
+    spans = {}
+    try:
+        if file_bytes[0] != DICT_MARK:
+            raise ValueError
+        i = 1
+        while file_bytes[i] != END_MARK:
+            key, i = decode_bytes_item(file_bytes, i)
+            if not isinstance(key, bytes):
+                raise ValueError
+            start = i
+            data[key], i = decode_bytes_item(
+                file_bytes, i, view, view_threshold, max_depth
+            )
+            spans[key] = (start, i)
+    except (IndexError, TypeError, ValueError):
+        raise SyntaxError("syntax error")
+    if i + 1 != len(file_bytes):
+        raise SyntaxError("trailing junk")
+    return data, spans
+
+
+def info_hash(file_bytes, hash_name="sha1"):
+    """Return the digest of the info dict of a torrent.
+
+    The info dict is hashed from its bytes in file_bytes, as the spec
+    requires, without being encoded again. hash_name is any hashlib
+    algorithm: "sha1" for the info hash, "sha256" for the v2 one (BEP 52).
+    """
+    data, spans = decode_with_spans(file_bytes, INFO_VIEW_THRESHOLD)
+    if b"info" not in spans:
+        raise ValueError("no info dict in torrent")
+    start, end = spans[b"info"]
+    with memoryview(get_buffer(file_bytes)) as view:
+        return hashlib.new(hash_name, view[start:end]).digest()
+
+
+def check_depth(depth, max_depth):
+    if depth > max_depth:
+        raise SyntaxError("nested deeper than {} levels".format(max_depth))
+
+
+def check_size(size, max_size):
+    if max_size is not None and size > max_size:
+        raise SyntaxError("larger than {} bytes".format(max_size))
+
+
+def parse_int(token, signed=True):
+    """Return the value of an integer (or, unless signed, a length) token.
+
+    Raise ValueError unless the token is canonical: int() alone would
+    also take spaces, "+" signs, "_" separators and leading zeros.
+    """
+    if not isinstance(token, bytes):
+        token = bytes(token)
+    # bytes.isdigit only takes ASCII digits, and no value but 0 may start
+    # with a zero digit, which also rules out "-0"
+    if token.isdigit():
+        if token[0] != ZERO or len(token) == 1:
+            return int(token)
+    elif signed and token[:1] == b"-" and token[1:].isdigit() and token[1] != ZERO:
+        return int(token)
+    raise ValueError
+
+
+def find(file_bytes, sub, start):
+    """Return the index of sub in file_bytes from start, or raise ValueError."""
+    if isinstance(file_bytes, memoryview):
+        # no find method: search copies of slices, small first since the
+        # delimiters follow integers and lengths of a few digits
+        size = FIND_CHUNK
+        while start < len(file_bytes):
+            index = bytes(file_bytes[start : start + size]).find(sub)
+            if index >= 0:
+                return start + index
+            # sub is a single byte, it cannot straddle two slices
+            start += size
+            size *= 2
+        raise ValueError
+    index = file_bytes.find(sub, start)
+    if index < 0:
+        raise ValueError
+    return index
+
+
+def get_buffer(file_bytes):
+    """Return the bytes of file_bytes in a form the decoders can index.
+
+    bytes, bytearray and mmap objects are returned as they are, other
+    buffers as a flat memoryview of bytes: only objects that do not
+    support the buffer protocol, and non-contiguous buffers, are copied.
+    """
+    if isinstance(file_bytes, (bytes, bytearray, mmap.mmap)):
+        return file_bytes
+    try:
+        view = memoryview(file_bytes)
+    except TypeError:
+        return bytes(file_bytes)
+    if not view.c_contiguous:
+        return view.tobytes()
+    return view.cast("B")
+
+
+class BencodeParser(object):
+
+    """Push parser decoding a bencode stream fed in chunks.
+
+    Chunks can be cut anywhere, even inside a string: the parser keeps the
+    containers being decoded, the start of a string in a buffer growing
+    with the bytes received, and the few bytes of an unfinished integer or
+    length prefix. Values are bytes, as with decode_bytes.
+
+    An object nested deeper than max_depth (MAX_DEPTH by default) or
+    longer than max_size bytes raises SyntaxError, a string as soon as
+    its length is read.
+
+    >>> parser = BencodeParser()
+    >>> parser.feed(b"d3:cow3:m")
+    []
+    >>> parser.feed(b"ooe4:sp")
+    [{b'cow': b'moo'}]
+    >>> parser.feed(b"ami4")
+    [b'spam']
+    >>> parser.feed(b"2e")
+    [42]
+    """
+
+    def __init__(self, max_depth=None, max_size=None):
+        self.max_depth = MAX_DEPTH if max_depth is None else max_depth
+        self.max_size = max_size
+
+        # containers being decoded, innermost last: (mark, items)
+        self.stack = []
+        # string being received, and the number of its bytes still missing
+        self.string = None
+        self.missing = 0
+        # start of an integer or of a length prefix cut by the chunk end
+        self.pending = b""
+        # bytes of the current top level object received before this chunk
+        self.size = 0
+        # top level objects completed by the current chunk
+        self.done = []
+
+    def feed(self, chunk):
+        """Decode a chunk of the stream.
+
+        Return the list of the top level objects completed by the chunk.
+        Raise SyntaxError on malformed input, the parser cannot be used
+        afterwards.
+        """
+        data = self.pending + chunk if self.pending else bytes(chunk)
+        self.pending = b""
+        self.done = []
+        try:
+            self.parse(data)
+        except (IndexError, TypeError, ValueError):
+            raise SyntaxError("syntax error")
+        return self.done
+
+    def parse(self, data):
+        view = memoryview(data)
+        i = 0
+        start = 0  # start of the current top level object in data
+        while i < len(data):
+            if self.string is not None:
+                # string: append the bytes received so far
+                count = min(self.missing, len(data) - i)
+                self.string += view[i : i + count]
+                self.missing -= count
+                i += count
+                if not self.missing:
+                    string, self.string = bytes(self.string), None
+                    self.push(string)
+            elif data[i] == INT_MARK or data[i] in DIGITS:
+                # integer: "i" value "e", string: length ":" value
+                mark = data[i]
+                end = data.find(b"e" if mark == INT_MARK else b":", i)
+                if end < 0:
+                    self.pending = data[i:]
+                    if len(self.pending) > MAX_TOKEN:
+                        raise ValueError
+                    break
+                token = data[i + (mark == INT_MARK) : end]
+                i = end + 1
+                if mark == INT_MARK:
+                    self.push(parse_int(token))
+                else:
+                    self.missing = parse_int(token, signed=False)
+                    check_size(self.size + i - start + self.missing, self.max_size)
+                    if i + self.missing <= len(data):
+                        # the whole string is in this chunk
+                        self.push(data[i : i + self.missing])
+                        i += self.missing
+                        self.missing = 0
+                    else:
+                        # the buffer grows with the bytes received, not
+                        # with the length announced
+                        self.string = bytearray()
+            elif data[i] == LIST_MARK or data[i] == DICT_MARK:
+                # container: "l" (or "d") values "e"
+                check_depth(len(self.stack) + 1, self.max_depth)
+                self.stack.append((data[i], []))
+                i += 1
+            elif data[i] == END_MARK and self.stack:
+                i += 1
+                mark, items = self.stack.pop()
+                if mark == DICT_MARK:
+                    if len(items) % 2:
+                        raise ValueError
+                    items = dict(zip(items[0::2], items[1::2]))
+                self.push(items)
+            else:
+                raise ValueError
+
+            if self.is_idle():
+                # a top level object ends at i
+                self.size = 0
+                start = i
+
+        self.size += i - start
+        check_size(self.size, self.max_size)
+
+    def push(self, item):
+        """Add a decoded item to its container, or to the completed objects."""
+        if self.stack:
+            self.stack[-1][1].append(item)
+        else:
+            self.done.append(item)
+
+    def is_idle(self):
+        """Return True if the parser is not in the middle of an object."""
+        return not (self.stack or self.string is not None or self.pending)
+
+
+def decode_stream(fileobj, chunk_size=2 ** 16, max_depth=None, max_size=None):
+    """Decode the bencoded objects of a binary file object or a socket.
+
+    Yield every top level object as soon as it is read, and raise
+    SyntaxError if the stream ends in the middle of one. Reads use read1,
+    or recv, which return the bytes available rather than wait for
+    chunk_size of them. See BencodeParser for max_depth and max_size.
+    """
+    read = getattr(fileobj, "read1", None) or getattr(fileobj, "recv", None)
+    read = read or fileobj.read
+    parser = BencodeParser(max_depth, max_size)
+    for chunk in iter(lambda: read(chunk_size), b""):
+        yield from parser.feed(chunk)
+    if not parser.is_idle():
+        raise SyntaxError("truncated stream")
+
+
+def encode(data):
+    """Encode bytes, str (as utf-8), int, list and dict as bencode.
+
+    >>> encode({"spam": [b"a", b"b"], "cow": "moo"})
+    b'd3:cow3:moo4:spaml1:a1:bee'
+    >>> encode([-3, 0])
+    b'li-3ei0ee'
+    """
+    fileobj = io.BytesIO()
+    encode_to(fileobj, data)
+    return fileobj.getvalue()
+
+
+def encode_to(fileobj, data):
+    """Write data as bencode to a binary file object, see encode.
+
+    Every item is written as soon as it is encoded, strings are written
+    without being copied. Dict keys are written in sorted order, as the
+    spec requires. Raise TypeError on values that have no bencode form.
+    """
+    write = fileobj.write
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        write(b"%d:" % memoryview(data).nbytes)
+        write(data)
+    elif isinstance(data, str):
+        data = data.encode("utf-8")
+        write(b"%d:" % len(data))
+        write(data)
+    elif isinstance(data, int):
+        write(b"i%de" % data)
+    elif isinstance(data, (list, tuple)):
+        write(b"l")
+        for item in data:
+            encode_to(fileobj, item)
+        write(b"e")
+    elif isinstance(data, dict):
+        items = [(encode_key(key), value) for key, value in data.items()]
+        items.sort(key=lambda item: item[0])
+        write(b"d")
+        previous = None
+        for key, value in items:
+            if key == previous:
+                raise ValueError("duplicate key {!r}".format(key))
+            previous = key
+            write(b"%d:" % len(key))
+            write(key)
+            encode_to(fileobj, value)
+        write(b"e")
+    else:
+        raise TypeError("cannot bencode {}".format(type(data).__name__))
+
+
+def encode_key(key):
+    """Return a dict key as bytes, the keys are sorted as raw strings."""
+    if isinstance(key, str):
+        return key.encode("utf-8")
+    if isinstance(key, (bytes, bytearray, memoryview)):
+        return bytes(key)
+    raise TypeError("cannot bencode a {} key".format(type(key).__name__))
+
+
 if __name__ == "__main__":
     import doctest
 
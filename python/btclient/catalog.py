@@ -0,0 +1,298 @@
+"""Index .torrent files in a SQLite catalog.
+
+The files are decoded in a process pool, and only the files whose mtime
+or size changed are decoded again when a directory is indexed a second
+time. Queries, such as the torrents holding a file, then run on indexed
+tables instead of decoding anything.
+
+$> python -m python.btclient.catalog catalog.db index torrents_dir
+$> python -m python.btclient.catalog catalog.db find file_name
+"""
+
+import concurrent.futures
+import hashlib
+import os
+import sqlite3
+import sys
+
+from python.btclient.btorrent import INFO_VIEW_THRESHOLD, decode_with_spans
+from python.btclient.tracker import get_trackers
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS torrents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    error TEXT,
+    name TEXT,
+    info_hash BLOB,
+    length INTEGER
+);
+CREATE INDEX IF NOT EXISTS torrents_info_hash ON torrents (info_hash);
+
+CREATE TABLE IF NOT EXISTS files (
+    torrent_id INTEGER NOT NULL REFERENCES torrents (id),
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_torrent_id ON files (torrent_id);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+
+CREATE TABLE IF NOT EXISTS trackers (
+    torrent_id INTEGER NOT NULL REFERENCES torrents (id),
+    tier INTEGER NOT NULL,
+    url TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trackers_torrent_id ON trackers (torrent_id);
+"""
+
+# Number of torrents sent at a time to a worker process
+CHUNK_SIZE = 64
+
+
+def to_text(value):
+    """Return a decoded string as text, refusing the other values."""
+    # bytes() would also take an int, and allocate that many bytes
+    if not isinstance(value, (bytes, memoryview)):
+        raise TypeError("expected a string, not {}".format(type(value).__name__))
+    return bytes(value).decode("utf-8", "replace")
+
+
+def to_length(value):
+    """Return a decoded file length, refusing the other values."""
+    if not isinstance(value, int) or value < 0:
+        raise ValueError("invalid length {!r}".format(value))
+    return value
+
+
+def check_trackers(metainfo):
+    """Check that the tracker URLs are strings before get_trackers decodes them."""
+    if b"announce-list" in metainfo:
+        tiers = metainfo[b"announce-list"]
+    else:
+        tiers = [[metainfo.get(b"announce", b"")]]
+    for tier in tiers:
+        for url in tier:
+            to_text(url)
+
+
+def read_torrent(path):
+    """Decode a .torrent file into the fields of the catalog.
+
+    Return a dict with the name, info_hash, length, files as (path,
+    length) and trackers as tiers of URLs, or with an error if the file
+    cannot be read. Runs in the worker processes.
+    """
+    try:
+        with open(path, "rb") as fileobj:
+            data = fileobj.read()
+        metainfo, spans = decode_with_spans(data, INFO_VIEW_THRESHOLD)
+        info = metainfo[b"info"]
+        start, end = spans[b"info"]
+        name = to_text(info[b"name"])
+        if b"files" in info:
+            files = [
+                (
+                    "/".join(to_text(part) for part in entry[b"path"]),
+                    to_length(entry[b"length"]),
+                )
+                for entry in info[b"files"]
+            ]
+        else:
+            files = [(name, to_length(info[b"length"]))]
+        check_trackers(metainfo)
+        return {
+            "name": name,
+            "info_hash": hashlib.sha1(memoryview(data)[start:end]).digest(),
+            "length": sum(length for _, length in files),
+            "files": files,
+            "trackers": get_trackers(metainfo),
+        }
+    except (OSError, SyntaxError, KeyError, TypeError, ValueError) as exc:
+        # one malformed file is recorded as failed, the others are indexed
+        return {"error": "{}: {}".format(type(exc).__name__, exc)}
+
+
+def find_torrents(root):
+    """Return the (path, mtime_ns, size) of the .torrent files under root."""
+    found = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(".torrent"):
+                path = os.path.join(dirpath, filename)
+                stat = os.stat(path)
+                found.append((path, stat.st_mtime_ns, stat.st_size))
+    return found
+
+
+class Catalog(object):
+
+    """
+    SQLite index of the name, info hash, total size, files and trackers of
+    .torrent files
+    """
+
+    def __init__(self, path):
+        """
+        path : str
+            SQLite database file, created if needed (":memory:" works too)
+        """
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def update(self, root, workers=None):
+        """
+        Index the .torrent files under root
+
+        Only the files that are new, or whose mtime or size changed, are
+        decoded, on workers processes (one per CPU by default, in this
+        process if workers is 1). The files removed from root are removed
+        from the catalog. Return the number of torrents "added",
+        "updated", "removed", "unchanged" and "failed".
+        """
+        root = os.path.abspath(root)
+        known = {
+            path: (torrent_id, mtime_ns, size)
+            for torrent_id, path, mtime_ns, size in self.db.execute(
+                "SELECT id, path, mtime_ns, size FROM torrents"
+            )
+            if path.startswith(os.path.join(root, ""))
+        }
+        found = find_torrents(root)
+        changed = [
+            entry for entry in found if known.get(entry[0], (None,))[1:] != entry[1:]
+        ]
+        removed = set(known) - {path for path, _, _ in found}
+
+        paths = [path for path, _, _ in changed]
+        if workers == 1:
+            records = map(read_torrent, paths)
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(workers)
+            records = executor.map(read_torrent, paths, chunksize=CHUNK_SIZE)
+
+        counts = dict(added=0, updated=0, removed=len(removed), failed=0)
+        counts["unchanged"] = len(found) - len(changed)
+        try:
+            with self.db:
+                for path in removed:
+                    self.delete(known[path][0])
+                for (path, mtime_ns, size), record in zip(changed, records):
+                    if path in known:
+                        self.delete(known[path][0])
+                        counts["updated"] += 1
+                    else:
+                        counts["added"] += 1
+                    if "error" in record:
+                        counts["failed"] += 1
+                    self.insert(path, mtime_ns, size, record)
+        finally:
+            if workers != 1:
+                executor.shutdown()
+        return counts
+
+    def insert(self, path, mtime_ns, size, record):
+        cursor = self.db.execute(
+            "INSERT INTO torrents"
+            " (path, mtime_ns, size, error, name, info_hash, length)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                path,
+                mtime_ns,
+                size,
+                record.get("error"),
+                record.get("name"),
+                record.get("info_hash"),
+                record.get("length"),
+            ),
+        )
+        torrent_id = cursor.lastrowid
+        self.db.executemany(
+            "INSERT INTO files (torrent_id, path, name, length) VALUES (?, ?, ?, ?)",
+            [
+                (torrent_id, file_path, file_path.rpartition("/")[2], length)
+                for file_path, length in record.get("files", [])
+            ],
+        )
+        self.db.executemany(
+            "INSERT INTO trackers (torrent_id, tier, url) VALUES (?, ?, ?)",
+            [
+                (torrent_id, tier, url)
+                for tier, urls in enumerate(record.get("trackers", []))
+                for url in urls
+            ],
+        )
+
+    def delete(self, torrent_id):
+        for table in ("files", "trackers"):
+            self.db.execute(
+                "DELETE FROM {} WHERE torrent_id = ?".format(table), (torrent_id,)
+            )
+        self.db.execute("DELETE FROM torrents WHERE id = ?", (torrent_id,))
+
+    def find_file(self, name):
+        """
+        Return the (torrent path, torrent name, file path, file length) of
+        the files named name, or whose path in their torrent is name
+        """
+        return self.db.execute(
+            "SELECT torrents.path, torrents.name, files.path, files.length"
+            " FROM files JOIN torrents ON torrents.id = files.torrent_id"
+            " WHERE files.name = ?1 OR files.path = ?1"
+            " ORDER BY torrents.path, files.path",
+            (name,),
+        ).fetchall()
+
+    def get(self, info_hash):
+        """
+        Return the torrent with info_hash as a dict, or None
+        """
+        row = self.db.execute(
+            "SELECT id, path, name, length FROM torrents WHERE info_hash = ?",
+            (info_hash,),
+        ).fetchone()
+        if row is None:
+            return None
+        torrent_id, path, name, length = row
+        files = self.db.execute(
+            "SELECT path, length FROM files WHERE torrent_id = ? ORDER BY rowid",
+            (torrent_id,),
+        ).fetchall()
+        trackers = {}
+        for tier, url in self.db.execute(
+            "SELECT tier, url FROM trackers WHERE torrent_id = ? ORDER BY rowid",
+            (torrent_id,),
+        ):
+            trackers.setdefault(tier, []).append(url)
+        return {
+            "path": path,
+            "name": name,
+            "info_hash": info_hash,
+            "length": length,
+            "files": files,
+            "trackers": [trackers[tier] for tier in sorted(trackers)],
+        }
+
+    def get_errors(self):
+        """
+        Return the (path, error) of the files that could not be decoded
+        """
+        return self.db.execute(
+            "SELECT path, error FROM torrents WHERE error IS NOT NULL ORDER BY path"
+        ).fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    catalog = Catalog(sys.argv[1])
+    if sys.argv[2] == "index":
+        print(catalog.update(sys.argv[3]))
+    elif sys.argv[2] == "find":
+        for row in catalog.find_file(sys.argv[3]):
+            print(*row, sep="\t")
+    catalog.close()
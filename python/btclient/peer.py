@@ -0,0 +1,533 @@
+"""Download the pieces of a torrent from its peers, with asyncio.
+
+The peer wire protocol of BEP 3: handshake, bitfield, have, request,
+piece and keep-alive messages. Every peer keeps several block requests
+in flight, blocks are written into piece buffers allocated once and
+reused, and every piece is checked against the pieces table before it
+is stored.
+
+Seeder serves the pieces of a complete torrent, to test and benchmark
+downloads against local peers.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import os
+import struct
+import time
+
+from python.btclient.tracker import make_peer_id
+from python.btclient.verify import DIGEST_SIZE, get_files
+
+PROTOCOL = b"BitTorrent protocol"
+HANDSHAKE = struct.Struct(">B19s8x20s20s")
+
+# Message ids
+CHOKE, UNCHOKE, INTERESTED, NOT_INTERESTED, HAVE = range(5)
+BITFIELD, REQUEST, PIECE, CANCEL = range(5, 9)
+
+# Size of the blocks pieces are requested in
+BLOCK_SIZE = 2 ** 14
+# Number of block requests in flight per peer
+PIPELINE = 16
+# Largest message accepted from a peer
+MAX_MESSAGE_SIZE = 2 ** 21
+# Number of pieces failing their hash check after which a peer is dropped
+MAX_BAD_PIECES = 3
+# Seconds of silence before a keep-alive is sent
+KEEPALIVE_INTERVAL = 120
+
+REQUEST_STRUCT = struct.Struct(">III")
+
+
+class PeerError(Exception):
+
+    """
+    A peer broke the protocol
+    """
+
+
+def get_total_length(info):
+    """Return the number of bytes of the files of a torrent."""
+    return sum(length for _, length in get_files(info, ""))
+
+
+class MemoryStorage(object):
+
+    """
+    Torrent data held in one bytearray
+    """
+
+    def __init__(self, length, data=None):
+        self.data = bytearray(length) if data is None else data
+
+    def write(self, offset, data):
+        self.data[offset : offset + len(data)] = data
+
+    def read(self, offset, length):
+        return bytes(self.data[offset : offset + length])
+
+    def close(self):
+        pass
+
+
+class FileStorage(object):
+
+    """
+    Torrent data in the files of the torrent, under root
+    """
+
+    def __init__(self, info, root):
+        self.files = []
+        offset = 0
+        for path, length in get_files(info, root):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fileobj = open(path, "r+b" if os.path.exists(path) else "w+b")
+            fileobj.truncate(length)
+            self.files.append((offset, length, fileobj))
+            offset += length
+
+    def parts(self, offset, length):
+        """Yield the file object, file offset and size of every part of a range."""
+        for start, size, fileobj in self.files:
+            if start + size <= offset or not size:
+                continue
+            if start >= offset + length:
+                break
+            begin = max(offset, start)
+            end = min(offset + length, start + size)
+            yield fileobj, begin - start, begin - offset, end - begin
+
+    def write(self, offset, data):
+        data = memoryview(data)
+        for fileobj, position, start, size in self.parts(offset, len(data)):
+            fileobj.seek(position)
+            fileobj.write(data[start : start + size])
+
+    def read(self, offset, length):
+        data = bytearray(length)
+        for fileobj, position, start, size in self.parts(offset, length):
+            fileobj.seek(position)
+            fileobj.readinto(memoryview(data)[start : start + size])
+        return bytes(data)
+
+    def close(self):
+        for _, _, fileobj in self.files:
+            fileobj.close()
+
+
+class PeerConnection(object):
+
+    """
+    Messages of the peer wire protocol over an asyncio stream
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_sent = time.monotonic()
+
+    async def handshake(self, info_hash, peer_id, initiate=True):
+        """
+        Exchange handshakes, return the id of the remote peer. The side
+        that did not initiate the connection checks the info hash before
+        answering.
+        """
+        if initiate:
+            self.send_handshake(info_hash, peer_id)
+        data = await self.reader.readexactly(HANDSHAKE.size)
+        length, protocol, remote_hash, remote_id = HANDSHAKE.unpack(data)
+        if length != len(PROTOCOL) or protocol != PROTOCOL:
+            raise PeerError("not a BitTorrent peer")
+        if remote_hash != info_hash:
+            raise PeerError("peer serves another torrent")
+        if not initiate:
+            self.send_handshake(info_hash, peer_id)
+        return remote_id
+
+    def send_handshake(self, info_hash, peer_id):
+        self.writer.write(HANDSHAKE.pack(len(PROTOCOL), PROTOCOL, info_hash, peer_id))
+
+    def send(self, message_id, payload=b""):
+        self.writer.write(struct.pack(">IB", len(payload) + 1, message_id) + payload)
+        self.last_sent = time.monotonic()
+
+    def send_keepalive(self):
+        self.writer.write(b"\0\0\0\0")
+        self.last_sent = time.monotonic()
+
+    async def receive(self):
+        """
+        Read a message, return its id and payload. Keep-alives are skipped.
+        """
+        while True:
+            (length,) = struct.unpack(">I", await self.reader.readexactly(4))
+            if length > MAX_MESSAGE_SIZE:
+                raise PeerError("message of {} bytes".format(length))
+            if length:
+                data = await self.reader.readexactly(length)
+                return data[0], data[1:]
+
+    async def keepalive(self, interval=KEEPALIVE_INTERVAL):
+        """
+        Send keep-alives while the connection is idle, until cancelled
+        """
+        while True:
+            await asyncio.sleep(interval - (time.monotonic() - self.last_sent))
+            if time.monotonic() - self.last_sent >= interval:
+                self.send_keepalive()
+                await self.writer.drain()
+
+    def close(self):
+        self.writer.close()
+
+
+class Download(object):
+
+    """
+    Pieces of a torrent, shared by the peers it is downloaded from
+
+    Peers take the missing pieces one at a time with start_piece, and give
+    them back with finish_piece, which checks their hash and stores them.
+    """
+
+    def __init__(self, info, storage=None):
+        """
+        info : dict
+            Info dict of the torrent, decoded by decode_bytes
+        storage : MemoryStorage or FileStorage
+            Where the verified pieces are written, in memory by default
+        """
+        self.piece_length = info[b"piece length"]
+        self.hashes = info[b"pieces"]
+        self.length = get_total_length(info)
+        self.pieces_count = len(self.hashes) // DIGEST_SIZE
+        self.storage = MemoryStorage(self.length) if storage is None else storage
+
+        self.have = bytearray(self.pieces_count)
+        self.missing = self.pieces_count
+        self.in_progress = set()
+        self.cursor = 0
+        # piece buffers ready for reuse
+        self.buffers = []
+
+        self.downloaded = 0
+        self.failed = 0
+        self.start_time = time.monotonic()
+        self.end_time = None
+        self.changed = None
+
+    def get_piece_size(self, index):
+        if index == self.pieces_count - 1:
+            return self.length - index * self.piece_length
+        return self.piece_length
+
+    def is_complete(self):
+        return not self.missing
+
+    def start_piece(self, has_piece):
+        """
+        Take a missing piece for which has_piece(index) is true, return its
+        index and a buffer for it, or None if there is none
+        """
+        # pieces are taken in order, the scan starts after the last one
+        indexes = itertools.chain(
+            range(self.cursor, self.pieces_count), range(self.cursor)
+        )
+        for index in indexes:
+            if not self.have[index] and index not in self.in_progress:
+                if has_piece(index):
+                    self.cursor = index + 1
+                    self.in_progress.add(index)
+                    buffer = self.buffers.pop() if self.buffers else None
+                    if buffer is None:
+                        buffer = memoryview(bytearray(self.piece_length))
+                    return index, buffer
+        return None
+
+    def finish_piece(self, index, buffer, complete=True):
+        """
+        Give back a piece taken with start_piece. If complete, check its
+        hash and store it. Return True if the piece was stored.
+        """
+        self.in_progress.discard(index)
+        stored = False
+        if complete:
+            data = buffer[: self.get_piece_size(index)]
+            expected = self.hashes[DIGEST_SIZE * index : DIGEST_SIZE * (index + 1)]
+            if hashlib.sha1(data).digest() == expected:
+                self.storage.write(index * self.piece_length, data)
+                self.have[index] = 1
+                self.missing -= 1
+                self.downloaded += len(data)
+                stored = True
+                if not self.missing:
+                    self.end_time = time.monotonic()
+            else:
+                self.failed += 1
+        self.buffers.append(buffer)
+        self.notify()
+        return stored
+
+    def notify(self):
+        """
+        Wake up the peers waiting for a piece to be given back
+        """
+        if self.changed is not None:
+            self.changed.set()
+            self.changed = None
+
+    def get_changed(self):
+        """
+        Return an event set the next time a piece is given back
+        """
+        if self.changed is None:
+            self.changed = asyncio.Event()
+        return self.changed
+
+    @property
+    def throughput(self):
+        """Bytes stored per second, in MB/s"""
+        seconds = (self.end_time or time.monotonic()) - self.start_time
+        return self.downloaded / seconds / 1e6 if seconds else 0.0
+
+
+class PeerDownloader(object):
+
+    """
+    Download pieces from one peer, keeping up to pipeline block requests
+    in flight
+    """
+
+    def __init__(self, download, info_hash, peer_id, pipeline=PIPELINE):
+        self.download = download
+        self.info_hash = info_hash
+        self.peer_id = peer_id
+        self.pipeline = pipeline
+
+        self.bitfield = bytearray((download.pieces_count + 7) // 8)
+        self.choked = True
+        # pieces being downloaded: index -> [buffer, offsets of the blocks
+        # left to request, number of bytes left to receive]
+        self.active = {}
+        # requests in flight: (index, begin, length)
+        self.requested = set()
+
+        self.downloaded = 0
+        self.bad_pieces = 0
+        self.seconds = 0.0
+
+    def has_piece(self, index):
+        return self.bitfield[index >> 3] >> (7 - (index & 7)) & 1
+
+    async def run(self, host, port):
+        """
+        Connect to the peer and download from it until the torrent is
+        complete. The pieces in progress are given back if the connection
+        fails.
+        """
+        start_time = time.monotonic()
+        reader, writer = await asyncio.open_connection(host, port)
+        connection = PeerConnection(reader, writer)
+        keepalive = asyncio.ensure_future(connection.keepalive())
+        try:
+            await connection.handshake(self.info_hash, self.peer_id)
+            connection.send(INTERESTED)
+            await self.exchange(connection)
+        finally:
+            keepalive.cancel()
+            connection.close()
+            for index, (buffer, _, _) in self.active.items():
+                self.download.finish_piece(index, buffer, complete=False)
+            self.active = {}
+            self.seconds = time.monotonic() - start_time
+
+    async def exchange(self, connection):
+        receive = None
+        while not self.download.is_complete():
+            # taken before looking for blocks, so that no piece given back
+            # in the meantime is missed
+            changed = self.download.get_changed()
+            self.send_requests(connection)
+            await connection.writer.drain()
+
+            if receive is None:
+                receive = asyncio.ensure_future(connection.receive())
+            if not self.requested:
+                # nothing left to ask this peer, or choked by it: wait for
+                # another peer to give a piece back or complete the
+                # torrent, or for a have or unchoke message
+                waiter = asyncio.ensure_future(changed.wait())
+                await asyncio.wait(
+                    [receive, waiter], return_when=asyncio.FIRST_COMPLETED
+                )
+                waiter.cancel()
+                if not receive.done():
+                    continue
+
+            message_id, payload = await receive
+            receive = None
+            self.handle(message_id, payload)
+        if receive is not None:
+            receive.cancel()
+
+    def send_requests(self, connection):
+        if self.choked:
+            return
+        while len(self.requested) < self.pipeline:
+            block = self.next_block()
+            if block is None:
+                return
+            self.requested.add(block)
+            connection.send(REQUEST, REQUEST_STRUCT.pack(*block))
+
+    def next_block(self):
+        """
+        Return the (index, begin, length) of the next block to request
+        """
+        for index, (_, offsets, _) in self.active.items():
+            if offsets:
+                begin = offsets.pop()
+                return index, begin, self.get_block_size(index, begin)
+
+        piece = self.download.start_piece(self.has_piece)
+        if piece is None:
+            return None
+        index, buffer = piece
+        size = self.download.get_piece_size(index)
+        offsets = list(range(0, size, BLOCK_SIZE))[::-1]
+        self.active[index] = [buffer, offsets, size]
+        return self.next_block()
+
+    def get_block_size(self, index, begin):
+        return min(BLOCK_SIZE, self.download.get_piece_size(index) - begin)
+
+    def handle(self, message_id, payload):
+        if message_id == PIECE:
+            if len(payload) < 8:
+                raise PeerError("piece of {} bytes".format(len(payload)))
+            index, begin = struct.unpack_from(">II", payload)
+            block = (index, begin, len(payload) - 8)
+            if block not in self.requested:
+                return  # not requested, or cancelled by a choke
+            self.requested.discard(block)
+            state = self.active[index]
+            state[0][begin : begin + block[2]] = memoryview(payload)[8:]
+            state[2] -= block[2]
+            self.downloaded += block[2]
+            if not state[2]:
+                del self.active[index]
+                if not self.download.finish_piece(index, state[0]):
+                    self.bad_pieces += 1
+                    if self.bad_pieces >= MAX_BAD_PIECES:
+                        raise PeerError("{} bad pieces".format(self.bad_pieces))
+        elif message_id == BITFIELD:
+            if len(payload) != len(self.bitfield):
+                raise PeerError("bitfield of {} bytes".format(len(payload)))
+            self.bitfield[:] = payload
+        elif message_id == HAVE:
+            if len(payload) != 4:
+                raise PeerError("have of {} bytes".format(len(payload)))
+            (index,) = struct.unpack(">I", payload)
+            if index >= self.download.pieces_count:
+                raise PeerError("have for piece {}".format(index))
+            self.bitfield[index >> 3] |= 0x80 >> (index & 7)
+        elif message_id == UNCHOKE:
+            self.choked = False
+        elif message_id == CHOKE:
+            # the peer drops the requests in flight, ask them again later
+            self.choked = True
+            for index, begin, _ in self.requested:
+                self.active[index][1].append(begin)
+            self.requested = set()
+
+    @property
+    def throughput(self):
+        """Bytes received per second from the peer, in MB/s"""
+        return self.downloaded / self.seconds / 1e6 if self.seconds else 0.0
+
+
+async def download_torrent(
+    info, info_hash, peers, storage=None, peer_id=None, pipeline=PIPELINE
+):
+    """
+    Download a torrent from peers, given as (host, port)
+
+    Return the Download and the PeerDownloader of every peer. The peers
+    that fail are dropped, the download stops when the torrent is
+    complete or no peer is left.
+    """
+    download = Download(info, storage)
+    peer_id = make_peer_id() if peer_id is None else peer_id
+    downloaders = [
+        PeerDownloader(download, info_hash, peer_id, pipeline) for _ in peers
+    ]
+    results = await asyncio.gather(
+        *(
+            downloader.run(host, port)
+            for downloader, (host, port) in zip(downloaders, peers)
+        ),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(
+            result, (OSError, PeerError, asyncio.IncompleteReadError)
+        ):
+            raise result
+    return download, downloaders
+
+
+class Seeder(object):
+
+    """
+    Peer serving every piece of a complete torrent
+    """
+
+    def __init__(self, info, info_hash, storage, peer_id=None):
+        self.info_hash = info_hash
+        self.storage = storage
+        self.piece_length = info[b"piece length"]
+        self.pieces_count = len(info[b"pieces"]) // DIGEST_SIZE
+        self.peer_id = make_peer_id() if peer_id is None else peer_id
+        self.server = None
+        self.uploaded = 0
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Listen for peers, return the (host, port) of the seeder
+        """
+        self.server = await asyncio.start_server(self.serve, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def serve(self, reader, writer):
+        connection = PeerConnection(reader, writer)
+        try:
+            await connection.handshake(self.info_hash, self.peer_id, initiate=False)
+            bitfield = bytearray(b"\xff" * ((self.pieces_count + 7) // 8))
+            if self.pieces_count % 8:
+                bitfield[-1] = 0xFF << (8 - self.pieces_count % 8) & 0xFF
+            connection.send(BITFIELD, bytes(bitfield))
+
+            while True:
+                message_id, payload = await connection.receive()
+                if message_id == INTERESTED:
+                    connection.send(UNCHOKE)
+                elif message_id == REQUEST:
+                    if len(payload) != REQUEST_STRUCT.size:
+                        raise PeerError("request of {} bytes".format(len(payload)))
+                    index, begin, length = REQUEST_STRUCT.unpack(payload)
+                    if length > BLOCK_SIZE or index >= self.pieces_count:
+                        raise PeerError("bad request")
+                    offset = index * self.piece_length + begin
+                    block = self.storage.read(offset, length)
+                    connection.send(PIECE, struct.pack(">II", index, begin) + block)
+                    self.uploaded += length
+                await writer.drain()
+        except (OSError, PeerError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            connection.close()
+
+    def close(self):
+        self.server.close()
@@ -0,0 +1,547 @@
+"""Announce torrents to their trackers, with asyncio.
+
+HTTP trackers (BEP 3, with the compact peer lists of BEP 23 and BEP 7)
+and UDP trackers (BEP 15). TrackerClient keeps the HTTP connections and
+the UDP connection ids of every tracker host for the next requests, and
+caps the number of requests in flight.
+"""
+
+import asyncio
+import ipaddress
+import os
+import random
+import struct
+import urllib.parse
+
+from python.btclient.btorrent import decode_bytes
+
+# UDP tracker protocol (BEP 15)
+UDP_PROTOCOL_ID = 0x41727101980
+CONNECT, ANNOUNCE, SCRAPE, ERROR = range(4)
+UDP_EVENTS = {"": 0, "completed": 1, "started": 2, "stopped": 3}
+# A connection id can be used for one minute
+UDP_CONNECTION_TTL = 60
+# Most info hashes a UDP scrape request can hold
+UDP_SCRAPE_BATCH = 74
+
+# Most info hashes sent in one HTTP scrape request, to keep URLs short
+HTTP_SCRAPE_BATCH = 50
+
+PEER = struct.Struct(">4sH")
+PEER6 = struct.Struct(">16sH")
+
+
+class TrackerError(Exception):
+
+    """
+    The tracker refused a request, or its answer could not be read
+    """
+
+
+def get_trackers(metainfo):
+    """Return the tiers of tracker URLs of a torrent, decoded by decode_bytes.
+
+    >>> get_trackers({b"announce": b"udp://tracker:80"})
+    [['udp://tracker:80']]
+    """
+    if b"announce-list" in metainfo:
+        return [
+            [bytes(url).decode() for url in tier]
+            for tier in metainfo[b"announce-list"]
+            if tier
+        ]
+    if b"announce" in metainfo:
+        return [[bytes(metainfo[b"announce"]).decode()]]
+    return []
+
+
+def get_scrape_url(url):
+    """Return the scrape URL of an HTTP announce URL, or None (BEP 48).
+
+    >>> get_scrape_url("http://tracker/announce?key=1")
+    'http://tracker/scrape?key=1'
+    """
+    parts = urllib.parse.urlsplit(url)
+    head, _, last = parts.path.rpartition("/")
+    if not last.startswith("announce"):
+        return None
+    path = head + "/scrape" + last[len("announce") :]
+    return urllib.parse.urlunsplit(parts._replace(path=path))
+
+
+def parse_peers(peers, peer_struct=PEER):
+    """Return the (ip, port) of a compact or a dict peer list."""
+    if isinstance(peers, list):
+        return [(bytes(peer[b"ip"]).decode(), peer[b"port"]) for peer in peers]
+    return [
+        (str(ipaddress.ip_address(ip)), port)
+        for ip, port in peer_struct.iter_unpack(bytes(peers))
+    ]
+
+
+def make_peer_id():
+    """Return a random peer id, in the Azureus style"""
+    return b"-PY0001-" + os.urandom(12)
+
+
+class HTTPTracker(object):
+
+    """
+    HTTP connections to a tracker host, reused between requests
+    """
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        # connections ready for a new request: (reader, writer)
+        self.idle = []
+        # number of connections opened, for the tests and statistics
+        self.opened = 0
+
+    async def get(self, url):
+        """
+        Send a GET request, return the body of the response
+        """
+        parts = urllib.parse.urlsplit(url)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        request = (
+            "GET {} HTTP/1.1\r\nHost: {}\r\nConnection: keep-alive\r\n\r\n".format(
+                target, parts.netloc
+            ).encode()
+        )
+
+        while self.idle:
+            # a pooled connection may have been closed by the tracker since
+            reader, writer = self.idle.pop()
+            try:
+                return await self.send(reader, writer, request)
+            except (OSError, asyncio.IncompleteReadError):
+                writer.close()
+
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        self.opened += 1
+        try:
+            return await self.send(reader, writer, request)
+        except asyncio.IncompleteReadError:
+            raise TrackerError("connection closed by {}".format(self.host))
+
+    async def send(self, reader, writer, request):
+        try:
+            writer.write(request)
+            code, body, keep_alive = await asyncio.wait_for(
+                self.read_response(reader), self.timeout
+            )
+        except BaseException:
+            writer.close()
+            raise
+
+        if keep_alive:
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+        if code != 200:
+            raise TrackerError("HTTP status {}".format(code))
+        return body
+
+    @staticmethod
+    async def read_response(reader):
+        """
+        Read a response, return its status code, its body and whether the
+        connection can be reused
+        """
+        status = await reader.readline()
+        if not status:
+            raise asyncio.IncompleteReadError(status, None)
+        version, code = status.split(None, 2)[:2]
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        keep_alive = version == b"HTTP/1.1" and headers.get(b"connection") != b"close"
+        if b"content-length" in headers:
+            body = await reader.readexactly(int(headers[b"content-length"]))
+        elif headers.get(b"transfer-encoding") == b"chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if not size:
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # trailers
+            body = b"".join(chunks)
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return int(code), body, keep_alive
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+class UDPTrackerProtocol(asyncio.DatagramProtocol):
+
+    """
+    Match the datagrams of a UDP tracker with the requests waiting for
+    them, by transaction id
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.waiters = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 8:
+            return
+        action, transaction_id = struct.unpack_from(">II", data)
+        waiter = self.waiters.pop(transaction_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result((action, data[8:]))
+
+    def error_received(self, exc):
+        self.fail(exc)
+
+    def connection_lost(self, exc):
+        self.fail(exc or ConnectionError("connection closed"))
+
+    def fail(self, exc):
+        for waiter in self.waiters.values():
+            if not waiter.done():
+                waiter.set_exception(exc)
+        self.waiters = {}
+
+
+class UDPTracker(object):
+
+    """
+    UDP socket and connection id of a tracker host, shared by every
+    request to it (BEP 15)
+    """
+
+    def __init__(self, host, port, timeout, retries):
+        """
+        timeout : float
+            Seconds before the first retransmission, doubled for every
+            following one (BEP 15 uses 15)
+        retries : int
+            Number of retransmissions before giving up
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.protocol = None
+        self.connection_id = None
+        self.expiry = 0
+        self.lock = None
+
+    async def request(self, action, payload):
+        """
+        Send a request, connecting first if needed, return the body of the
+        response
+        """
+        loop = asyncio.get_event_loop()
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if self.protocol is None:
+                _, self.protocol = await loop.create_datagram_endpoint(
+                    UDPTrackerProtocol, remote_addr=(self.host, self.port)
+                )
+            if self.connection_id is None or loop.time() > self.expiry:
+                body = await self.send(UDP_PROTOCOL_ID, CONNECT, b"")
+                (self.connection_id,) = struct.unpack_from(">Q", body)
+                self.expiry = loop.time() + UDP_CONNECTION_TTL
+        return await self.send(self.connection_id, action, payload)
+
+    async def send(self, connection_id, action, payload):
+        loop = asyncio.get_event_loop()
+        for attempt in range(self.retries + 1):
+            transaction_id = random.getrandbits(32)
+            waiter = loop.create_future()
+            self.protocol.waiters[transaction_id] = waiter
+            self.protocol.transport.sendto(
+                struct.pack(">QII", connection_id, action, transaction_id) + payload
+            )
+            try:
+                reply, body = await asyncio.wait_for(
+                    waiter, self.timeout * 2 ** attempt
+                )
+            except asyncio.TimeoutError:
+                self.protocol.waiters.pop(transaction_id, None)
+                continue
+
+            if reply == ERROR:
+                raise TrackerError(body.decode("utf-8", "replace"))
+            if reply != action:
+                raise TrackerError("unexpected action {}".format(reply))
+            return body
+        raise TrackerError("no answer from {}:{}".format(self.host, self.port))
+
+    def close(self):
+        if self.protocol is not None:
+            self.protocol.transport.close()
+            self.protocol = None
+
+
+class TrackerClient(object):
+
+    """
+    Announce torrents to HTTP and UDP trackers
+
+    Connections are kept per tracker host, and at most max_concurrency
+    requests are in flight at a time.
+    """
+
+    def __init__(
+        self, peer_id=None, port=6881, max_concurrency=64, timeout=15, retries=3
+    ):
+        """
+        peer_id : bytes
+            20 bytes id of the client, random by default
+        port : int
+            Port the client accepts peers on
+        max_concurrency : int
+            Most requests in flight
+        timeout : float
+            Seconds to wait for a tracker, see UDPTracker for UDP
+        retries : int
+            Number of UDP retransmissions
+        """
+        self.peer_id = make_peer_id() if peer_id is None else peer_id
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.key = random.getrandbits(32)
+        # the semaphore is created in the event loop, on the first request
+        self.semaphore = None
+        self.trackers = {}
+
+    def get_tracker(self, url):
+        """
+        Return the HTTPTracker or UDPTracker of the host of url
+        """
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https", "udp"):
+            raise ValueError("unsupported tracker url {}".format(url))
+        if parts.scheme == "https":
+            raise ValueError("https trackers are not supported")
+
+        key = (parts.scheme, parts.hostname, parts.port)
+        if key not in self.trackers:
+            if parts.scheme == "udp":
+                self.trackers[key] = UDPTracker(
+                    parts.hostname, parts.port, self.timeout, self.retries
+                )
+            else:
+                self.trackers[key] = HTTPTracker(
+                    parts.hostname, parts.port or 80, self.timeout
+                )
+        return self.trackers[key]
+
+    async def limit(self, coroutine):
+        """
+        Run coroutine once fewer than max_concurrency requests are in flight
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            return await coroutine
+
+    async def announce(
+        self, url, info_hash, left=0, uploaded=0, downloaded=0, event="", numwant=50
+    ):
+        """
+        Announce a torrent to the tracker at url
+
+        Return a dict with the "interval" in seconds before the next
+        announce, the "peers" as (ip, port), and the number of seeders
+        ("complete") and leechers ("incomplete").
+        """
+        tracker = self.get_tracker(url)
+        if isinstance(tracker, UDPTracker):
+            payload = struct.pack(
+                ">20s20sQQQIIIiH",
+                info_hash,
+                self.peer_id,
+                downloaded,
+                left,
+                uploaded,
+                UDP_EVENTS[event],
+                0,
+                self.key,
+                numwant,
+                self.port,
+            )
+            body = await self.limit(tracker.request(ANNOUNCE, payload))
+            interval, incomplete, complete = struct.unpack_from(">III", body)
+            return {
+                "interval": interval,
+                "complete": complete,
+                "incomplete": incomplete,
+                "peers": parse_peers(body[12:]),
+            }
+
+        query = {
+            "info_hash": info_hash,
+            "peer_id": self.peer_id,
+            "port": self.port,
+            "uploaded": uploaded,
+            "downloaded": downloaded,
+            "left": left,
+            "compact": 1,
+            "numwant": numwant,
+            "key": "{:08x}".format(self.key),
+        }
+        if event:
+            query["event"] = event
+        response = await self.limit(tracker.get(add_query(url, query)))
+        response = self.decode(response)
+        peers = parse_peers(response.get(b"peers", b""))
+        peers += parse_peers(response.get(b"peers6", b""), PEER6)
+        return {
+            "interval": response.get(b"interval", 0),
+            "complete": response.get(b"complete", 0),
+            "incomplete": response.get(b"incomplete", 0),
+            "peers": peers,
+        }
+
+    async def scrape(self, url, info_hashes):
+        """
+        Scrape the tracker at url for torrents, batching their info hashes
+
+        Return a dict of {"complete", "downloaded", "incomplete"} dicts by
+        info hash, for the torrents known to the tracker.
+        """
+        tracker = self.get_tracker(url)
+        info_hashes = list(info_hashes)
+        batch = (
+            UDP_SCRAPE_BATCH if isinstance(tracker, UDPTracker) else HTTP_SCRAPE_BATCH
+        )
+        batches = [
+            info_hashes[start : start + batch]
+            for start in range(0, len(info_hashes), batch)
+        ]
+
+        results = {}
+        for batch_results in await asyncio.gather(
+            *(self.scrape_batch(url, tracker, hashes) for hashes in batches)
+        ):
+            results.update(batch_results)
+        return results
+
+    async def scrape_batch(self, url, tracker, info_hashes):
+        if isinstance(tracker, UDPTracker):
+            body = await self.limit(tracker.request(SCRAPE, b"".join(info_hashes)))
+            results = {}
+            for info_hash, (complete, downloaded, incomplete) in zip(
+                info_hashes, struct.iter_unpack(">III", body)
+            ):
+                results[info_hash] = {
+                    "complete": complete,
+                    "downloaded": downloaded,
+                    "incomplete": incomplete,
+                }
+            return results
+
+        scrape_url = get_scrape_url(url)
+        if scrape_url is None:
+            raise TrackerError("{} does not support scrape".format(url))
+        query = [("info_hash", info_hash) for info_hash in info_hashes]
+        response = self.decode(
+            await self.limit(tracker.get(add_query(scrape_url, query)))
+        )
+        return {
+            bytes(info_hash): {
+                "complete": stats.get(b"complete", 0),
+                "downloaded": stats.get(b"downloaded", 0),
+                "incomplete": stats.get(b"incomplete", 0),
+            }
+            for info_hash, stats in response.get(b"files", {}).items()
+        }
+
+    async def announce_torrent(self, metainfo, info_hash, **kwargs):
+        """
+        Announce a torrent to the first of its trackers that answers, tier
+        by tier (BEP 12). See announce for the arguments and the result.
+        """
+        error = TrackerError("no tracker")
+        for tier in get_trackers(metainfo):
+            for url in tier:
+                try:
+                    return await self.announce(url, info_hash, **kwargs)
+                except (
+                    OSError,
+                    KeyError,
+                    ValueError,
+                    struct.error,
+                    TrackerError,
+                    asyncio.TimeoutError,
+                ) as exc:
+                    # a short or incomplete answer fails this tracker only
+                    error = exc
+        raise error
+
+    async def announce_many(self, torrents, **kwargs):
+        """
+        Announce (metainfo, info_hash) pairs concurrently
+
+        Return the results in order, with the exception raised for the
+        torrents no tracker answered for.
+        """
+        return await asyncio.gather(
+            *(
+                self.announce_torrent(metainfo, info_hash, **kwargs)
+                for metainfo, info_hash in torrents
+            ),
+            return_exceptions=True
+        )
+
+    @staticmethod
+    def decode(response):
+        try:
+            response = decode_bytes(response)
+        except SyntaxError:
+            raise TrackerError("malformed response")
+        if not isinstance(response, dict):
+            raise TrackerError("malformed response")
+        if b"failure reason" in response:
+            raise TrackerError(
+                bytes(response[b"failure reason"]).decode("utf-8", "replace")
+            )
+        return response
+
+    def close(self):
+        """
+        Close the connections kept to the trackers
+        """
+        for tracker in self.trackers.values():
+            tracker.close()
+        self.trackers = {}
+
+
+def add_query(url, query):
+    """Append query parameters (a dict or a list of pairs) to url.
+
+    >>> add_query("http://tracker/announce?key=1", {"left": 0})
+    'http://tracker/announce?key=1&left=0'
+    """
+    separator = "&" if urllib.parse.urlsplit(url).query else "?"
+    return url + separator + urllib.parse.urlencode(query)
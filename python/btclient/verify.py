@@ -0,0 +1,229 @@
+"""Verify downloaded data against the pieces table of a torrent.
+
+Pieces are read into a buffer reused by each thread and hashed on a
+thread pool: hashlib releases the GIL while it hashes a buffer, so the
+threads hash in parallel.
+
+$> python -m python.btclient.verify file.torrent download_dir [workers]
+"""
+
+import concurrent.futures
+import contextlib
+import hashlib
+import os
+import sys
+import threading
+import time
+
+from python.btclient.btorrent import decode_bytes
+
+# Size of a SHA-1 digest of the pieces table
+DIGEST_SIZE = 20
+
+# Number of consecutive pieces verified by a task of the thread pool
+PIECES_PER_TASK = 16
+
+
+def get_files(info, root):
+    """Return the (path, length) of the files of a torrent, in piece order.
+
+    info is the info dict of the torrent, decoded by decode_bytes. Raise
+    ValueError if a path would lead out of root.
+    """
+    name = get_path_part(info[b"name"])
+    if b"files" not in info:
+        return [(os.path.join(root, name), info[b"length"])]
+
+    files = []
+    for entry in info[b"files"]:
+        parts = [get_path_part(part) for part in entry[b"path"]]
+        files.append((os.path.join(root, name, *parts), entry[b"length"]))
+    return files
+
+
+def get_path_part(part):
+    """Return a name of a torrent path, refusing "..", separators and drives.
+
+    >>> get_path_part(b"..")
+    Traceback (most recent call last):
+    ...
+    ValueError: unsafe path part '..'
+    """
+    part = os.fsdecode(bytes(part))
+    separators = [sep for sep in ("/", os.sep, os.altsep) if sep]
+    if (
+        part in ("", ".", "..")
+        or any(sep in part for sep in separators)
+        or os.path.splitdrive(part)[0]
+    ):
+        raise ValueError("unsafe path part {!r}".format(part))
+    return part
+
+
+def map_pieces(files, piece_length):
+    """Split files into pieces, across the file boundaries.
+
+    Return a list holding, for every piece, the (path, offset, length) of
+    the parts of the files it covers.
+
+    >>> map_pieces([("a", 5), ("b", 2)], 3)
+    [[('a', 0, 3)], [('a', 3, 2), ('b', 0, 1)], [('b', 1, 1)]]
+    """
+    pieces = []
+    room = 0
+    for path, length in files:
+        offset = 0
+        while offset < length:
+            if not room:
+                pieces.append([])
+                room = piece_length
+            count = min(room, length - offset)
+            pieces[-1].append((path, offset, count))
+            offset += count
+            room -= count
+    return pieces
+
+
+class VerifyReport(object):
+
+    """
+    Results of a verification: results[i] is True if piece i matches its
+    hash.
+    """
+
+    def __init__(self, results, nbytes, seconds):
+        self.results = results
+        self.nbytes = nbytes
+        self.seconds = seconds
+
+    def is_complete(self):
+        return all(self.results)
+
+    @property
+    def failed(self):
+        """Indexes of the pieces that are missing or do not match their hash"""
+        return [index for index, ok in enumerate(self.results) if not ok]
+
+    @property
+    def throughput(self):
+        """Bytes verified per second, in MB/s"""
+        return self.nbytes / self.seconds / 1e6 if self.seconds else 0.0
+
+
+class PieceVerifier(object):
+
+    """
+    Check the files of a torrent against its pieces table
+    """
+
+    def __init__(self, info, root, workers=None):
+        """
+        info : dict
+            Info dict of the torrent, decoded by decode_bytes
+        root : str
+            Directory holding the downloaded files
+        workers : int
+            Number of hashing threads, see ThreadPoolExecutor
+        """
+        self.piece_length = info[b"piece length"]
+        self.hashes = info[b"pieces"]
+        self.files = get_files(info, root)
+        self.pieces = map_pieces(self.files, self.piece_length)
+        self.workers = workers
+        self.local = threading.local()
+
+        if len(self.hashes) != DIGEST_SIZE * len(self.pieces):
+            raise ValueError(
+                "{} pieces in the files, {} hashes".format(
+                    len(self.pieces), len(self.hashes) // DIGEST_SIZE
+                )
+            )
+
+    def verify(self):
+        """
+        Verify all the pieces, return a VerifyReport
+        """
+        ranges = [
+            (start, min(start + PIECES_PER_TASK, len(self.pieces)))
+            for start in range(0, len(self.pieces), PIECES_PER_TASK)
+        ]
+
+        start_time = time.perf_counter()
+        results = []
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            for range_results in executor.map(self.verify_range, *zip(*ranges)):
+                results.extend(range_results)
+        seconds = time.perf_counter() - start_time
+
+        nbytes = sum(length for _, length in self.files)
+        return VerifyReport(results, nbytes, seconds)
+
+    def verify_range(self, start, stop):
+        """
+        Verify the pieces from start to stop, return their results
+        """
+        with contextlib.ExitStack() as stack:
+            fileobjs = {}
+
+            def open_file(path):
+                if path not in fileobjs:
+                    try:
+                        fileobjs[path] = stack.enter_context(open(path, "rb"))
+                    except OSError:
+                        fileobjs[path] = None
+                return fileobjs[path]
+
+            return [self.verify_piece(index, open_file) for index in range(start, stop)]
+
+    def verify_piece(self, index, open_file):
+        """
+        Read piece index into the buffer of the thread and check its hash
+        """
+        buffer = self.get_buffer()
+        size = 0
+        for path, offset, length in self.pieces[index]:
+            fileobj = open_file(path)
+            if fileobj is None:
+                return False
+            fileobj.seek(offset)
+            if fileobj.readinto(buffer[size : size + length]) != length:
+                return False
+            size += length
+
+        digest = hashlib.sha1(buffer[:size]).digest()
+        return digest == self.hashes[DIGEST_SIZE * index : DIGEST_SIZE * (index + 1)]
+
+    def get_buffer(self):
+        """
+        Return the piece buffer of the calling thread, allocated once
+        """
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            buffer = self.local.buffer = memoryview(bytearray(self.piece_length))
+        return buffer
+
+
+def verify_torrent(torrent_path, root, workers=None):
+    """
+    Verify the files of a .torrent file, downloaded in root
+    """
+    with open(torrent_path, "rb") as fileobj:
+        metainfo = decode_bytes(fileobj.read())
+    return PieceVerifier(metainfo[b"info"], root, workers).verify()
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    report = verify_torrent(sys.argv[1], sys.argv[2], workers)
+    print(
+        "{}/{} pieces ok, {:.1f} MB in {:.2f}s: {:.1f} MB/s".format(
+            len(report.results) - len(report.failed),
+            len(report.results),
+            report.nbytes / 1e6,
+            report.seconds,
+            report.throughput,
+        )
+    )
+    if report.failed:
+        print("failed pieces:", *report.failed)
+        sys.exit(1)
@@ -0,0 +1,79 @@
+"""Benchmarks for the shuffles.
+
+Run from the repository root:
+
+$> python -m python.fisher_yates.benchmark [name ...]
+"""
+
+import random
+import sys
+import timeit
+
+import numpy as np
+
+from python.fisher_yates.shuffle import (
+    fisher_yates_shuffle,
+    numpy_shuffle,
+    partial_shuffle,
+)
+
+
+def randint_shuffle(items):
+    """The previous fisher_yates_shuffle: a copy and random.randint."""
+    items = items.copy()
+    nb_items = len(items)
+    for i in range(nb_items):
+        random_index = random.randint(i, nb_items - 1)
+        items[i], items[random_index] = items[random_index], items[i]
+    return items
+
+
+def run(name, func, count):
+    """Time a single call of func and report it per element."""
+    seconds = timeit.timeit(func, number=1)
+    print(
+        "  {:<24} {:>10.1f} ns/item {:>10.3f} s".format(
+            name, seconds / count * 1e9, seconds
+        )
+    )
+
+
+def bench_list(sizes=(10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7)):
+    """Compare random.randint with getrandbits, with and without copy."""
+    for size in sizes:
+        print("list: {} items".format(size))
+        items = list(range(size))
+        run("randint", lambda: randint_shuffle(items), size)
+        run("getrandbits", lambda: fisher_yates_shuffle(items), size)
+        run("getrandbits, in place", lambda: fisher_yates_shuffle(items, True), size)
+        run("random.shuffle", lambda: random.shuffle(items), size)
+
+
+def bench_numpy(sizes=(10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8)):
+    """Compare the permutation index with the in place shuffle of arrays."""
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        print("numpy: {} items".format(size))
+        items = np.arange(size)
+        run("permutation", lambda: numpy_shuffle(items, rng=rng), size)
+        run("in place", lambda: numpy_shuffle(items, True, rng), size)
+
+
+def bench_sample(sizes=(10 ** 3, 10 ** 5, 10 ** 8), k=1000):
+    """Compare partial_shuffle with random.sample and a full shuffle."""
+    for size in sizes:
+        print("sample: {} of {} items".format(k, size))
+        items = range(size)
+        run("partial_shuffle", lambda: partial_shuffle(items, k), k)
+        run("random.sample", lambda: random.sample(items, k), k)
+        if size <= 10 ** 5:
+            items = list(items)
+            run("full shuffle", lambda: fisher_yates_shuffle(items)[:k], k)
+
+
+BENCHMARKS = {"list": bench_list, "numpy": bench_numpy, "sample": bench_sample}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
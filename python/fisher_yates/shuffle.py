@@ -1,18 +1,85 @@
+import itertools
 import random
-from typing import List, TypeVar
+from typing import Dict, Iterator, List, Optional, Sequence, TypeVar
+
+import numpy as np
 
 T = TypeVar("T")
 
 
-def fisher_yates_shuffle(items: List[T]) -> List[T]:
+def fisher_yates_shuffle(items: List[T], in_place: bool = False) -> List[T]:
     """Return a shuffled list of elements.
 
+    With in_place, items itself is shuffled and returned instead of a
+    copy. NumPy arrays are shuffled by numpy_shuffle.
+
+    The random indexes are drawn with random.getrandbits and rejection,
+    as random.randint does, without its argument checks.
+
     Source:
     https://spin.atomicobject.com/2014/08/11/fisher-yates-shuffle-randomization-algorithm/
     """
-    items = items.copy()
-    nb_items = len(items)
-    for i in range(nb_items):
-        random_index = random.randint(i, nb_items - 1)
+    if isinstance(items, np.ndarray):
+        return numpy_shuffle(items, in_place)
+    if not in_place:
+        items = items.copy()
+    getrandbits = random.getrandbits
+    for i in range(len(items) - 1, 0, -1):
+        # random index in [0, i]
+        nb_bits = i.bit_length()
+        random_index = getrandbits(nb_bits)
+        while random_index > i:
+            random_index = getrandbits(nb_bits)
         items[i], items[random_index] = items[random_index], items[i]
     return items
+
+
+def numpy_shuffle(
+    items: np.ndarray,
+    in_place: bool = False,
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """Return a shuffled array, along its first axis.
+
+    The copy is indexed by a permutation generated in one call; in place,
+    the array is shuffled by the generator, without a copy.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if in_place:
+        rng.shuffle(items)
+        return items
+    return items[rng.permutation(len(items))]
+
+
+def partial_shuffle(items: Sequence[T], k: int) -> List[T]:
+    """Return k elements of items, drawn at random.
+
+    Only the first k steps of the shuffle are done, by lazy_shuffle, so
+    the cost is O(k) whatever the length of items.
+    """
+    if not 0 <= k <= len(items):
+        raise ValueError("k must be between 0 and {}".format(len(items)))
+    return list(itertools.islice(lazy_shuffle(items), k))
+
+
+def lazy_shuffle(items: Sequence[T]) -> Iterator[T]:
+    """Yield the elements of items in a random order, as they are drawn.
+
+    items is not modified nor copied: the positions swapped by the
+    shuffle are kept in a dict, which grows by at most one entry per
+    element drawn.
+    """
+    # position -> index in items of the element now at this position
+    swaps = {}  # type: Dict[int, int]
+    getrandbits = random.getrandbits
+    for i in range(len(items) - 1, 0, -1):
+        nb_bits = i.bit_length()
+        random_index = getrandbits(nb_bits)
+        while random_index > i:
+            random_index = getrandbits(nb_bits)
+        yield items[swaps.get(random_index, random_index)]
+        # the element at i replaces the one drawn, i is no longer used
+        swaps[random_index] = swaps.pop(i, i)
+    if items:
+        yield items[swaps.get(0, 0)]
@@ -1,12 +1,27 @@
 #!/bin/env python3
 
+import hashlib
+import io
 import itertools
+import mmap
+import socket
+import tempfile
 import unittest
 
 import hypothesis
 import hypothesis.strategies as st
 
-from python.btclient.btorrent import tokenize
+from python.btclient.btorrent import (
+    BencodeParser,
+    decode,
+    decode_bytes,
+    decode_stream,
+    decode_with_spans,
+    encode,
+    encode_to,
+    info_hash,
+    tokenize,
+)
 
 
 def bencode_integer(integer):
@@ -18,7 +33,7 @@ def bencode_bytes(text):
 
 
 def bencode_list(items):
-    f"l{''.join(items)}e"
+    return f"l{''.join(items)}e"
 
 
 @st.composite
@@ -43,6 +58,48 @@ def composite_list(draw):
     return d
 
 
+# Strings made of code points below 256 have one byte per character in
+# latin-1, so their bencoded lengths are valid for both decoders.
+latin1_text = st.text(alphabet=st.characters(max_codepoint=255), max_size=10)
+
+
+def bencode_dict(items):
+    return "d" + "".join(bencode_bytes(key) + value for key, value in items) + "e"
+
+
+def bencode_text(draw):
+    return draw(
+        st.recursive(
+            st.builds(bencode_integer, st.integers())
+            | st.builds(bencode_bytes, latin1_text),
+            lambda children: st.builds(
+                lambda items: "l" + "".join(items) + "e", st.lists(children, max_size=5)
+            )
+            | st.builds(
+                bencode_dict,
+                st.dictionaries(latin1_text, children, max_size=5).map(
+                    lambda d: sorted(d.items())
+                ),
+            ),
+            max_leaves=20,
+        )
+    )
+
+
+def to_bytes(data, encoding="latin-1"):
+    """Convert the output of decode to the output of decode_bytes."""
+    if isinstance(data, str):
+        return data.encode(encoding)
+    if isinstance(data, list):
+        return [to_bytes(item, encoding) for item in data]
+    if isinstance(data, dict):
+        return {
+            to_bytes(key, encoding): to_bytes(value, encoding)
+            for key, value in data.items()
+        }
+    return data
+
+
 class TestBTorrentTokenizer(unittest.TestCase):
     """Test suite for the BTorrent stream tokenizer.
 
@@ -101,3 +158,279 @@ class TestBTorrentTokenizer(unittest.TestCase):
         )
 
         self.assertEqual(list(tokenize(f"l{x}e")), ["l", *expected_content([x]), "e"])
+
+
+class TestBTorrentDecodeBytes(unittest.TestCase):
+    """Test suite for the bytes decoder, against the text decoder."""
+
+    @hypothesis.given(st.data())
+    def test_decode_bytes_like_decode(self, data):
+        text = bencode_text(data.draw)
+        self.assertEqual(decode_bytes(text.encode("latin-1")), to_bytes(decode(text)))
+
+    def test_decode_bytes_buffers(self):
+        text = b"d4:spaml1:ai42eee"
+        expected = {b"spam": [b"a", 42]}
+        self.assertEqual(decode_bytes(bytearray(text)), expected)
+        self.assertEqual(decode_bytes(memoryview(text)), expected)
+
+    def test_decode_bytes_binary(self):
+        self.assertEqual(decode_bytes(b"3:\x00:e"), b"\x00:e")
+
+    def test_decode_bytes_errors(self):
+        malformed = [b"", b"i42", b"ie", b"5:spam", b"l4:spam", b"x", b"d1:ae"]
+        malformed.append(b"dlei0ee")
+        for text in malformed:
+            with self.subTest(text=text), self.assertRaises(SyntaxError):
+                decode_bytes(text)
+
+        with self.assertRaisesRegex(SyntaxError, "trailing junk"):
+            decode_bytes(b"i42ei43e")
+
+    def test_decode_bytes_non_canonical_integers(self):
+        malformed = [b"i1_000e", b"i 7 e", b"i+5e", b"i-0e", b"i03e", b"i-e", b"ie"]
+        malformed += [b"i-01e", b"i--1e", b"i-00e", b"-4:spam"]
+        malformed += [b"1_0:abcdefghij", b"+4:spam", b" 4:spam", b"04:spam"]
+        malformed += [b"i\xd9\xa3e"]  # an Arabic-Indic digit
+        for text in malformed:
+            with self.subTest(text=text), self.assertRaises(SyntaxError):
+                decode_bytes(text)
+            with self.subTest(text=text), self.assertRaises(SyntaxError):
+                BencodeParser().feed(text)
+        self.assertEqual(decode_bytes(b"li0ei-10ei10e0:e"), [0, -10, 10, b""])
+
+    def test_decode_bytes_views(self):
+        text = bytearray(b"d4:spaml1:a6:piecese6:pieces8:abcdefghe")
+        data = decode_bytes(text, view_threshold=6)
+
+        self.assertEqual(data[b"spam"][0], b"a")
+        for view in (data[b"spam"][1], data[b"pieces"]):
+            self.assertIsInstance(view, memoryview)
+        self.assertEqual(bytes(data[b"pieces"]), b"abcdefgh")
+        self.assertEqual(list(data), [b"spam", b"pieces"])
+        self.assertEqual(data, decode_bytes(text))
+
+        # the views share the memory of the buffer
+        text[-2:-1] = b"H"
+        self.assertEqual(bytes(data[b"pieces"]), b"abcdefgH")
+
+    def test_decode_bytes_views_no_copy(self):
+        """bytearray and memoryview inputs are not copied."""
+        text = b"d4:spaml1:ai42ee6:pieces8:abcdefghe"
+        for make in (bytearray, lambda text: memoryview(bytearray(b"xx" + text))[2:]):
+            buffer = make(text)
+            with self.subTest(type=type(buffer).__name__):
+                data = decode_bytes(buffer, view_threshold=8)
+                self.assertEqual(data, {b"spam": [b"a", 42], b"pieces": b"abcdefgh"})
+                self.assertIsInstance(data[b"spam"][0], bytes)
+
+                # the view is a slice of the input, not of a copy of it
+                buffer[-2:-1] = b"H"
+                self.assertEqual(bytes(data[b"pieces"]), b"abcdefgH")
+                data, spans = decode_with_spans(buffer, view_threshold=8)
+                buffer[-3:-2] = b"G"
+                self.assertEqual(bytes(data[b"pieces"]), b"abcdefGH")
+
+        # wider items are read as their bytes
+        words = memoryview(bytearray(b"l4:spami-1ee")).cast("I")
+        self.assertEqual(decode_bytes(words), [b"spam", -1])
+
+    def test_decode_bytes_mmap(self):
+        with tempfile.TemporaryFile() as fileobj:
+            fileobj.write(b"d6:pieces8:abcdefghe")
+            fileobj.flush()
+            with mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                data = decode_bytes(buffer, view_threshold=1)
+                self.assertEqual(data[b"pieces"].tobytes(), b"abcdefgh")
+                data[b"pieces"].release()
+
+
+class TestBTorrentEncode(unittest.TestCase):
+    """Test suite for the encoder, round-tripping through the decoders."""
+
+    @hypothesis.given(st.data())
+    def test_encode_decode(self, data):
+        """decode then encode gives back the canonical input."""
+        text = bencode_text(data.draw)
+        self.assertEqual(encode(to_bytes(decode(text))), text.encode("latin-1"))
+
+    @hypothesis.given(composite_list())
+    def test_encode_str(self, text):
+        """str values are encoded as utf-8."""
+        data = decode(text)
+        self.assertEqual(decode_bytes(encode(data)), to_bytes(data, "utf-8"))
+
+    def test_encode_sorted_keys(self):
+        data = {b"b": 1, "a": 2, b"\xff": 3, "c": {b"z": b"", b"y": []}}
+        self.assertEqual(encode(data), b"d1:ai2e1:bi1e1:cd1:yle1:z0:e1:\xffi3ee")
+
+    def test_encode_buffers(self):
+        data = [bytearray(b"ab"), memoryview(b"xabcx")[1:-1], ("t",)]
+        self.assertEqual(encode(data), b"l2:ab3:abcl1:tee")
+
+    def test_encode_to(self):
+        fileobj = io.BytesIO()
+        encode_to(fileobj, {"pieces": b"x" * 40})
+        self.assertEqual(decode_bytes(fileobj.getvalue()), {b"pieces": b"x" * 40})
+
+    def test_encode_errors(self):
+        for data in (1.5, None, {1: 2}, [{"a": object()}]):
+            with self.subTest(data=data), self.assertRaises(TypeError):
+                encode(data)
+
+        with self.assertRaises(ValueError):
+            encode({"a": 1, b"a": 2})
+
+
+class TestBencodeParser(unittest.TestCase):
+    """Test suite for the push parser, against decode_bytes."""
+
+    @hypothesis.given(st.data())
+    def test_feed_split(self, data):
+        text = bencode_text(data.draw).encode("latin-1")
+        cut = data.draw(st.integers(min_value=0, max_value=len(text)))
+
+        parser = BencodeParser()
+        objects = parser.feed(text[:cut]) + parser.feed(text[cut:])
+        self.assertEqual(objects, [decode_bytes(text)])
+        self.assertTrue(parser.is_idle())
+
+    def test_feed_bytes(self):
+        text = b"d6:pieces20:" + bytes(range(20)) + b"5:counti-12ee3:eggli1ee"
+        parser = BencodeParser()
+        objects = []
+        for i in range(len(text)):
+            objects.extend(parser.feed(text[i : i + 1]))
+        self.assertTrue(parser.is_idle())
+
+        expected = [{b"pieces": bytes(range(20)), b"count": -12}, b"egg", [1]]
+        self.assertEqual(objects, expected)
+
+    def test_feed_errors(self):
+        for chunks in ([b"e"], [b"i1", b"xe"], [b"d1:a", b"e"], [b"1" * 300]):
+            with self.subTest(chunks=chunks), self.assertRaises(SyntaxError):
+                parser = BencodeParser()
+                for chunk in chunks:
+                    parser.feed(chunk)
+
+    def test_decode_stream(self):
+        fileobj = io.BytesIO(b"l4:spami42ee" * 1000)
+        objects = list(decode_stream(fileobj, chunk_size=7))
+        self.assertEqual(objects, [[b"spam", 42]] * 1000)
+
+        with self.assertRaisesRegex(SyntaxError, "truncated"):
+            list(decode_stream(io.BytesIO(b"l4:spami42"), chunk_size=7))
+
+    def test_decode_stream_socket(self):
+        """Objects are yielded without waiting for a full chunk."""
+        for make_file in (lambda sock: sock.makefile("rb"), lambda sock: sock):
+            left, right = socket.socketpair()
+            with left, right:
+                right.settimeout(5)
+                objects = decode_stream(make_file(right), max_size=100)
+                left.sendall(b"l4:spam")
+                left.sendall(b"i42ee")
+                self.assertEqual(next(objects), [b"spam", 42])
+                left.sendall(b"200:")
+                with self.assertRaisesRegex(SyntaxError, "larger than"):
+                    next(objects)
+
+
+class TestInfoHash(unittest.TestCase):
+    """Test suite for the info hash, computed from the raw info span."""
+
+    torrent = {
+        "announce": "http://tracker.example.com/announce",
+        "info": {"name": "spam", "piece length": 2 ** 18, "pieces": b"x" * 2000},
+    }
+
+    def test_decode_with_spans(self):
+        text = encode(self.torrent)
+        data, spans = decode_with_spans(text)
+        self.assertEqual(data, decode_bytes(text))
+        for key, (start, end) in spans.items():
+            self.assertEqual(decode_bytes(text[start:end]), data[key])
+
+    def test_info_hash(self):
+        text = encode(self.torrent)
+        info = encode(self.torrent["info"])
+        self.assertEqual(info_hash(text), hashlib.sha1(info).digest())
+        self.assertEqual(info_hash(text, "sha256"), hashlib.sha256(info).digest())
+
+    def test_info_hash_raw_bytes(self):
+        """A non canonical info dict is hashed as it is, not re-encoded."""
+        info = b"d6:pieces20:" + b"x" * 20 + b"4:name4:spame"
+        text = b"d4:info" + info + b"e"
+        self.assertNotEqual(encode(decode_bytes(info)), info)
+        self.assertEqual(info_hash(text), hashlib.sha1(info).digest())
+
+    def test_info_hash_mmap(self):
+        with tempfile.TemporaryFile() as fileobj:
+            fileobj.write(encode(self.torrent))
+            fileobj.flush()
+            with mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                digest = info_hash(buffer)
+        self.assertEqual(digest, info_hash(encode(self.torrent)))
+
+    def test_info_hash_errors(self):
+        with self.assertRaises(ValueError):
+            info_hash(b"d4:name4:spame")
+        for text in (b"l4:infoe", b"d4:infodeei1e", b"d4:infode"):
+            with self.subTest(text=text), self.assertRaises(SyntaxError):
+                info_hash(text)
+
+
+class TestDecodeLimits(unittest.TestCase):
+    """Test suite for the depth and size limits of the decoders."""
+
+    depth = 100000
+
+    def test_deep_nesting(self):
+        text = "l" * self.depth + "e" * self.depth
+        for decoder, data in ((decode, text), (decode_bytes, text.encode())):
+            with self.subTest(decoder=decoder.__name__):
+                nested = decoder(data, max_depth=self.depth)
+                for _ in range(self.depth - 1):
+                    (nested,) = nested
+                self.assertEqual(nested, [])
+
+                with self.assertRaisesRegex(SyntaxError, "nested deeper"):
+                    decoder(data)
+
+    def test_max_size(self):
+        for decoder, data in ((decode, "4:spam"), (decode_bytes, b"4:spam")):
+            with self.subTest(decoder=decoder.__name__):
+                self.assertEqual(len(decoder(data, max_size=6)), 4)
+                with self.assertRaisesRegex(SyntaxError, "larger than"):
+                    decoder(data, max_size=5)
+
+        with self.assertRaisesRegex(SyntaxError, "larger than"):
+            decode_with_spans(b"d4:spam4:eggse", max_size=10)
+
+    def test_parser_limits(self):
+        parser = BencodeParser(max_depth=2)
+        self.assertEqual(parser.feed(b"llee"), [[[]]])
+        with self.assertRaisesRegex(SyntaxError, "nested deeper"):
+            parser.feed(b"llle")
+
+        # the string is refused before its buffer is allocated
+        parser = BencodeParser(max_size=100)
+        with self.assertRaisesRegex(SyntaxError, "larger than"):
+            parser.feed(b"99999999999999:")
+
+        # without a limit, only the bytes received are buffered
+        parser = BencodeParser()
+        self.assertEqual(parser.feed(b"99999999999999:"), [])
+        self.assertEqual(parser.feed(b"spam"), [])
+        self.assertEqual(len(parser.string), 4)
+        with self.assertRaisesRegex(SyntaxError, "nested deeper"):
+            list(decode_stream(io.BytesIO(b"llee"), max_depth=1))
+
+        # the limit applies to every top level object
+        parser = BencodeParser(max_size=10)
+        for _ in range(10):
+            self.assertEqual(parser.feed(b"l4:spam"), [])
+            self.assertEqual(parser.feed(b"e"), [[b"spam"]])
+        parser.feed(b"l4:spam")
+        with self.assertRaisesRegex(SyntaxError, "larger than"):
+            parser.feed(b"i10e")
@@ -0,0 +1,127 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from python.btclient.btorrent import encode
+from python.btclient.catalog import Catalog
+
+TRACKERS = [[b"http://a/announce", b"udp://b:80"], [b"udp://c:1"]]
+
+
+def write_torrent(path, name, files=None, length=10):
+    """Write a torrent of files as (path parts, length), return its info hash."""
+    info = {b"name": name, b"piece length": 2 ** 14, b"pieces": b"\0" * 20}
+    if files is None:
+        info[b"length"] = length
+    else:
+        info[b"files"] = [{b"length": size, b"path": parts} for parts, size in files]
+    with open(path, "wb") as fileobj:
+        fileobj.write(encode({b"announce-list": TRACKERS, b"info": info}))
+    return hashlib.sha1(encode(info)).digest()
+
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "torrents")
+        os.makedirs(os.path.join(self.root, "sub"))
+        self.catalog = Catalog(os.path.join(self.directory.name, "catalog.db"))
+
+        files = [([b"docs", b"readme.txt"], 5), ([b"spam.bin"], 100)]
+        self.hash_a = write_torrent(self.path("a.torrent"), b"a", files)
+        self.hash_b = write_torrent(self.path("sub", "b.torrent"), b"readme.txt")
+        with open(self.path("broken.torrent"), "wb") as fileobj:
+            fileobj.write(b"d4:info")
+        with open(self.path("notes.txt"), "wb") as fileobj:
+            fileobj.write(b"not a torrent")
+
+    def tearDown(self):
+        self.catalog.close()
+        self.directory.cleanup()
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def test_update(self):
+        counts = self.catalog.update(self.root, workers=2)
+        self.assertEqual(
+            counts, dict(added=3, updated=0, removed=0, unchanged=0, failed=1)
+        )
+        torrent = self.catalog.get(self.hash_a)
+        self.assertEqual(torrent["path"], self.path("a.torrent"))
+        self.assertEqual(torrent["name"], "a")
+        self.assertEqual(torrent["length"], 105)
+        self.assertEqual(torrent["files"], [("docs/readme.txt", 5), ("spam.bin", 100)])
+        self.assertEqual(
+            torrent["trackers"], [["http://a/announce", "udp://b:80"], ["udp://c:1"]]
+        )
+        self.assertIsNone(self.catalog.get(b"\0" * 20))
+        [(path, error)] = self.catalog.get_errors()
+        self.assertEqual(path, self.path("broken.torrent"))
+        self.assertIn("SyntaxError", error)
+
+    def test_malformed_torrents(self):
+        info = {b"name": b"x", b"piece length": 2 ** 14, b"pieces": b"", b"length": 1}
+        malformed = [
+            {b"info": {**info, b"name": -1}},
+            {b"info": {**info, b"name": 10 ** 12}},
+            {b"info": {**info, b"length": -5}},
+            {b"info": {**info, b"files": [{b"length": 1, b"path": b"ab"}]}},
+            {b"info": info, b"announce": 10 ** 12},
+            {b"info": info, b"announce-list": [[b"\xff"]]},
+            {b"info": [info]},
+        ]
+        for i, metainfo in enumerate(malformed):
+            with open(self.path("malformed{}.torrent".format(i)), "wb") as fileobj:
+                fileobj.write(encode(metainfo))
+
+        counts = self.catalog.update(self.root, workers=2)
+        self.assertEqual(counts["added"], 3 + len(malformed))
+        self.assertEqual(counts["failed"], 1 + len(malformed))
+        self.assertEqual(self.catalog.get(self.hash_a)["length"], 105)
+        self.assertEqual(self.catalog.get(self.hash_b)["name"], "readme.txt")
+
+    def test_find_file(self):
+        self.catalog.update(self.root, workers=1)
+        self.assertEqual(
+            self.catalog.find_file("readme.txt"),
+            [
+                (self.path("a.torrent"), "a", "docs/readme.txt", 5),
+                (self.path("sub", "b.torrent"), "readme.txt", "readme.txt", 10),
+            ],
+        )
+        self.assertEqual(
+            self.catalog.find_file("docs/readme.txt"),
+            [(self.path("a.torrent"), "a", "docs/readme.txt", 5)],
+        )
+        self.assertEqual(self.catalog.find_file("docs"), [])
+
+    def test_incremental_update(self):
+        self.catalog.update(self.root, workers=1)
+        counts = self.catalog.update(self.root, workers=1)
+        self.assertEqual(
+            counts, dict(added=0, updated=0, removed=0, unchanged=3, failed=0)
+        )
+
+        # a different size is enough to decode the file again
+        hash_b = write_torrent(self.path("sub", "b.torrent"), b"b", length=12345)
+        os.remove(self.path("a.torrent"))
+        write_torrent(self.path("c.torrent"), b"c")
+        counts = self.catalog.update(self.root, workers=1)
+        self.assertEqual(
+            counts, dict(added=1, updated=1, removed=1, unchanged=1, failed=0)
+        )
+        self.assertIsNone(self.catalog.get(self.hash_a))
+        self.assertIsNone(self.catalog.get(self.hash_b))
+        self.assertEqual(self.catalog.get(hash_b)["length"], 12345)
+        self.assertEqual(self.catalog.find_file("readme.txt"), [])
+
+    def test_update_other_root(self):
+        self.catalog.update(self.path("sub"), workers=1)
+        counts = self.catalog.update(self.root, workers=1)
+        # the files of sub are not decoded again
+        self.assertEqual(counts["added"], 2)
+        self.assertEqual(counts["unchanged"], 1)
+        counts = self.catalog.update(self.path("sub"), workers=1)
+        self.assertEqual(counts["removed"], 0)
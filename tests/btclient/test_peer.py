@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import unittest
+
+from python.btclient.btorrent import encode
+from python.btclient.peer import (
+    BLOCK_SIZE,
+    HAVE,
+    PIECE,
+    REQUEST,
+    FileStorage,
+    MemoryStorage,
+    PeerConnection,
+    PeerError,
+    Seeder,
+    download_torrent,
+)
+from tests.btclient.test_tracker import run
+
+PIECE_LENGTH = 2 * BLOCK_SIZE
+
+
+def make_torrent(data, files=None):
+    """Return the info dict and the info hash of a torrent of data."""
+    pieces = b"".join(
+        hashlib.sha1(data[i : i + PIECE_LENGTH]).digest()
+        for i in range(0, len(data), PIECE_LENGTH)
+    )
+    info = {b"name": b"spam", b"piece length": PIECE_LENGTH, b"pieces": pieces}
+    if files is None:
+        info[b"length"] = len(data)
+    else:
+        info[b"files"] = [
+            {b"length": length, b"path": [name]} for name, length in files
+        ]
+    return info, hashlib.sha1(encode(info)).digest()
+
+
+class ChokingSeeder(Seeder):
+
+    """
+    Seeder that never unchokes its peers
+    """
+
+    async def serve(self, reader, writer):
+        connection = PeerConnection(reader, writer)
+        try:
+            await connection.handshake(self.info_hash, self.peer_id, initiate=False)
+            while True:
+                await connection.receive()
+        except (OSError, PeerError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            connection.close()
+
+
+class MalformedSeeder(Seeder):
+
+    """
+    Seeder sending a malformed message after the handshake
+    """
+
+    def __init__(self, info, info_hash, message_id, payload):
+        super(MalformedSeeder, self).__init__(info, info_hash, MemoryStorage(0, b""))
+        self.message = (message_id, payload)
+
+    async def serve(self, reader, writer):
+        connection = PeerConnection(reader, writer)
+        try:
+            await connection.handshake(self.info_hash, self.peer_id, initiate=False)
+            connection.send(*self.message)
+            while True:
+                await connection.receive()
+        except (OSError, PeerError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            connection.close()
+
+
+async def seed_and_download(info, info_hash, seeders_data, choking=0, **kwargs):
+    """Start a seeder per data, plus choking ones, and download the torrent."""
+    seeders = [Seeder(info, info_hash, MemoryStorage(0, data)) for data in seeders_data]
+    seeders += [
+        ChokingSeeder(info, info_hash, MemoryStorage(0, b"")) for _ in range(choking)
+    ]
+    try:
+        peers = [await seeder.start() for seeder in seeders]
+        return await download_torrent(info, info_hash, peers, **kwargs)
+    finally:
+        for seeder in seeders:
+            seeder.close()
+
+
+class TestFileStorage(unittest.TestCase):
+    def test_read_write(self):
+        data = os.urandom(100)
+        files = [(b"a", 30), (b"b", 0), (b"c", 50), (b"d", 20)]
+        info, _ = make_torrent(data, files)
+        with tempfile.TemporaryDirectory() as root:
+            storage = FileStorage(info, root)
+            storage.write(0, data[:25])
+            storage.write(25, data[25:])
+            self.assertEqual(storage.read(0, 100), data)
+            self.assertEqual(storage.read(20, 70), data[20:90])
+            storage.close()
+
+            with open(os.path.join(root, "spam", "c"), "rb") as fileobj:
+                self.assertEqual(fileobj.read(), data[30:80])
+
+    def test_unsafe_paths(self):
+        for name, path in [
+            (b"spam", [b"..", b"evil"]),
+            (b"spam", [b"/tmp/evil"]),
+            (b"spam", [b"a/../../evil"]),
+            (b"spam", [b""]),
+            (b"..", [b"evil"]),
+        ]:
+            info = {b"name": name, b"piece length": PIECE_LENGTH, b"pieces": b""}
+            info[b"files"] = [{b"length": 10, b"path": path}]
+            with tempfile.TemporaryDirectory() as parent:
+                root = os.path.join(parent, "root")
+                with self.subTest(name=name, path=path):
+                    with self.assertRaisesRegex(ValueError, "unsafe path"):
+                        FileStorage(info, root)
+                    self.assertEqual(os.listdir(parent), [])
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        # the last piece is shorter, and ends with a short block
+        self.data = os.urandom(10 * PIECE_LENGTH + BLOCK_SIZE + 100)
+        self.info, self.info_hash = make_torrent(self.data)
+
+    def test_download(self):
+        download, downloaders = run(
+            seed_and_download(self.info, self.info_hash, [self.data])
+        )
+        self.assertTrue(download.is_complete())
+        self.assertEqual(download.storage.data, self.data)
+        self.assertEqual(download.downloaded, len(self.data))
+        self.assertEqual(downloaders[0].downloaded, len(self.data))
+        self.assertGreater(download.throughput, 0)
+
+    def test_download_many_peers(self):
+        download, downloaders = run(
+            seed_and_download(self.info, self.info_hash, [self.data] * 3, pipeline=4)
+        )
+        self.assertTrue(download.is_complete())
+        self.assertEqual(download.storage.data, self.data)
+        self.assertEqual(
+            sum(downloader.downloaded for downloader in downloaders), len(self.data)
+        )
+
+    def test_corrupted_peer(self):
+        corrupted = bytes(len(self.data))
+        download, _ = run(
+            seed_and_download(self.info, self.info_hash, [corrupted, self.data])
+        )
+        self.assertTrue(download.is_complete())
+        self.assertEqual(download.storage.data, self.data)
+        self.assertGreater(download.failed, 0)
+
+    def test_choking_peer(self):
+        """A peer that never unchokes does not hold up a complete download."""
+        download, downloaders = run(
+            asyncio.wait_for(
+                seed_and_download(self.info, self.info_hash, [self.data], choking=1),
+                10,
+            )
+        )
+        self.assertTrue(download.is_complete())
+        self.assertEqual(downloaders[1].downloaded, 0)
+
+    def test_malformed_messages(self):
+        """A peer sending messages of the wrong size is dropped."""
+
+        async def download_from(message_id, payload):
+            seeder = MalformedSeeder(self.info, self.info_hash, message_id, payload)
+            try:
+                peer = await seeder.start()
+                return await download_torrent(self.info, self.info_hash, [peer])
+            finally:
+                seeder.close()
+
+        for message_id, payload in [
+            (HAVE, b"\0"),
+            (HAVE, b"\0" * 8),
+            (PIECE, b"\0" * 7),
+        ]:
+            with self.subTest(message_id=message_id, payload=payload):
+                download, _ = run(download_from(message_id, payload))
+                self.assertFalse(download.is_complete())
+                self.assertEqual(download.downloaded, 0)
+
+    def test_malformed_request(self):
+        """The seeder drops a peer sending a request of the wrong size."""
+        seeder = Seeder(self.info, self.info_hash, MemoryStorage(0, self.data))
+
+        async def request():
+            accepted = asyncio.get_event_loop().create_future()
+
+            def accept(reader, writer):
+                accepted.set_result((reader, writer))
+
+            server = await asyncio.start_server(accept, "127.0.0.1", 0)
+            host, port = server.sockets[0].getsockname()[:2]
+            connection = PeerConnection(*await asyncio.open_connection(host, port))
+            try:
+                serve = asyncio.ensure_future(seeder.serve(*await accepted))
+                await connection.handshake(self.info_hash, b"\0" * 20)
+                connection.send(REQUEST, b"\0" * 8)
+                await asyncio.wait_for(serve, 5)
+            finally:
+                connection.close()
+                server.close()
+
+        run(request())
+        self.assertEqual(seeder.uploaded, 0)
+
+    def test_wrong_info_hash(self):
+        async def download():
+            seeder = Seeder(self.info, self.info_hash, MemoryStorage(0, self.data))
+            try:
+                peer = await seeder.start()
+                return await download_torrent(self.info, b"\0" * 20, [peer])
+            finally:
+                seeder.close()
+
+        download, _ = run(download())
+        self.assertFalse(download.is_complete())
+        self.assertEqual(download.downloaded, 0)
+
+    def test_download_files(self):
+        files = [(b"a", 1000), (b"b", PIECE_LENGTH * 3), (b"c", 12345)]
+        data = os.urandom(sum(length for _, length in files))
+        info, info_hash = make_torrent(data, files)
+
+        with tempfile.TemporaryDirectory() as root:
+            storage = FileStorage(info, root)
+            download, _ = run(
+                seed_and_download(info, info_hash, [data], storage=storage)
+            )
+            storage.close()
+            self.assertTrue(download.is_complete())
+
+            offset = 0
+            for name, length in files:
+                with open(os.path.join(root, "spam", name.decode()), "rb") as fileobj:
+                    self.assertEqual(fileobj.read(), data[offset : offset + length])
+                offset += length
@@ -0,0 +1,321 @@
+import asyncio
+import struct
+import unittest
+import urllib.parse
+
+from python.btclient.btorrent import encode
+from python.btclient.tracker import (
+    ANNOUNCE,
+    CONNECT,
+    ERROR,
+    SCRAPE,
+    UDP_PROTOCOL_ID,
+    TrackerClient,
+    TrackerError,
+    get_scrape_url,
+    get_trackers,
+)
+
+INFO_HASH = bytes(range(20))
+UNKNOWN_HASH = b"\xff" * 20
+PEERS = [("127.0.0.1", 6881), ("10.0.0.2", 51413)]
+COMPACT_PEERS = b"\x7f\x00\x00\x01\x1a\xe1\x0a\x00\x00\x02\xc8\xd5"
+
+
+def run(coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            # let the stand-in servers see the connections closed
+            # asyncio.all_tasks and current_task are missing before Python 3.7
+            all_tasks = getattr(asyncio, "all_tasks", None) or asyncio.Task.all_tasks
+            current_task = (
+                getattr(asyncio, "current_task", None) or asyncio.Task.current_task
+            )
+            tasks = all_tasks() - {current_task()}
+            if tasks:
+                await asyncio.wait(tasks, timeout=1)
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+
+class StandInHTTPTracker(object):
+
+    """
+    Local HTTP tracker answering announces and scrapes for INFO_HASH
+    """
+
+    def __init__(self, peers=COMPACT_PEERS):
+        self.connections = 0
+        self.requests = []
+        self.server = None
+        self.peers = peers
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return "http://127.0.0.1:{}/announce".format(self.port)
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            await self.serve(reader, writer)
+        finally:
+            writer.close()
+
+    async def serve(self, reader, writer):
+        while True:
+            request = await reader.readline()
+            if not request:
+                break
+            while (await reader.readline()) != b"\r\n":
+                pass
+            target = urllib.parse.urlsplit(request.split()[1].decode())
+            query = urllib.parse.parse_qs(target.query, encoding="latin-1")
+            hashes = [value.encode("latin-1") for value in query.get("info_hash", [])]
+            self.requests.append((target.path, hashes))
+
+            if target.path == "/scrape":
+                stats = {b"complete": 3, b"downloaded": 7, b"incomplete": 1}
+                body = {"files": {h: stats for h in hashes if h == INFO_HASH}}
+            elif hashes != [INFO_HASH]:
+                body = {"failure reason": "unknown torrent"}
+            else:
+                body = {"interval": 1800, "complete": 3, "incomplete": 1}
+                body["peers"] = self.peers
+            body = encode(body)
+
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(body))
+            writer.write(body)
+
+    def close(self):
+        self.server.close()
+
+
+class StandInUDPTracker(asyncio.DatagramProtocol):
+
+    """
+    Local UDP tracker (BEP 15) answering for INFO_HASH, which ignores the
+    first drop packets it receives
+    """
+
+    connection_id = 0x1234567890
+
+    def __init__(self, drop=0, short=False):
+        self.drop = drop
+        self.short = short
+        self.requests = []
+
+    async def start(self):
+        loop = asyncio.get_event_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: self, local_addr=("127.0.0.1", 0)
+        )
+        port = self.transport.get_extra_info("sockname")[1]
+        return "udp://127.0.0.1:{}/announce".format(port)
+
+    def datagram_received(self, data, addr):
+        connection_id, action, transaction_id = struct.unpack_from(">QII", data)
+        self.requests.append(action)
+        if self.drop:
+            self.drop -= 1
+            return
+
+        header = struct.pack(">II", action, transaction_id)
+        if action == CONNECT and connection_id == UDP_PROTOCOL_ID:
+            reply = header + struct.pack(">Q", self.connection_id)
+        elif connection_id != self.connection_id:
+            reply = struct.pack(">II", ERROR, transaction_id) + b"bad connection id"
+        elif action == ANNOUNCE and data[16:36] == INFO_HASH:
+            reply = header + struct.pack(">III", 1800, 1, 3) + COMPACT_PEERS
+            if self.short:
+                reply = reply[:12]
+        elif action == SCRAPE:
+            hashes = [data[i : i + 20] for i in range(16, len(data), 20)]
+            reply = header + b"".join(
+                struct.pack(">III", *((3, 7, 1) if h == INFO_HASH else (0, 0, 0)))
+                for h in hashes
+            )
+        else:
+            reply = struct.pack(">II", ERROR, transaction_id) + b"unknown torrent"
+        self.transport.sendto(reply, addr)
+
+    def close(self):
+        self.transport.close()
+
+
+class TestTrackerUrls(unittest.TestCase):
+    def test_get_trackers(self):
+        metainfo = {
+            b"announce": b"http://a/announce",
+            b"announce-list": [
+                [b"http://b/announce", b"udp://c:80"],
+                [],
+                [b"udp://d:1"],
+            ],
+        }
+        self.assertEqual(
+            get_trackers(metainfo), [["http://b/announce", "udp://c:80"], ["udp://d:1"]]
+        )
+        self.assertEqual(get_trackers({}), [])
+
+    def test_get_scrape_url(self):
+        self.assertEqual(
+            get_scrape_url("http://a/x/announce.php"), "http://a/x/scrape.php"
+        )
+        self.assertIsNone(get_scrape_url("http://a/x/a"))
+
+
+class TestHTTPTracker(unittest.TestCase):
+    def test_announce(self):
+        async def announce():
+            tracker = StandInHTTPTracker()
+            url = await tracker.start()
+            client = TrackerClient()
+            try:
+                results = [
+                    await client.announce(url, INFO_HASH, left=10, event="started")
+                    for _ in range(5)
+                ]
+                with self.assertRaisesRegex(TrackerError, "unknown torrent"):
+                    await client.announce(url, UNKNOWN_HASH)
+            finally:
+                client.close()
+                tracker.close()
+            return results, tracker
+
+        results, tracker = run(announce())
+        for result in results:
+            self.assertEqual(result["interval"], 1800)
+            self.assertEqual(result["peers"], PEERS)
+            self.assertEqual((result["complete"], result["incomplete"]), (3, 1))
+        # the connection is reused by every request
+        self.assertEqual(tracker.connections, 1)
+
+    def test_scrape_batches(self):
+        async def scrape():
+            tracker = StandInHTTPTracker()
+            url = await tracker.start()
+            client = TrackerClient(max_concurrency=2)
+            try:
+                hashes = [INFO_HASH] + [bytes([i]) * 20 for i in range(100, 200)]
+                return await client.scrape(url, hashes), tracker
+            finally:
+                client.close()
+                tracker.close()
+
+        results, tracker = run(scrape())
+        self.assertEqual(
+            results, {INFO_HASH: {"complete": 3, "downloaded": 7, "incomplete": 1}}
+        )
+        # 101 hashes in batches of 50, on at most 2 connections
+        self.assertEqual([len(hashes) for _, hashes in tracker.requests], [50, 50, 1])
+        self.assertLessEqual(tracker.connections, 2)
+
+    def test_announce_many(self):
+        async def announce_many():
+            tracker = StandInHTTPTracker()
+            url = await tracker.start()
+            client = TrackerClient(max_concurrency=4)
+            metainfo = {b"announce-list": [[b"udp://127.0.0.1:1"], [url.encode()]]}
+            # the UDP tracker does not answer, the HTTP one of the second
+            # tier does
+            client.timeout = 0.05
+            client.retries = 0
+            try:
+                torrents = [(metainfo, INFO_HASH)] * 20 + [(metainfo, UNKNOWN_HASH)]
+                return await client.announce_many(torrents), tracker
+            finally:
+                client.close()
+                tracker.close()
+
+        results, tracker = run(announce_many())
+        for result in results[:-1]:
+            self.assertEqual(result["peers"], PEERS)
+        self.assertIsInstance(results[-1], TrackerError)
+        self.assertLessEqual(tracker.connections, 4)
+
+
+class TestAnnounceTorrent(unittest.TestCase):
+    def test_broken_trackers(self):
+        """Trackers whose answers cannot be read are skipped."""
+
+        async def announce_torrent():
+            trackers = [
+                StandInUDPTracker(short=True),
+                StandInHTTPTracker(peers=[{b"port": 6881}]),
+                StandInHTTPTracker(),
+            ]
+            urls = [(await tracker.start()).encode() for tracker in trackers]
+            metainfo = {b"announce-list": [urls[:2], urls[2:]]}
+            client = TrackerClient()
+            try:
+                return await client.announce_torrent(metainfo, INFO_HASH), trackers
+            finally:
+                client.close()
+                for tracker in trackers:
+                    tracker.close()
+
+        result, trackers = run(announce_torrent())
+        self.assertEqual(result["peers"], PEERS)
+        self.assertEqual([len(tracker.requests) for tracker in trackers], [2, 1, 1])
+
+
+class TestUDPTracker(unittest.TestCase):
+    def run_client(self, tracker, coroutine_function, **kwargs):
+        async def run_tracker():
+            url = await tracker.start()
+            client = TrackerClient(**kwargs)
+            try:
+                return await coroutine_function(client, url)
+            finally:
+                client.close()
+                tracker.close()
+
+        return run(run_tracker())
+
+    def test_announce(self):
+        async def announce(client, url):
+            results = [await client.announce(url, INFO_HASH) for _ in range(3)]
+            with self.assertRaisesRegex(TrackerError, "unknown torrent"):
+                await client.announce(url, UNKNOWN_HASH)
+            return results
+
+        tracker = StandInUDPTracker()
+        for result in self.run_client(tracker, announce):
+            self.assertEqual(result["peers"], PEERS)
+            self.assertEqual((result["complete"], result["incomplete"]), (3, 1))
+        # one connect for all the announces
+        self.assertEqual(tracker.requests, [CONNECT] + [ANNOUNCE] * 4)
+
+    def test_retransmit(self):
+        async def announce(client, url):
+            return await client.announce(url, INFO_HASH)
+
+        tracker = StandInUDPTracker(drop=2)
+        result = self.run_client(tracker, announce, timeout=0.01, retries=2)
+        self.assertEqual(result["interval"], 1800)
+        self.assertEqual(tracker.requests, [CONNECT] * 3 + [ANNOUNCE])
+
+        tracker = StandInUDPTracker(drop=3)
+        with self.assertRaisesRegex(TrackerError, "no answer"):
+            self.run_client(tracker, announce, timeout=0.01, retries=2)
+
+    def test_scrape_batches(self):
+        async def scrape(client, url):
+            hashes = [bytes([i]) * 20 for i in range(100, 200)] + [INFO_HASH]
+            return await client.scrape(url, hashes)
+
+        tracker = StandInUDPTracker()
+        results = self.run_client(tracker, scrape)
+        self.assertEqual(len(results), 101)
+        self.assertEqual(
+            results[INFO_HASH], {"complete": 3, "downloaded": 7, "incomplete": 1}
+        )
+        # 101 hashes in batches of 74
+        self.assertEqual(tracker.requests, [CONNECT, SCRAPE, SCRAPE])
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from python.btclient.btorrent import decode_bytes, encode
+from python.btclient.verify import (
+    PieceVerifier,
+    get_files,
+    map_pieces,
+    verify_torrent,
+)
+
+
+def make_info(root, name, contents, piece_length):
+    """Write the files of a multi-file torrent and return its info dict."""
+    files = []
+    for parts, data in contents:
+        path = os.path.join(root, name, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fileobj:
+            fileobj.write(data)
+        files.append({b"length": len(data), b"path": [part.encode() for part in parts]})
+
+    payload = b"".join(data for _, data in contents)
+    pieces = b"".join(
+        hashlib.sha1(payload[i : i + piece_length]).digest()
+        for i in range(0, len(payload), piece_length)
+    )
+    return {
+        b"name": name.encode(),
+        b"piece length": piece_length,
+        b"pieces": pieces,
+        b"files": files,
+    }
+
+
+class TestMapPieces(unittest.TestCase):
+    def test_map_pieces(self):
+        files = [("a", 7), ("b", 0), ("c", 1), ("d", 8)]
+        pieces = map_pieces(files, 4)
+
+        self.assertEqual(len(pieces), 4)
+        self.assertEqual(pieces[1], [("a", 4, 3), ("c", 0, 1)])
+        self.assertEqual(pieces[3], [("d", 4, 4)])
+        for piece in pieces:
+            self.assertEqual(sum(length for _, _, length in piece), 4)
+
+    def test_map_pieces_empty(self):
+        self.assertEqual(map_pieces([("a", 0)], 4), [])
+
+    def test_get_files(self):
+        info = {b"name": b"spam", b"length": 3}
+        self.assertEqual(get_files(info, "root"), [(os.path.join("root", "spam"), 3)])
+
+    def test_get_files_unsafe_paths(self):
+        for name, path in [
+            (b"spam", [b"..", b"evil"]),
+            (b"spam", [b"/tmp/evil"]),
+            (b"spam", [b"a/../../evil"]),
+            (b"spam", [b"."]),
+            (b"spam", [b""]),
+            (b"..", [b"evil"]),
+            (b"/tmp", [b"evil"]),
+        ]:
+            info = {b"name": name, b"files": [{b"length": 1, b"path": path}]}
+            with self.subTest(name=name, path=path):
+                with self.assertRaisesRegex(ValueError, "unsafe path"):
+                    get_files(info, "root")
+        with self.assertRaisesRegex(ValueError, "unsafe path"):
+            get_files({b"name": b"..", b"length": 1}, "root")
+
+
+class TestPieceVerifier(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+        # file sizes that are not multiples of the piece length, so that
+        # pieces span file boundaries
+        contents = [
+            (["a.bin"], os.urandom(1000)),
+            (["sub", "b.bin"], os.urandom(10)),
+            (["sub", "c.bin"], b""),
+            (["d.bin"], os.urandom(5000)),
+        ]
+        self.info = make_info(self.root, "spam", contents, piece_length=256)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_verify(self):
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                report = PieceVerifier(self.info, self.root, workers).verify()
+                self.assertEqual(len(report.results), 24)
+                self.assertTrue(report.is_complete())
+                self.assertEqual(report.nbytes, 6010)
+                self.assertGreater(report.throughput, 0)
+
+    def test_verify_corrupted(self):
+        # byte 1005 is in piece 3, which starts in a.bin and ends in d.bin
+        with open(os.path.join(self.root, "spam", "d.bin"), "r+b") as fileobj:
+            fileobj.seek(5)
+            data = fileobj.read(1)
+            fileobj.seek(5)
+            fileobj.write(bytes([data[0] ^ 1]))
+
+        report = PieceVerifier(self.info, self.root).verify()
+        self.assertEqual(report.failed, [3])
+
+    def test_verify_missing(self):
+        os.remove(os.path.join(self.root, "spam", "sub", "b.bin"))
+        report = PieceVerifier(self.info, self.root).verify()
+        self.assertEqual(report.failed, [3])
+
+        os.truncate(os.path.join(self.root, "spam", "d.bin"), 4000)
+        report = PieceVerifier(self.info, self.root).verify()
+        self.assertEqual(report.failed, [3, 19, 20, 21, 22, 23])
+
+    def test_verify_torrent(self):
+        torrent_path = os.path.join(self.root, "spam.torrent")
+        with open(torrent_path, "wb") as fileobj:
+            fileobj.write(encode({"info": self.info}))
+
+        self.assertTrue(verify_torrent(torrent_path, self.root).is_complete())
+
+    def test_pieces_mismatch(self):
+        self.info[b"pieces"] = self.info[b"pieces"][:-20]
+        with self.assertRaises(ValueError):
+            PieceVerifier(self.info, self.root)
+
+    def test_pieces_view(self):
+        """The pieces table can be a memoryview, see decode_bytes."""
+        info = decode_bytes(encode(self.info), view_threshold=1)
+        self.assertIsInstance(info[b"pieces"], memoryview)
+        self.assertTrue(PieceVerifier(info, self.root).verify().is_complete())
@@ -1,7 +1,22 @@
+import multiprocessing
+import os
+import sys
+import tempfile
 import unittest
 from random import shuffle
 
-from python.bloomfilter.bloom import BloomFilter
+from python.bloomfilter.bitarray import BitArray
+from python.bloomfilter.bloom import (
+    BLOCK_BITS,
+    BLOCKED,
+    DOUBLE_HASHING,
+    SCHEMES,
+    BloomFilter,
+    build_parallel,
+)
+from python.bloomfilter.counting import COUNTER_MAX, CountingBloomFilter
+from python.bloomfilter.scalable import ScalableBloomFilter
+from python.bloomfilter.shared import SharedBloomFilter
 
 
 class TestBloomFilter(unittest.TestCase):
@@ -67,3 +82,437 @@ class TestBloomFilter(unittest.TestCase):
         for word in test_words:
             if word in word_absent:
                 self.assertFalse(bloomf.check(word), msg=word)
+
+    def test_add_many(self):
+        words = ["word-{}".format(i) for i in range(500)] + ["", "bloom", b"bytes"]
+        one_by_one = BloomFilter(len(words), 0.01)
+        for word in words:
+            one_by_one.add(word)
+
+        batched = BloomFilter(len(words), 0.01)
+        batched.add_many(iter(words))
+
+        self.assertEqual(one_by_one.bit_array.bytes, batched.bit_array.bytes)
+
+    def test_check_many(self):
+        bloomf = BloomFilter(500, 0.01)
+        bloomf.add_many("word-{}".format(i) for i in range(500))
+
+        words = ["word-{}".format(i) for i in range(1000)]
+        found = bloomf.check_many(words)
+        self.assertEqual(found.dtype, bool)
+        self.assertTrue(found[:500].all())
+        self.assertEqual(found.tolist(), [bloomf.check(word) for word in words])
+
+    def test_double_hashing(self):
+        words = ["word-{}".format(i) for i in range(500)]
+        bloomf = BloomFilter(len(words), 0.01, scheme=DOUBLE_HASHING)
+        for word in words:
+            bloomf.add(word)
+
+        self.assertTrue(all(bloomf.check(word) for word in words))
+
+        batched = BloomFilter(len(words), 0.01, scheme=DOUBLE_HASHING)
+        batched.add_many(words)
+        self.assertEqual(bloomf.bit_array.bytes, batched.bit_array.bytes)
+
+    def test_false_positive_rate(self):
+        """The measured false positive rate stays close to fp_prob."""
+        n = 2000
+        for scheme in SCHEMES:
+            for p in (0.05, 0.01):
+                bloomf = BloomFilter(n, p, scheme=scheme)
+                bloomf.add_many("present-{}".format(i) for i in range(n))
+
+                absent = ["absent-{}".format(i) for i in range(20000)]
+                rate = bloomf.check_many(absent).mean()
+                self.assertLess(rate, p * 1.5, msg=(scheme, p))
+
+    def test_blocked(self):
+        """All the bits of an item are in the same block."""
+        words = ["word-{}".format(i) for i in range(2000)]
+        bloomf = BloomFilter(len(words), 0.001, scheme=BLOCKED)
+        self.assertEqual(bloomf.size % BLOCK_BITS, 0)
+
+        for word in words[:100]:
+            blocks = {digest // BLOCK_BITS for digest in bloomf.iter_digests(word)}
+            self.assertEqual(len(blocks), 1)
+
+        bloomf.add_many(words)
+        self.assertTrue(bloomf.check_many(words).all())
+
+        one_by_one = BloomFilter(len(words), 0.001, scheme=BLOCKED)
+        for word in words:
+            one_by_one.add(word)
+        self.assertEqual(one_by_one.bit_array.bytes, bloomf.bit_array.bytes)
+
+        # the uneven load of the blocks costs about 1.5x at 0.1%
+        absent = ["absent-{}".format(i) for i in range(100000)]
+        self.assertLess(bloomf.check_many(absent).mean(), 0.001 * 2)
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            BloomFilter(10, 0.01, scheme="nope")
+
+    def test_estimates(self):
+        n = 5000
+        bloomf = BloomFilter(n, 0.01)
+        self.assertEqual(bloomf.approx_len(), 0)
+
+        bloomf.add_many("word-{}".format(i) for i in range(n // 2))
+        self.assertAlmostEqual(bloomf.approx_len(), n // 2, delta=n * 0.02)
+        self.assertLess(bloomf.current_fp_rate(), 0.01)
+
+        bloomf.add_many("word-{}".format(i) for i in range(n // 2, n))
+        self.assertAlmostEqual(bloomf.fill_ratio(), 0.5, delta=0.05)
+        self.assertAlmostEqual(bloomf.approx_len(), n, delta=n * 0.02)
+        self.assertAlmostEqual(bloomf.current_fp_rate(), 0.01, delta=0.002)
+
+        # saturated: the real false positive rate blows past fp_prob
+        bloomf.add_many("more-{}".format(i) for i in range(3 * n))
+        self.assertGreater(bloomf.current_fp_rate(), 0.3)
+
+    def test_stats(self):
+        bloomf = BloomFilter(100, 0.01)
+        bloomf.add("spam")
+        self.assertIsNone(bloomf.stats)
+
+        bloomf.enable_stats()
+        bloomf.add("eggs")
+        bloomf.add_many(["ham", "bacon"])
+        bloomf.check("spam")
+        bloomf.check("absent")
+        bloomf.check_many(["eggs", "ham", "absent"])
+
+        self.assertEqual(bloomf.stats, {"add": 3, "check": 5, "hit": 3})
+        health = bloomf.get_health()
+        self.assertEqual(health["hit_rate"], 3 / 5)
+        self.assertEqual(health["fp_prob"], 0.01)
+
+    def test_memory_usage(self):
+        bloomf = BloomFilter(100000, 0.01)
+        # one bit per slot, plus the object overhead
+        self.assertLess(bloomf.memory_usage(), bloomf.size // 8 + 1024)
+
+
+class TestBloomFilterAlgebra(unittest.TestCase):
+    def setUp(self):
+        self.left_words = ["left-{}".format(i) for i in range(300)]
+        self.right_words = ["right-{}".format(i) for i in range(300)]
+        self.common_words = ["common-{}".format(i) for i in range(300)]
+
+        self.left = BloomFilter(1000, 0.01)
+        self.left.add_many(self.left_words + self.common_words)
+        self.right = BloomFilter(1000, 0.01)
+        self.right.add_many(self.right_words + self.common_words)
+
+    def test_union(self):
+        union = self.left | self.right
+        self.assertTrue(union.check_many(self.left_words + self.right_words).all())
+        union_bits = self.left.union(self.right).bit_array.bytes
+        self.assertEqual(union.bit_array.bytes, union_bits)
+
+        # the operands are left untouched
+        self.assertLess(self.left.check_many(self.right_words).mean(), 0.05)
+
+    def test_intersection(self):
+        intersection = self.left & self.right
+        self.assertTrue(intersection.check_many(self.common_words).all())
+        self.assertLess(intersection.check_many(self.left_words).mean(), 0.05)
+        self.assertLess(intersection.check_many(self.right_words).mean(), 0.05)
+
+    def test_in_place(self):
+        self.left |= self.right
+        self.assertTrue(self.left.check_many(self.right_words).all())
+
+    def test_incompatible(self):
+        for other in (
+            BloomFilter(2000, 0.01),
+            BloomFilter(1000, 0.01, scheme=DOUBLE_HASHING),
+        ):
+            with self.assertRaises(ValueError):
+                self.left | other
+
+    def test_build_parallel(self):
+        words = ["word-{}".format(i) for i in range(5000)]
+        built = build_parallel(iter(words), len(words), 0.01, workers=3, chunk_size=700)
+
+        expected = BloomFilter(len(words), 0.01)
+        expected.add_many(words)
+        self.assertEqual(built.bit_array.bytes, expected.bit_array.bytes)
+
+    def test_build_parallel_error(self):
+        # ints are not keys: every worker fails on its first chunk, while
+        # there are many more chunks than the queue holds
+        with self.assertRaises(TypeError):
+            build_parallel(range(100000), 100000, 0.01, workers=2, chunk_size=1000)
+
+
+class TestBloomFilterFile(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "filter.bloom")
+
+        self.words = ["word-{}".format(i) for i in range(500)]
+        self.bloomf = BloomFilter(len(self.words), 0.01, scheme=DOUBLE_HASHING)
+        self.bloomf.add_many(self.words)
+        self.bloomf.save(self.path)
+
+    def test_open(self):
+        with BloomFilter.open(self.path) as opened:
+            self.assertEqual(opened.size, self.bloomf.size)
+            self.assertEqual(opened.hash_count, self.bloomf.hash_count)
+            self.assertEqual(opened.fp_prob, self.bloomf.fp_prob)
+            self.assertEqual(opened.scheme, DOUBLE_HASHING)
+            self.assertTrue(all(opened.check(word) for word in self.words))
+            self.assertTrue(opened.check_many(self.words).all())
+
+    def test_read_only(self):
+        with BloomFilter.open(self.path) as opened:
+            with self.assertRaises(TypeError):
+                opened.add("absent")
+
+    def test_write_through(self):
+        with BloomFilter.open(self.path, "r+") as opened:
+            opened.add("added")
+        with BloomFilter.open(self.path, "c") as opened:
+            self.assertTrue(opened.check("added"))
+            opened.add("copy-on-write")
+        with BloomFilter.open(self.path) as opened:
+            self.assertFalse(opened.check("copy-on-write"))
+
+    def test_close_with_views(self):
+        opened = BloomFilter.open(self.path)
+        bits = opened.get_bit_view()
+        with self.assertRaisesRegex(BufferError, "get_bit_view"):
+            opened.close()
+        # the filter is still open, and closes once the view is gone
+        self.assertTrue(opened.check_many(self.words).all())
+        del bits
+        opened.close()
+        self.assertIsNone(opened.mmap)
+
+    def test_bad_file(self):
+        with open(self.path, "r+b") as f:
+            f.write(b"NOPE")
+        with self.assertRaises(ValueError):
+            BloomFilter.open(self.path)
+
+
+class TestScalableBloomFilter(unittest.TestCase):
+    def test_grows_without_false_positive_blow_up(self):
+        p = 0.01
+        bloomf = ScalableBloomFilter(1000, p)
+        present = ["present-{}".format(i) for i in range(20000)]
+        bloomf.add_many(present)
+
+        self.assertGreater(len(bloomf.filters), 1)
+        # items that were false positives when added are not counted
+        self.assertLessEqual(len(bloomf), len(present))
+        self.assertGreater(len(bloomf), len(present) * (1 - p))
+        self.assertLess(bloomf.get_fp_bound(), p)
+        self.assertTrue(bloomf.check_many(present).all())
+
+        absent = ["absent-{}".format(i) for i in range(20000)]
+        self.assertLess(bloomf.check_many(absent).mean(), p)
+
+    def test_add(self):
+        bloomf = ScalableBloomFilter(10, 0.01, scheme=DOUBLE_HASHING)
+        words = ["word-{}".format(i) for i in range(100)]
+        for word in words + words:
+            bloomf.add(word)
+
+        self.assertLessEqual(len(bloomf), len(words))
+        self.assertEqual(bloomf.capacities, [10, 20, 40, 80])
+        self.assertTrue(all(bloomf.check(word) for word in words))
+
+    def test_add_many_duplicates(self):
+        bloomf = ScalableBloomFilter(1000, 0.01)
+        words = ["word-{}".format(i) for i in range(100)]
+        bloomf.add_many(words * 3 + [word.encode() for word in words])
+
+        self.assertLessEqual(len(bloomf), len(words))
+        self.assertGreater(len(bloomf), len(words) * 0.95)
+        self.assertEqual(len(bloomf.filters), 1)
+        self.assertTrue(bloomf.check_many(words).all())
+
+    def test_add_many_like_add(self):
+        """add_many skips the items add would, false positives included."""
+        words = ["word-{}".format(i) for i in range(3000)]
+        for scheme in SCHEMES:
+            one_by_one = ScalableBloomFilter(100, 0.1, scheme=scheme)
+            batched = ScalableBloomFilter(100, 0.1, scheme=scheme)
+            for chunk in (words[:150], words[100:]):
+                for word in chunk:
+                    one_by_one.add(word)
+                batched.add_many(chunk)
+
+            with self.subTest(scheme=scheme):
+                # some words were false positives when added
+                self.assertLess(len(one_by_one), len(words))
+                self.assertEqual(len(batched), len(one_by_one))
+                self.assertEqual(batched.capacities, one_by_one.capacities)
+                for expected, bloomf in zip(one_by_one.filters, batched.filters):
+                    self.assertEqual(bloomf.bit_array.bytes, expected.bit_array.bytes)
+
+
+class TestCountingBloomFilter(unittest.TestCase):
+    def setUp(self):
+        self.words = ["word-{}".format(i) for i in range(500)]
+
+    def test_remove(self):
+        bloomf = CountingBloomFilter(len(self.words), 0.01)
+        for word in self.words:
+            bloomf.add(word)
+        for word in self.words[:250]:
+            bloomf.remove(word)
+
+        self.assertTrue(all(bloomf.check(word) for word in self.words[250:]))
+        removed = sum(bloomf.check(word) for word in self.words[:250])
+        self.assertLess(removed, 250 * 0.05)
+
+        with self.assertRaises(ValueError):
+            bloomf.remove("never added")
+
+    def test_remove_repeated_digests(self):
+        bloomf = CountingBloomFilter(10, 0.01)
+        word = next(
+            word
+            for word in self.words
+            if len(set(bloomf.iter_digests(word))) < bloomf.hash_count
+        )
+        bloomf.add(word)
+        bloomf.remove(word)
+        self.assertEqual(bloomf.counters, bytearray(len(bloomf.counters)))
+
+        # every slot of the word is set, but not as often as it hits them
+        for digest in bloomf.iter_digests(word):
+            bloomf.set_counter(digest, 1)
+        counters = bytes(bloomf.counters)
+        with self.assertRaisesRegex(ValueError, "item not in filter"):
+            bloomf.remove(word)
+        self.assertEqual(bloomf.counters, counters)
+
+    def test_count(self):
+        bloomf = CountingBloomFilter(len(self.words), 0.01)
+        for _ in range(3):
+            bloomf.add("thrice")
+        self.assertGreaterEqual(bloomf.count("thrice"), 3)
+        bloomf.remove("thrice")
+        self.assertGreaterEqual(bloomf.count("thrice"), 2)
+
+    def test_saturation(self):
+        bloomf = CountingBloomFilter(len(self.words), 0.01)
+        for _ in range(COUNTER_MAX + 5):
+            bloomf.add("often")
+        self.assertEqual(bloomf.count("often"), COUNTER_MAX)
+
+        # saturated counters are never decremented
+        for _ in range(COUNTER_MAX + 5):
+            bloomf.remove("often")
+        self.assertEqual(bloomf.count("often"), COUNTER_MAX)
+
+    def test_add_many(self):
+        one_by_one = CountingBloomFilter(len(self.words), 0.01)
+        for word in self.words + self.words[:10] * 20:
+            one_by_one.add(word)
+
+        batched = CountingBloomFilter(len(self.words), 0.01)
+        batched.add_many(self.words)
+        batched.add_many(self.words[:10] * 20)
+
+        self.assertEqual(one_by_one.counters, batched.counters)
+        self.assertTrue(batched.check_many(self.words).all())
+        self.assertEqual(batched.count(self.words[0]), COUNTER_MAX)
+
+    def test_memory_usage(self):
+        bloomf = CountingBloomFilter(100000, 0.01)
+        self.assertLess(bloomf.memory_usage(), bloomf.size // 2 + 1024)
+
+
+def add_shared_words(bloomf, start, stop):
+    """Add words start..stop, half one by one and half in a batch."""
+    for i in range(start, stop, 2):
+        bloomf.add("word-{}".format(i))
+    bloomf.add_many("word-{}".format(i) for i in range(start + 1, stop, 2))
+    bloomf.close()
+
+
+@unittest.skipIf(sys.version_info < (3, 8), "shared_memory needs Python 3.8")
+class TestSharedBloomFilter(unittest.TestCase):
+    def setUp(self):
+        self.bloomf = SharedBloomFilter(20000, 0.01)
+        self.addCleanup(self.bloomf.unlink)
+        self.addCleanup(self.bloomf.close)
+
+    def test_no_lost_inserts(self):
+        """Processes adding at the same time into the same bytes."""
+        workers = [
+            multiprocessing.Process(
+                target=add_shared_words, args=(self.bloomf, i * 2500, (i + 1) * 2500)
+            )
+            for i in range(8)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        words = ["word-{}".format(i) for i in range(20000)]
+        self.assertTrue(self.bloomf.check_many(words).all())
+
+    def test_attach(self):
+        self.bloomf.add("shared")
+
+        attached = SharedBloomFilter.attach(self.bloomf.name)
+        self.addCleanup(attached.close)
+        self.assertEqual(attached.size, self.bloomf.size)
+        self.assertTrue(attached.check("shared"))
+        self.assertFalse(attached.check("absent"))
+
+        # without the lock, the attached filter is read-only
+        with self.assertRaises(ValueError):
+            attached.add("absent")
+
+    def test_close_with_views(self):
+        bits = self.bloomf.get_bit_view()
+        with self.assertRaisesRegex(BufferError, "get_bit_view"):
+            self.bloomf.close()
+        self.bloomf.add("still open")
+        self.assertTrue(bits.any())
+        del bits
+
+
+class TestBitArray(unittest.TestCase):
+    def test_set_and_clear(self):
+        bits = BitArray(100)
+        self.assertEqual(len(bits), 100)
+        self.assertEqual(bits.nbytes, 16)
+
+        for i in (0, 7, 8, 63, 64, 99):
+            bits[i] = 1
+        self.assertEqual([i for i in range(100) if bits[i]], [0, 7, 8, 63, 64, 99])
+
+        bits[8] = 0
+        self.assertEqual(bits[8], 0)
+        self.assertEqual(bits[7], 1)
+
+    def test_count(self):
+        bits = BitArray(1000)
+        self.assertEqual(bits.count(), 0)
+        for i in range(0, 1000, 3):
+            bits[i] = 1
+        self.assertEqual(bits.count(), 334)
+
+    def test_count_past_size(self):
+        """Only the bits below size are counted, whatever the buffer holds."""
+        for size in (0, 8, 100, 1000):
+            with self.subTest(size=size):
+                buffer = bytearray(b"\xff" * (BitArray.get_nbytes(size) + 8))
+                self.assertEqual(BitArray(size, buffer).count(), size)
+
+    def test_buffer_too_small(self):
+        with self.assertRaises(ValueError):
+            BitArray(100, bytearray(8))
@@ -4,8 +4,14 @@ import unittest
 
 import hypothesis
 import hypothesis.strategies as st
+import numpy as np
 
-from python.fisher_yates.shuffle import fisher_yates_shuffle
+from python.fisher_yates.shuffle import (
+    fisher_yates_shuffle,
+    lazy_shuffle,
+    numpy_shuffle,
+    partial_shuffle,
+)
 
 
 class TestFisherYatesShuffle(unittest.TestCase):
@@ -31,3 +37,83 @@ class TestFisherYatesShuffle(unittest.TestCase):
         shuffled = fisher_yates_shuffle(integers)
         self.assertEqual(set(integers), set(shuffled))
         self.assertNotEqual(integers, shuffled)
+
+    @hypothesis.given(st.lists(st.integers(), unique=True))
+    def test_in_place(self, integers):
+        """Test that the list itself is shuffled, and returned."""
+        original = integers.copy()
+        shuffled = fisher_yates_shuffle(integers, in_place=True)
+        self.assertIs(shuffled, integers)
+        self.assertEqual(sorted(original), sorted(shuffled))
+
+    def test_uniform(self):
+        """Test that every position is as likely for every element."""
+        counts = np.zeros((4, 4))
+        for _ in range(12000):
+            counts[range(4), fisher_yates_shuffle([0, 1, 2, 3])] += 1
+        # 3000 expected per cell, with a standard deviation of about 47
+        self.assertLess(np.abs(counts - 3000).max(), 300)
+
+
+class TestPartialShuffle(unittest.TestCase):
+    @hypothesis.given(st.lists(st.integers(), unique=True), st.data())
+    def test_property_sample(self, integers, data):
+        """Test that k distinct elements are drawn, the list unchanged."""
+        k = data.draw(st.integers(0, len(integers)))
+        original = integers.copy()
+        sample = partial_shuffle(integers, k)
+        self.assertEqual(integers, original)
+        self.assertEqual(len(sample), k)
+        self.assertEqual(len(set(sample)), k)
+        self.assertTrue(set(sample) <= set(integers))
+
+    def test_bounds(self):
+        self.assertEqual(partial_shuffle([], 0), [])
+        with self.assertRaises(ValueError):
+            partial_shuffle([1, 2], 3)
+        with self.assertRaises(ValueError):
+            partial_shuffle([1, 2], -1)
+
+    def test_large(self):
+        """Test that a sample of a huge sequence does not walk it."""
+        sample = partial_shuffle(range(10 ** 12), 1000)
+        self.assertEqual(len(set(sample)), 1000)
+
+    def test_uniform(self):
+        """Test that every element is as likely to be drawn."""
+        counts = np.zeros(10)
+        for _ in range(10000):
+            counts[partial_shuffle(range(10), 2)] += 1
+        # 2000 expected per element, with a standard deviation of about 40
+        self.assertLess(np.abs(counts - 2000).max(), 250)
+
+
+class TestLazyShuffle(unittest.TestCase):
+    @hypothesis.given(st.lists(st.integers(), unique=True))
+    def test_property_permutation(self, integers):
+        shuffled = list(lazy_shuffle(integers))
+        self.assertEqual(sorted(shuffled), sorted(integers))
+
+    def test_uniform(self):
+        """Test that every position is as likely for every element."""
+        counts = np.zeros((4, 4))
+        for _ in range(12000):
+            counts[range(4), list(lazy_shuffle([0, 1, 2, 3]))] += 1
+        self.assertLess(np.abs(counts - 3000).max(), 300)
+
+
+class TestNumpyShuffle(unittest.TestCase):
+    def test_permutation(self):
+        items = np.arange(1000)
+        shuffled = numpy_shuffle(items, rng=np.random.default_rng(0))
+        self.assertTrue(np.array_equal(items, np.arange(1000)))
+        self.assertTrue(np.array_equal(np.sort(shuffled), items))
+        self.assertFalse(np.array_equal(shuffled, items))
+
+    def test_in_place(self):
+        items = np.arange(2000).reshape(1000, 2)
+        shuffled = fisher_yates_shuffle(items, in_place=True)
+        self.assertIs(shuffled, items)
+        # rows are moved as a whole
+        self.assertTrue(np.array_equal(items[:, 1] - items[:, 0], np.ones(1000)))
+        self.assertTrue(np.array_equal(np.sort(items[:, 0]), np.arange(0, 2000, 2)))
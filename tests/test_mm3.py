@@ -0,0 +1,211 @@
+import itertools
+import mmap
+import tempfile
+import unittest
+
+import numpy as np
+
+import python.bloomfilter.mm3 as mmh3
+
+# (key, seed, hash, hash128 x64, hash128 x86), as given by the original
+# byte by byte pure python implementation. Integer keys stand for
+# make_key(length).
+# fmt: off
+GOLDEN_VECTORS = [
+    (0, 0x0, 0, 0x00000000000000000000000000000000, 0x00000000000000000000000000000000),
+    (0, 0x9747B28C, -340344280, 0x93B0608FE302957A392B208A1DAABBB3, 0x5B576A1C5B576A1C5B576A1CF7BED5A1),
+    (1, 0x0, 1579843702, 0x4E711127C5B5A8E4726AC6DD306A3E59, 0x7643466F7643466F7643466F70D159B2),
+    (1, 0x9747B28C, 2005225334, 0xEE6AEF3E953ED8D490B4D63614FF67FA, 0x3FF3BE6C3FF3BE6C3FF3BE6CEFA1A1A0),
+    (2, 0x0, -192970333, 0x2CAB193A4622361C20397A993FF70362, 0x813DB2F7813DB2F7813DB2F77E056B48),
+    (2, 0x9747B28C, -670678020, 0x4B3C0312AA2AD79F8B7E1C857D15E771, 0xF7FB0D0DF7FB0D0DF7FB0D0DBDF6B407),
+    (3, 0x0, -966353646, 0xE5BB83E375FFB6886E3FEBCAF3B53DCE, 0x3C1E0D173C1E0D173C1E0D17AEAF995A),
+    (3, 0x9747B28C, -2046562240, 0xB11D496349C2AB5A94A124BC90750005, 0xE81D3BE2E81D3BE2E81D3BE298E419E4),
+    (4, 0x0, -1895787751, 0xADB20C1802C288850E29ED82DED0AA06, 0x2B5A744A2B5A744A2B5A744A96730A64),
+    (4, 0x9747B28C, -1225010838, 0xAA2690695FFD1BD78AD04F8B42E1191A, 0x0860A8310860A8310860A8316B7A69C4),
+    (5, 0x0, 296725826, 0x30A0320850949358A82AED5674C88370, 0x4533345145333451477DB736BFA641BC),
+    (5, 0x9747B28C, -1981000634, 0x096F9E50AC808A0BA8866A86A52D9E37, 0xD39D442FD39D442F5150BACFFCD32ADD),
+    (7, 0x0, 545649965, 0x2B3BA492E39CEF50BECBBF54236CE3A1, 0xC16D5231C16D523188A781BCDDDEBACD),
+    (7, 0x9747B28C, -1593020188, 0x96A7416FB4E922B3EC5BD9CA6D302E36, 0x765E6EEF765E6EEF08E32456E7BC1EAF),
+    (8, 0x0, -185817311, 0x259E7F3A617E003AA5EE2A9A9132D3BD, 0xE60B81FBE60B81FB9FC1AF5180255515),
+    (8, 0x9747B28C, -632231287, 0x27687ABD9B5FDC6D49DBC4CAB9026576, 0x4CE449954CE44995B19F31D2CA18F8CA),
+    (9, 0x0, -1656944588, 0x1F8153C3131E049651BA2EA10AFADBB6, 0x59A5A42E041325DCF463AF4E83F87D3F),
+    (9, 0x9747B28C, 1335263496, 0x74E65E6F85BFBF4D3B00453F3BB39E38, 0x2D0C808CA683D85B2B8274F4020039BE),
+    (12, 0x0, -1137509352, 0x7B0FD157AFB4F21592408898CF3EA070, 0x401901A8C634D647F7E2241A7505922E),
+    (12, 0x9747B28C, 1287733312, 0x5878B68B9929995E1DFAE5A2ED1C6B87, 0xDD82635D3D4BFE9C0078DD106D4093E7),
+    (13, 0x0, -2021623204, 0x0FD77B52596E08ECD067C85B9518A027, 0x76BCC80D23276D2C618D9B6736D8233E),
+    (13, 0x9747B28C, -1436366784, 0x0E71A174E6862B450B96C2B645783FAE, 0x67E4561B3376FC0043B32169B00BB36F),
+    (15, 0x0, 1561422171, 0xE00E5A8FF7E8F26DBA6A4B5E80ADE4F4, 0x4026183A79989E61D83994C9B186314C),
+    (15, 0x9747B28C, -1438651271, 0x7C8528A421BCD28FFA1201BD4F1FA2D6, 0x55033093EE1EF9278640FE5F77D6E646),
+    (16, 0x0, -2081035966, 0x7D670219D92AFE48C4B099C52F8F4EA1, 0x0A6DD5331F821FDCEE8386C066A18BF3),
+    (16, 0x9747B28C, 2077285424, 0x346EE713062EDDD326B0E162F546C35B, 0x3CF9CEEDFBA8D3CB68561103AEFFD1C3),
+    (17, 0x0, -87600918, 0x6602453B6681DBE9D4AE4B39FE53B127, 0x3523143A4686ACF0307455B228F01EC4),
+    (17, 0x9747B28C, -358362576, 0x1ADCE4FCA972CB77A4A18B877D0064C9, 0x5AB6B020CE606537FE6B8F263732FF79),
+    (31, 0x0, 1666870425, 0x7EA851BA737EBFD09D91FEDFF00436FB, 0xA51EC26A67786E43D715C49D8CFEFA9B),
+    (31, 0x9747B28C, -1914618953, 0xF747E28C962DB31109D29E0730D65224, 0xDE842071949B6BDC2AFFA4AF6F3BF395),
+    (32, 0x0, 1702566899, 0xBEC31B8AA5F3910A65BDB8DD080643FF, 0xA7A95A726EFDE9C9A6646299CCEEA8AC),
+    (32, 0x9747B28C, 1956573520, 0xE36489F081123B82FDA0A994A6F2D082, 0x8E702BAD44CDCD54F856CF2401EB9C0A),
+    (33, 0x0, -1816039446, 0x9171EE56072D60A6B16757D8C4F72F1A, 0x6C64D50E1D747B37B03A41996BE88EBD),
+    (33, 0x9747B28C, 1118175734, 0xB72AFEC1757D5FF197916C2176AB4C48, 0x7569A1C4543FFE66F0CCE2865EF84A3D),
+    (64, 0x0, -1643182151, 0xA5CF4256C64EC87CF50F13E7205DFCA3, 0x45B347030AA2B255D2DAD83CBAEFECEC),
+    (64, 0x9747B28C, 912201338, 0x564F13D087679EAD330D096336D4D940, 0x340C30C0580A75F92A1CBBD3175EC9D4),
+    ('hello', 0x0, 613153351, 0x5B1E906A48AE1D19CBD8A7B341BD9B02, 0x9ADB31B69ADB31B6DB91DEF72B2444A0),
+    ('hello', 0x9747B28C, 1568626408, 0x2A905546B3C1CB838C23D6856F071A2E, 0xD498B585D498B585322922B590935C71),
+    ('Hello, world!', 0x0, -1070186941, 0x2C326650A8F3C564F1512DD1D2D665DF, 0x0AFDD4C3402B4263F0638DFC26ACDBA7),
+    ('Hello, world!', 0x9747B28C, 612912314, 0xF85E7E7631D576BAEDC485D662A8392E, 0x53C8C636B7D48B7CBB872216756D5460),
+    ('ünïcode', 0x0, -1347515812, 0x49B34EDA0681F3B1DD59D9D958DAC980, 0xE94704DD2A3F7184A502D9B73BF68428),
+    ('ünïcode', 0x9747B28C, -98265726, 0x972507FF4106E5AB0CA4B3EABF645ABE, 0x0854AAFCFDBF29E34FF77402954CDB0F),
+]
+# fmt: on
+
+
+def make_key(length):
+    return bytes((i * 7 + 3) & 0xFF for i in range(length))
+
+
+def golden_vectors():
+    for key, seed, *expected in GOLDEN_VECTORS:
+        if isinstance(key, int):
+            key = make_key(key)
+        yield key, seed, expected
+
+
+class TestGoldenVectors(unittest.TestCase):
+    def test_py_hash(self):
+        for key, seed, (expected, _, _) in golden_vectors():
+            self.assertEqual(mmh3.py_hash(key, seed), expected, msg=key)
+
+    def test_py_hash128(self):
+        for key, seed, (_, x64, x86) in golden_vectors():
+            self.assertEqual(mmh3.py_hash128(key, seed), x64, msg=key)
+            self.assertEqual(mmh3.py_hash128(key, seed, False), x86, msg=key)
+
+    def test_hash(self):
+        """Same results whether or not the native module is installed."""
+        for key, seed, (expected, x64, x86) in golden_vectors():
+            self.assertEqual(mmh3.hash(key, seed), expected, msg=key)
+            self.assertEqual(mmh3.hash128(key, seed), x64, msg=key)
+            self.assertEqual(mmh3.hash128(key, seed, False), x86, msg=key)
+
+    def test_buffer_types(self):
+        key = make_key(33)
+        for buffer in (bytearray(key), memoryview(key)):
+            self.assertEqual(mmh3.hash(buffer), mmh3.hash(key))
+            self.assertEqual(mmh3.hash128(buffer), mmh3.hash128(key))
+
+    def test_hash64(self):
+        self.assertEqual(
+            mmh3.hash64("hello"), (-3758069500696749310, 6565844092913065241)
+        )
+        self.assertEqual(
+            mmh3.hash64("hello", 1, False), (1682575153221130884, 8939853177483738393)
+        )
+
+    def test_hash_bytes(self):
+        self.assertEqual(
+            mmh3.hash_bytes("hello"),
+            "\x02\x9b\xbdA\xb3\xa7\xd8\xcb\x19\x1d\xaeHj\x90\x1e[",
+        )
+
+
+class TestHashArray(unittest.TestCase):
+    def test_matches_scalar_hash(self):
+        rng = np.random.RandomState(0)
+        for width in range(0, 21):
+            keys = rng.randint(0, 256, size=(16, width)).astype(np.uint8)
+            for seed in (0, 1, 0xDEADBEEF):
+                expected = [mmh3.hash(bytes(key), seed) for key in keys]
+                self.assertEqual(mmh3.hash_array(keys, seed).tolist(), expected)
+
+    def test_fixed_width_dtypes(self):
+        ids = np.arange(100, dtype="<u8") * np.uint64(0x9E3779B97F4A7C15)
+        expected = [mmh3.hash(int(i).to_bytes(8, "little"), 7) for i in ids]
+        self.assertEqual(mmh3.hash_array(ids, 7).tolist(), expected)
+
+        names = np.array([b"spam", b"eggs", b"ham"], dtype="S4")
+        expected = [mmh3.hash(b"spam"), mmh3.hash(b"eggs"), mmh3.hash(b"ham\x00")]
+        self.assertEqual(mmh3.hash_array(names).tolist(), expected)
+
+    def test_rejects_3d_array(self):
+        with self.assertRaises(ValueError):
+            mmh3.hash_array(np.zeros((2, 2, 2), dtype=np.uint8))
+
+    def test_2d_wider_dtypes(self):
+        """Rows of any fixed-width dtype are hashed as their raw bytes."""
+        keys = np.arange(30, dtype="<u4").reshape(10, 3) * np.uint32(0x9E3779B9)
+        expected = [mmh3.hash(row.tobytes(), 3) for row in keys]
+        self.assertEqual(mmh3.hash_array(keys, 3).tolist(), expected)
+        # not contiguous
+        expected = [mmh3.hash(row.tobytes()) for row in keys[:, ::2]]
+        self.assertEqual(mmh3.hash_array(keys[:, ::2]).tolist(), expected)
+
+    def test_rejects_object_dtype(self):
+        with self.assertRaises(TypeError):
+            mmh3.hash_array(np.array([[b"a", b"b"]], dtype=object))
+
+
+class TestHash128Array(unittest.TestCase):
+    def test_matches_scalar_hash128(self):
+        rng = np.random.RandomState(0)
+        for width in range(0, 49):
+            keys = rng.randint(0, 256, size=(16, width)).astype(np.uint8)
+            for seed in (0, 0x9747B28C):
+                for x64arch in (True, False):
+                    hashes = mmh3.hash128_array(keys, seed, x64arch)
+                    self.assertEqual(hashes.shape, (16, 2))
+                    self.assertEqual(
+                        [int(low) | int(high) << 64 for low, high in hashes],
+                        [mmh3.hash128(bytes(key), seed, x64arch) for key in keys],
+                    )
+
+
+class TestStreamingHashers(unittest.TestCase):
+    def feed(self, hasher, data, chunk_sizes):
+        chunk_sizes = iter(chunk_sizes)
+        start = 0
+        while start < len(data):
+            size = next(chunk_sizes)
+            hasher.update(data[start : start + size])
+            start += size
+        return hasher
+
+    def test_chunked_updates(self):
+        data = make_key(1000)
+        for chunk_size in (1, 3, 4, 7, 16, 33, 1000):
+            sizes = itertools.cycle([chunk_size, 0, chunk_size + 1])
+            hasher = self.feed(mmh3.Murmur3_32(seed=42), data, sizes)
+            self.assertEqual(hasher.intdigest(), mmh3.hash(data, 42))
+
+            for x64arch in (True, False):
+                hasher = mmh3.Murmur3_128(seed=42, x64arch=x64arch)
+                self.feed(hasher, data, sizes)
+                self.assertEqual(hasher.intdigest(), mmh3.hash128(data, 42, x64arch))
+
+    def test_golden_vectors(self):
+        for key, seed, (expected, x64, x86) in golden_vectors():
+            self.assertEqual(mmh3.Murmur3_32(key, seed).intdigest(), expected)
+            self.assertEqual(mmh3.Murmur3_128(key, seed).intdigest(), x64)
+            self.assertEqual(mmh3.Murmur3_128(key, seed, False).intdigest(), x86)
+
+    def test_digest(self):
+        hasher = mmh3.Murmur3_128("hello")
+        self.assertEqual(hasher.digest().decode("latin-1"), mmh3.hash_bytes("hello"))
+        self.assertEqual(mmh3.Murmur3_32("hello").hexdigest(), "47fa8b24")
+
+    def test_copy(self):
+        hasher = mmh3.Murmur3_32(b"spam")
+        other = hasher.copy()
+        other.update(b"eggs")
+        self.assertEqual(hasher.intdigest(), mmh3.hash(b"spam"))
+        self.assertEqual(other.intdigest(), mmh3.hash(b"spameggs"))
+
+    def test_hash_file(self):
+        data = make_key(100000)
+        with tempfile.TemporaryFile() as fileobj:
+            fileobj.write(data)
+            fileobj.seek(0)
+            hasher = mmh3.hash_file(fileobj, mmh3.Murmur3_128(), chunk_size=1000)
+            self.assertEqual(hasher.intdigest(), mmh3.hash128(data))
+
+            with mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher = mmh3.Murmur3_32(mapped)
+                self.assertEqual(hasher.intdigest(), mmh3.hash(data))